@@ -0,0 +1,212 @@
+"""Central scheduler for the requests the verifier sends to agents
+
+Instead of every agent keeping its own chain of IOLoop timers, the periodic
+quote requests and the retries of all agents of a verifier worker are kept in
+a single heap ordered by due time. A single IOLoop timer fires for the
+earliest entry. Due entries are started while fewer than the configured
+maximum of requests are outstanding. Retries and periodic attestations wait
+in separate queues which are served alternately so that neither starves the
+other. The delays of periodic attestations are jittered so that agents
+activated together do not stay phase-aligned.
+"""
+
+import asyncio
+import heapq
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import tornado.ioloop
+
+from keylime import config, keylime_logging
+
+logger = keylime_logging.init_logging("verifier")
+
+# Default fraction by which the delay of periodic attestations is varied
+DEFAULT_JITTER = 0.1
+
+# Weight of the latest sample in the scheduling lag average
+LAG_SMOOTHING = 0.1
+
+
+class ScheduledCall:
+    """Handle for a call scheduled with the AgentScheduler"""
+
+    __slots__ = ("due", "seq", "func", "args", "kwargs", "retry", "cancelled")
+
+    def __init__(
+        self,
+        due: float,
+        seq: int,
+        func: Callable[..., Awaitable[Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        retry: bool,
+    ):
+        self.due = due
+        self.seq = seq
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.retry = retry
+        self.cancelled = False
+
+    def __lt__(self, other: "ScheduledCall") -> bool:
+        return (self.due, self.seq) < (other.due, other.seq)
+
+
+class AgentScheduler:
+    instance: Optional["AgentScheduler"] = None
+
+    @staticmethod
+    def get_instance() -> "AgentScheduler":
+        """Create and return a singleton AgentScheduler"""
+        if not AgentScheduler.instance:
+            max_outstanding = config.getint("verifier", "max_outstanding_quotes", fallback=0)
+            jitter = config.getfloat("verifier", "quote_interval_jitter", fallback=DEFAULT_JITTER)
+            AgentScheduler.instance = AgentScheduler(max_outstanding, jitter)
+        return AgentScheduler.instance
+
+    def __init__(self, max_outstanding: int = 0, jitter: float = DEFAULT_JITTER):
+        """constructor
+
+        :param max_outstanding: the maximum number of calls running at the same time; 0 for no limit
+        :param jitter: the fraction by which the delays of periodic calls are randomly varied
+        """
+        self.max_outstanding = max_outstanding
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.heap: List[ScheduledCall] = []
+        self.periodic: Deque[ScheduledCall] = deque()
+        self.retries: Deque[ScheduledCall] = deque()
+        self.prefer_retry = False
+        self.outstanding = 0
+        self.seq = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.timer: Optional[object] = None
+        self.timer_due: Optional[float] = None
+
+    def jittered(self, delay: float) -> float:
+        """Return the delay varied randomly by the configured jitter"""
+        if delay <= 0 or self.jitter == 0:
+            return delay
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def schedule(
+        self, delay: float, func: Callable[..., Awaitable[Any]], *args: Any, retry: bool = False, **kwargs: Any
+    ) -> ScheduledCall:
+        """Run the coroutine function func(*args, **kwargs) after the given delay
+
+        Retries are not jittered as their delay is chosen by the retry policy.
+        The returned handle can be passed to cancel().
+        """
+        if not retry:
+            delay = self.jittered(delay)
+
+        ioloop = tornado.ioloop.IOLoop.current()
+        self.seq += 1
+        call = ScheduledCall(ioloop.time() + max(delay, 0.0), self.seq, func, args, kwargs, retry)
+        heapq.heappush(self.heap, call)
+        self._arm_timer()
+        return call
+
+    def cancel(self, call: Optional[ScheduledCall]) -> None:
+        """Cancel a call if it has not been started yet"""
+        if call is not None:
+            call.cancelled = True
+
+    def _arm_timer(self) -> None:
+        while self.heap and self.heap[0].cancelled:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return
+
+        due = self.heap[0].due
+        if self.timer_due is not None and self.timer_due <= due:
+            return
+
+        ioloop = tornado.ioloop.IOLoop.current()
+        if self.timer is not None:
+            ioloop.remove_timeout(self.timer)
+        self.timer = ioloop.call_at(due, self._on_timer)
+        self.timer_due = due
+
+    def _on_timer(self) -> None:
+        self.timer = None
+        self.timer_due = None
+
+        now = tornado.ioloop.IOLoop.current().time()
+        while self.heap and self.heap[0].due <= now:
+            call = heapq.heappop(self.heap)
+            if not call.cancelled:
+                (self.retries if call.retry else self.periodic).append(call)
+
+        self._dispatch()
+        self._arm_timer()
+
+    def _next_ready(self) -> Optional[ScheduledCall]:
+        # Serve the two queues alternately when both have waiting calls
+        queues = (self.retries, self.periodic) if self.prefer_retry else (self.periodic, self.retries)
+        for queue in queues:
+            while queue:
+                call = queue.popleft()
+                if not call.cancelled:
+                    self.prefer_retry = queue is self.periodic
+                    return call
+        return None
+
+    def _dispatch(self) -> None:
+        while self.max_outstanding <= 0 or self.outstanding < self.max_outstanding:
+            call = self._next_ready()
+            if call is None:
+                return
+            self._start(call)
+
+    def _start(self, call: ScheduledCall) -> None:
+        lag = max(tornado.ioloop.IOLoop.current().time() - call.due, 0.0)
+        self.lag += LAG_SMOOTHING * (lag - self.lag)
+        self.max_lag = max(self.max_lag, lag)
+
+        self.outstanding += 1
+        future = asyncio.ensure_future(call.func(*call.args, **call.kwargs))
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: "asyncio.Future[Any]") -> None:
+        self.outstanding -= 1
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Scheduled agent request failed", exc_info=future.exception())
+        self._dispatch()
+
+    def queue_depth(self) -> int:
+        """Return the number of calls that are due but wait for a free slot"""
+        return len(self.periodic) + len(self.retries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the scheduler statistics
+
+        The lag is the time between the moment a call was due and the moment
+        it was started, averaged over recent calls, in seconds. The maximum
+        lag is reset by every call.
+        """
+        max_lag = self.max_lag
+        self.max_lag = 0.0
+        return {
+            "scheduled": len(self.heap),
+            "queue_depth": self.queue_depth(),
+            "outstanding": self.outstanding,
+            "lag": round(self.lag, 3),
+            "max_lag": round(max_lag, 3),
+        }
+
+    def log_stats(self) -> None:
+        """Log the scheduler statistics, as a warning if many calls wait for a free slot"""
+        stats = self.stats()
+        log = logger.warning if 0 < self.max_outstanding < stats["queue_depth"] else logger.debug
+        log(
+            "Agent scheduler: %d scheduled, %d waiting, %d outstanding, lag %.3fs (max %.3fs)",
+            stats["scheduled"],
+            stats["queue_depth"],
+            stats["outstanding"],
+            stats["lag"],
+            stats["max_lag"],
+        )
@@ -1,6 +1,6 @@
 import sys
 import threading
-from typing import Dict, Optional, Set, Tuple
+from typing import Any, Dict, Optional, Set, Tuple
 
 from keylime.common.algorithms import Hash
 from keylime.ima.file_signatures import ImaKeyrings
@@ -118,6 +118,20 @@ class AgentAttestState:
         # quote_progress later consists of tuple(pcr_match_line, log length)
         self.quote_progress = None
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # The keys in the keyrings cannot be pickled; the tenant keyring is not kept
+        state = self.__dict__.copy()
+        state["ima_keyrings"] = self.ima_keyrings.to_json()
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.ima_keyrings = ImaKeyrings.from_json(state["ima_keyrings"])
+
+    def update_from(self, other: "AgentAttestState") -> None:
+        """Take over the state of another AgentAttestState of the same agent"""
+        self.__dict__.update(other.__dict__)
+
     def get_agent_id(self) -> str:
         """Get the agent_id"""
         return self.agent_id
@@ -0,0 +1,186 @@
+"""Pool of processes verifying quotes off the verifier's event loop
+
+Checking a quote replays the IMA and measured boot logs and evaluates them
+against the policies, which is CPU bound and may take seconds for long logs.
+Run inline, it blocks the Tornado IOLoop and therefore the polling of every
+other agent and the REST API of the verifier worker. The AttestationPool runs
+cloud_verifier_common.process_quote_response() in a pool of processes
+instead, and hands the Failure, the updated agent and its AgentAttestState
+back to the loop.
+
+The compiled runtime policies are sent to a pool process only if it does not
+have them cached yet. Quotes of the same agent are processed in the order
+they were submitted.
+"""
+
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from keylime import cloud_verifier_common, config, keylime_logging
+from keylime.agentstates import AgentAttestState
+from keylime.failure import Failure, set_severity_config
+from keylime.ima.compiled_policy import CompiledRuntimePolicy, RuntimePolicyInputType, compile_runtime_policy
+from keylime.ima.policy_cache import RuntimePolicyCache
+
+logger = keylime_logging.init_logging("verifier")
+
+# Ephemeral agent fields that cannot be sent to another process and are not used to check quotes
+LOCAL_AGENT_FIELDS = ("ssl_context", "pending_event")
+
+AttestResult = Tuple[Failure, Dict[str, Any], AgentAttestState]
+
+
+def _init_worker() -> None:
+    # Shutdown is handled by the verifier process owning the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Label the failure events the same way the verifier does
+    if config.has_option("verifier", "severity_labels"):
+        set_severity_config(
+            config.getlist("verifier", "severity_labels"), config.getlist("verifier", "severity_policy")
+        )
+
+
+def _attest(
+    agent: Dict[str, Any],
+    mb_policy: Optional[str],
+    checksum: str,
+    runtime_policy: Optional[CompiledRuntimePolicy],
+    json_response: Dict[str, Any],
+    agent_attest_state: AgentAttestState,
+) -> Optional[AttestResult]:
+    """Check a quote in a pool process
+
+    None is returned if the runtime policy was not sent along and it is not
+    cached in this process, so that the caller can submit it again with the
+    policy.
+    """
+    cache = RuntimePolicyCache.get_instance()
+    if runtime_policy is None:
+        runtime_policy = cache.lookup(checksum)
+        if runtime_policy is None:
+            return None
+    elif checksum:
+        cache.add(runtime_policy)
+
+    failure = cloud_verifier_common.process_quote_response(
+        agent, mb_policy, runtime_policy, json_response, agent_attest_state
+    )
+    return failure, agent, agent_attest_state
+
+
+class _AgentQueue:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class AttestationPool:
+    instance: Optional["AttestationPool"] = None
+
+    @staticmethod
+    def get_instance() -> "AttestationPool":
+        """Create and return a singleton AttestationPool"""
+        if not AttestationPool.instance:
+            num_workers = config.getint("verifier", "attestation_workers", fallback=0)
+            AttestationPool.instance = AttestationPool(num_workers)
+        return AttestationPool.instance
+
+    def __init__(self, num_workers: int = 0):
+        """constructor
+
+        :param num_workers: the number of pool processes; 0 checks the quotes in the calling process
+        """
+        self.num_workers = max(num_workers, 0)
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.queues: Dict[str, _AgentQueue] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            logger.info("Starting %d attestation worker processes", self.num_workers)
+            # The verifier process runs threads, so do not fork it
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return self.executor
+
+    async def _submit(self, *args: Any) -> Optional[AttestResult]:
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), _attest, *args)
+        except BrokenProcessPool:
+            logger.error("An attestation worker process terminated abruptly, restarting the attestation workers")
+            self.shutdown(wait=False)
+            return await loop.run_in_executor(self._get_executor(), _attest, *args)
+
+    async def _process(
+        self,
+        agent: Dict[str, Any],
+        mb_policy: Optional[str],
+        runtime_policy: CompiledRuntimePolicy,
+        json_response: Dict[str, Any],
+        agent_attest_state: AgentAttestState,
+    ) -> Failure:
+        agent_data = {key: value for key, value in agent.items() if key not in LOCAL_AGENT_FIELDS}
+        checksum = runtime_policy.checksum
+
+        # Only send the policy along if the pool process cannot know it yet
+        result = None
+        if checksum:
+            result = await self._submit(agent_data, mb_policy, checksum, None, json_response, agent_attest_state)
+        if result is None:
+            result = await self._submit(
+                agent_data, mb_policy, checksum, runtime_policy, json_response, agent_attest_state
+            )
+            assert result is not None
+
+        failure, agent_data, new_state = result
+        agent.update(agent_data)
+        agent_attest_state.update_from(new_state)
+        return failure
+
+    async def process_quote_response(
+        self,
+        agent: Dict[str, Any],
+        mb_policy: Optional[str],
+        runtime_policy: RuntimePolicyInputType,
+        json_response: Dict[str, Any],
+        agent_attest_state: AgentAttestState,
+    ) -> Failure:
+        """Run cloud_verifier_common.process_quote_response() in the pool
+
+        The agent and agent_attest_state are updated in place once the quote
+        has been checked, just like when calling the function directly.
+        """
+        if self.num_workers == 0:
+            return cloud_verifier_common.process_quote_response(
+                agent, mb_policy, runtime_policy, json_response, agent_attest_state
+            )
+
+        agent_id = agent["agent_id"]
+        queue = self.queues.get(agent_id)
+        if queue is None:
+            queue = self.queues[agent_id] = _AgentQueue()
+        queue.users += 1
+        try:
+            async with queue.lock:
+                return await self._process(
+                    agent, mb_policy, compile_runtime_policy(runtime_policy), json_response, agent_attest_state
+                )
+        finally:
+            queue.users -= 1
+            if queue.users == 0:
+                del self.queues[agent_id]
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the pool processes; they are started again when needed"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
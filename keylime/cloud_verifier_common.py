@@ -1,4 +1,3 @@
-import ast
 import base64
 import time
 from typing import Any, Dict, Optional, Union
@@ -9,9 +8,11 @@ from keylime.common import algorithms
 from keylime.db.verifier_db import VerfierMain
 from keylime.failure import Component, Event, Failure
 from keylime.ima import file_signatures, ima
-from keylime.ima.types import RuntimePolicyType
+from keylime.ima.compiled_policy import RuntimePolicyInputType, compile_runtime_policy
+from keylime.revocation_signer import RevocationSigner
 from keylime.tpm import tpm_util
 from keylime.tpm.tpm_main import Tpm
+from keylime.tpm.tpm_policy import compile_tpm_policy
 
 # setup logging
 logger = keylime_logging.init_logging("cloudverifier_common")
@@ -34,7 +35,7 @@ def get_AgentAttestStates() -> AgentAttestStates:
 def process_quote_response(
     agent: Dict[str, Any],
     mb_policy: Optional[str],
-    runtime_policy: RuntimePolicyType,
+    runtime_policy: RuntimePolicyInputType,
     json_response: Dict[str, Any],
     agentAttestState: AgentAttestState,
 ) -> Failure:
@@ -170,6 +171,7 @@ def process_quote_response(
     agentAttestState.set_boottime(boottime)
 
     ima_keyrings = agentAttestState.get_ima_keyrings()
+    runtime_policy = compile_runtime_policy(runtime_policy)
 
     # If ima_sign_verification_keys was provided to agent by tenant directly,
     # use that. Otherwise, find keyring in IMA policy.
@@ -178,9 +180,9 @@ def process_quote_response(
     if agent["ima_sign_verification_keys"]:
         verification_key_string = agent["ima_sign_verification_keys"]
     else:
-        verification_key_string = runtime_policy["verification-keys"]
+        verification_key_string = runtime_policy.verification_keys
 
-    tenant_keyring = file_signatures.ImaKeyring.from_string(verification_key_string)
+    tenant_keyring = file_signatures.get_shared_keyring(verification_key_string)
     ima_keyrings.set_tenant_keyring(tenant_keyring)
 
     if agent.get("tpm_clockinfo"):
@@ -249,10 +251,11 @@ def prepare_get_quote(agent: Dict[str, Any]) -> Dict[str, Union[str, int]]:
     agentAttestState = get_AgentAttestStates().get_by_agent_id(agent["agent_id"])
     agent["nonce"] = tpm_util.random_password(20)
 
-    tpm_policy = ast.literal_eval(agent["tpm_policy"])
+    tpm_policy = compile_tpm_policy(agent["tpm_policy"])
+    assert tpm_policy.mask is not None
     params = {
         "nonce": agent["nonce"],
-        "mask": tpm_policy["mask"],
+        "mask": tpm_policy.mask,
         "ima_ml_entry": agentAttestState.get_next_ima_ml_entry(),
     }
     return params
@@ -260,7 +263,7 @@ def prepare_get_quote(agent: Dict[str, Any]) -> Dict[str, Union[str, int]]:
 
 def process_get_status(agent: VerfierMain) -> Dict[str, Any]:
     has_mb_policy = 0
-    if agent.mb_policy.mb_policy is not None:
+    if agent.mb_policy.checksum is not None:
         has_mb_policy = 1
 
     has_runtime_policy = 0
@@ -315,8 +318,7 @@ def prepare_error(agent: Dict[str, Any], msgtype: str = "revocation", event: Opt
 
     # also need to load up private key for signing revocations
     if agent["revocation_key"] != "":
-        signing_key = crypto.rsa_import_privkey(agent["revocation_key"])
-        tosend["signature"] = crypto.rsa_sign(signing_key, tosend["msg"])
+        tosend["signature"] = RevocationSigner.get_instance().sign(agent["revocation_key"], tosend["msg"])
 
     else:
         tosend["signature"] = b""
@@ -386,7 +388,7 @@ def process_verify_attestation(
     nonce: str,
     hash_alg: str,
     tpm_policy: str,
-    runtime_policy: RuntimePolicyType,
+    runtime_policy: RuntimePolicyInputType,
     mb_policy: str,
     ima_measurement_list: str,
     mb_measurement_list: str,
@@ -1,15 +1,17 @@
 import asyncio
 import base64
-import functools
+import hashlib
 import multiprocessing
 import os
+import random
 import signal
 import sys
 import traceback
-from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from contextlib import contextmanager
 from typing import Any, Dict, Iterator, List, Optional, Tuple, Union, cast
 
+import tornado.httpclient
 import tornado.httpserver
 import tornado.ioloop
 import tornado.netutil
@@ -31,16 +33,24 @@ from keylime import (
     tornado_requests,
     web_util,
 )
+from keylime.agent_scheduler import AgentScheduler
 from keylime.agentstates import AgentAttestState, AgentAttestStates
+from keylime.attestation_pool import AttestationPool
 from keylime.common import retry, states, validators
 from keylime.common.version import str_to_version
 from keylime.config import DEFAULT_TIMEOUT
 from keylime.da import record
+from keylime.db import shared_policies
 from keylime.db.keylime_db import SessionManager, make_engine
 from keylime.db.verifier_db import VerfierMain, VerifierAllowlist, VerifierMbpolicy
+from keylime.db.write_behind import DEFAULT_BATCH_SIZE, AgentStateWriter
 from keylime.failure import MAX_SEVERITY_LABEL, Component, Event, Failure, set_severity_config
-from keylime.ima import ima
+from keylime.ima import ima, policy_delta
+from keylime.ima.compiled_policy import CompiledRuntimePolicy
+from keylime.ima.policy_cache import RuntimePolicyCache
 from keylime.mba import mba
+from keylime.revocation_dispatcher import RevocationDispatcher
+from keylime.revocation_signer import RevocationSigner
 from keylime.tee import snp
 
 try:
@@ -51,7 +61,17 @@ except RuntimeError:
 
 logger = keylime_logging.init_logging("verifier")
 
-GLOBAL_POLICY_CACHE: Dict[str, Dict[str, str]] = {}
+# Default interval at which the changed agent columns are written to the database, in seconds
+DEFAULT_DB_WRITE_INTERVAL = 1.0
+
+GLOBAL_AGENT_STATE_WRITER: Optional[AgentStateWriter] = None
+
+# Interval at which the agent scheduler statistics are logged, in seconds
+SCHEDULER_STATS_INTERVAL = 60
+
+# Measured boot policies held by this process, by checksum
+GLOBAL_MB_POLICY_CACHE: "OrderedDict[str, str]" = OrderedDict()
+GLOBAL_MB_POLICY_CACHE_SIZE = 128
 
 set_severity_config(config.getlist("verifier", "severity_labels"), config.getlist("verifier", "severity_policy"))
 
@@ -65,6 +85,8 @@ try:
     rmc = record.get_record_mgt_class(config.get("verifier", "durable_attestation_import", fallback=""))
     if rmc:
         rmc = rmc("verifier")
+        # Durable attestation records the serialized runtime policy
+        RuntimePolicyCache.get_instance().keep_source = True
 except record.RecordManagementException as rme:
     logger.error("Error initializing Durable Attestation: %s", rme)
     sys.exit(1)
@@ -106,6 +128,22 @@ exclude_db: Dict[str, Any] = {
     "ssl_context": None,
 }
 
+# Columns of an agent that change with its attestations. Only these are written through the AgentStateWriter,
+# so that a delayed write does not override the other columns with an outdated value.
+attestation_fields = (
+    "operational_state",
+    "severity_level",
+    "last_event_id",
+    "attestation_count",
+    "last_received_quote",
+    "last_successful_attestation",
+    "tpm_clockinfo",
+    "public_key",
+    "hash_alg",
+    "enc_alg",
+    "sign_alg",
+)
+
 
 def _from_db_obj(agent_db_obj: VerfierMain) -> Dict[str, Any]:
     fields = [
@@ -149,73 +187,90 @@ def _from_db_obj(agent_db_obj: VerfierMain) -> Dict[str, Any]:
     return agent_dict
 
 
-def verifier_read_policy_from_cache(ima_policy_data: Dict[str, str]) -> str:
+def verifier_read_policy_from_cache(ima_policy_data: Dict[str, Any]) -> Optional[CompiledRuntimePolicy]:
     checksum = ima_policy_data.get("checksum", "")
     name = ima_policy_data.get("name", "empty")
     agent_id = ima_policy_data.get("agent_id", "")
 
     if not agent_id:
-        return ""
-
-    if agent_id not in GLOBAL_POLICY_CACHE:
-        GLOBAL_POLICY_CACHE[agent_id] = {}
-        GLOBAL_POLICY_CACHE[agent_id][""] = ""
-
-    if checksum not in GLOBAL_POLICY_CACHE[agent_id]:
-        if len(GLOBAL_POLICY_CACHE[agent_id]) > 1:
-            # Perform a cleanup of the contents, IMA policy checksum changed
-            logger.debug(
-                "Cleaning up policy cache for policy named %s, with checksum %s, used by agent %s",
-                name,
-                checksum,
-                agent_id,
-            )
+        return None
 
-            GLOBAL_POLICY_CACHE[agent_id] = {}
-            GLOBAL_POLICY_CACHE[agent_id][""] = ""
+    ima_policy = ima_policy_data.get("ima_policy")
+    if not ima_policy:
+        return None
 
-        logger.debug(
-            "IMA policy named %s, with checksum %s, used by agent %s is not present on policy cache on this verifier, performing SQLAlchemy load",
-            name,
-            checksum,
-            agent_id,
+    try:
+        return RuntimePolicyCache.get_instance().get(ima_policy, checksum, ima_policy_data.get("ima_policy_compiled"))
+    except Exception as e:
+        logger.error(
+            "Could not load IMA policy named %s, with checksum %s, used by agent %s: %s", name, checksum, agent_id, e
         )
+        return None
+
 
-        # Get the large ima_policy content - it's already loaded in ima_policy_data
-        ima_policy = ima_policy_data.get("ima_policy", "")
-        assert isinstance(ima_policy, str)
-        GLOBAL_POLICY_CACHE[agent_id][checksum] = ima_policy
+def verifier_read_mb_policy(session: Session, mb_policy_id: int, checksum: Optional[str]) -> Optional[str]:
+    """Return the content of the measured boot policy, only loading it from the database if needed"""
+    if checksum and checksum in GLOBAL_MB_POLICY_CACHE:
+        GLOBAL_MB_POLICY_CACHE.move_to_end(checksum)
+        return GLOBAL_MB_POLICY_CACHE[checksum]
 
-    return GLOBAL_POLICY_CACHE[agent_id][checksum]
+    logger.debug("Measured boot policy with checksum %s is not present in the policy cache, loading it", checksum)
+    mb_policy: Optional[str] = session.query(VerifierMbpolicy.mb_policy).filter_by(id=mb_policy_id).scalar()
+
+    if checksum and mb_policy is not None:
+        GLOBAL_MB_POLICY_CACHE[checksum] = mb_policy
+        while len(GLOBAL_MB_POLICY_CACHE) > GLOBAL_MB_POLICY_CACHE_SIZE:
+            GLOBAL_MB_POLICY_CACHE.popitem(last=False)
+    return mb_policy
 
 
 def verifier_db_delete_agent(session: Session, agent_id: str) -> None:
     get_AgentAttestStates().delete_by_agent_id(agent_id)
+    # Pending changes must not be written to an agent added again with the same id
+    get_agent_state_writer().discard(agent_id)
+    deleted = (
+        session.query(VerfierMain.ima_policy_id, VerfierMain.mb_policy_id, VerfierMain.revocation_key)
+        .filter_by(agent_id=agent_id)
+        .one_or_none()
+    )
     session.query(VerfierMain).filter_by(agent_id=agent_id).delete()
     session.query(VerifierAllowlist).filter_by(name=agent_id).delete()
     session.query(VerifierMbpolicy).filter_by(name=agent_id).delete()
     session.commit()
+    if deleted is not None:
+        shared_policies.release_shared_policies(session, deleted.ima_policy_id, deleted.mb_policy_id)
+        RevocationSigner.get_instance().forget(deleted.revocation_key)
+
+
+def get_agent_state_writer() -> AgentStateWriter:
+    global GLOBAL_AGENT_STATE_WRITER
+    if GLOBAL_AGENT_STATE_WRITER is None:
+        GLOBAL_AGENT_STATE_WRITER = AgentStateWriter(
+            engine,
+            batch_size=config.getint("verifier", "db_write_batch_size", fallback=DEFAULT_BATCH_SIZE),
+            protected_states=(states.TERMINATED, states.TENANT_FAILED),
+            enabled=config.getfloat("verifier", "db_write_interval", fallback=DEFAULT_DB_WRITE_INTERVAL) > 0,
+        )
+    return GLOBAL_AGENT_STATE_WRITER
+
+
+def _attestation_state(agent: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: agent[key] for key in attestation_fields if key in agent}
 
 
 def store_attestation_state(agentAttestState: AgentAttestState) -> None:
     # Only store if IMA log was evaluated
     if agentAttestState.get_ima_pcrs():
-        agent_id = agentAttestState.agent_id
-        try:
-            with session_context() as session:
-                update_agent = session.query(VerfierMain).get(agentAttestState.get_agent_id())
-                assert update_agent
-                update_agent.boottime = agentAttestState.get_boottime()
-                update_agent.next_ima_ml_entry = agentAttestState.get_next_ima_ml_entry()
-                ima_pcrs_dict = agentAttestState.get_ima_pcrs()
-                update_agent.ima_pcrs = list(ima_pcrs_dict.keys())
-                for pcr_num, value in ima_pcrs_dict.items():
-                    setattr(update_agent, f"pcr{pcr_num}", value)
-                update_agent.learned_ima_keyrings = agentAttestState.get_ima_keyrings().to_json()
-                session.add(update_agent)
-                # session.commit() is automatically called by context manager
-        except SQLAlchemyError as e:
-            logger.error("SQLAlchemy Error on storing attestation state for agent %s: %s", agent_id, e)
+        ima_pcrs_dict = agentAttestState.get_ima_pcrs()
+        fields = {
+            "boottime": agentAttestState.get_boottime(),
+            "next_ima_ml_entry": agentAttestState.get_next_ima_ml_entry(),
+            "ima_pcrs": list(ima_pcrs_dict.keys()),
+            "learned_ima_keyrings": agentAttestState.get_ima_keyrings().to_json(),
+        }
+        for pcr_num, value in ima_pcrs_dict.items():
+            fields[f"pcr{pcr_num}"] = value
+        get_agent_state_writer().update(agentAttestState.get_agent_id(), fields)
 
 
 class BaseHandler(tornado.web.RequestHandler):
@@ -388,7 +443,7 @@ class AgentsHandler(BaseHandler):
                             )
                         )
                         .options(  # type: ignore
-                            joinedload(VerfierMain.mb_policy).load_only(VerifierMbpolicy.mb_policy)  # pyright: ignore
+                            joinedload(VerfierMain.mb_policy).load_only(VerifierMbpolicy.checksum)  # pyright: ignore
                         )
                         .filter_by(agent_id=agent_id)
                         .one_or_none()
@@ -416,7 +471,7 @@ class AgentsHandler(BaseHandler):
                             )
                             .options(  # type: ignore
                                 joinedload(VerfierMain.mb_policy).load_only(
-                                    VerifierMbpolicy.mb_policy  # type: ignore[arg-type]
+                                    VerifierMbpolicy.checksum  # type: ignore[arg-type]
                                 )
                             )
                             .filter_by(verifier_id=rest_params["verifier"])
@@ -432,7 +487,7 @@ class AgentsHandler(BaseHandler):
                             )
                             .options(  # type: ignore
                                 joinedload(VerfierMain.mb_policy).load_only(
-                                    VerifierMbpolicy.mb_policy  # type: ignore[arg-type]
+                                    VerifierMbpolicy.checksum  # type: ignore[arg-type]
                                 )
                             )
                             .all()
@@ -483,14 +538,6 @@ class AgentsHandler(BaseHandler):
                 logger.info("DELETE returning 404 response. agent id: %s not associated to this verifer.", agent_id)
                 return
 
-            # Cleanup the cache when the agent is deleted. Do it early.
-            if agent_id in GLOBAL_POLICY_CACHE:
-                del GLOBAL_POLICY_CACHE[agent_id]
-                logger.debug(
-                    "Cleaned up policy cache from all entries used by agent %s",
-                    agent_id,
-                )
-
             op_state = agent.operational_state
             if op_state in (states.SAVED, states.FAILED, states.TERMINATED, states.TENANT_FAILED, states.INVALID_QUOTE):
                 try:
@@ -590,14 +637,15 @@ class AgentsHandler(BaseHandler):
                     # Handle runtime policies
 
                     # How each pair of inputs should be handled:
-                    # - No name, no policy: use default empty policy using agent UUID as name
+                    # - No name, no policy: use default empty policy shared by all agents
                     # - Name, no policy: fetch existing policy from DB
-                    # - No name, policy: store policy using agent UUID as name
+                    # - No name, policy: store policy shared by all agents with the same policy
                     # - Name, policy: store policy using name
 
                     runtime_policy_name = json_body.get("runtime_policy_name")
                     runtime_policy = base64.b64decode(json_body.get("runtime_policy")).decode()
                     runtime_policy_stored = None
+                    runtime_policy_ref: Optional[shared_policies.SharedPolicy] = None
 
                     with session_context() as session:
                         if runtime_policy_name:
@@ -667,19 +715,10 @@ class AgentsHandler(BaseHandler):
                                 logger.warning(e.message)
                                 return
 
+                            runtime_policy_shared = not runtime_policy_name
                             if not runtime_policy_name:
                                 runtime_policy_name = agent_id
 
-                            try:
-                                runtime_policy_db_format = ima.runtime_policy_db_contents(
-                                    runtime_policy_name, runtime_policy
-                                )
-                            except ima.ImaValidationError as e:
-                                message = f"Runtime policy is malformatted: {e.message}"
-                                web_util.echo_json_response(self, e.code, message)
-                                logger.warning(message)
-                                return
-
                             try:
                                 runtime_policy_stored = (
                                     session.query(VerifierAllowlist).filter_by(name=runtime_policy_name).one_or_none()
@@ -692,10 +731,28 @@ class AgentsHandler(BaseHandler):
                                 )
                                 raise
                             try:
-                                if runtime_policy_stored is None:
+                                if runtime_policy_stored is None and runtime_policy_shared:
+                                    runtime_policy_ref = shared_policies.SharedPolicy(
+                                        VerifierAllowlist,
+                                        hashlib.sha256(runtime_policy.encode()).hexdigest(),
+                                        lambda name: ima.runtime_policy_db_contents(name, runtime_policy),
+                                    )
+                                    # Only validated and compiled if no agent uses the same policy yet
+                                    runtime_policy_stored = shared_policies.get_shared_policy(
+                                        session, *runtime_policy_ref
+                                    )
+                                elif runtime_policy_stored is None:
+                                    runtime_policy_db_format = ima.runtime_policy_db_contents(
+                                        runtime_policy_name, runtime_policy
+                                    )
                                     runtime_policy_stored = VerifierAllowlist(**runtime_policy_db_format)
                                     session.add(runtime_policy_stored)
                                     session.commit()
+                            except ima.ImaValidationError as e:
+                                message = f"Runtime policy is malformatted: {e.message}"
+                                web_util.echo_json_response(self, e.code, message)
+                                logger.warning(message)
+                                return
                             except SQLAlchemyError as e:
                                 logger.error(
                                     "SQLAlchemy Error while updating ima policy for agent ID %s: %s", agent_id, e
@@ -703,13 +760,15 @@ class AgentsHandler(BaseHandler):
                                 raise
 
                         # Handle measured boot policy
-                        # - No name, mb_policy   : store mb_policy using agent UUID as name
+                        # - No name, mb_policy   : store mb_policy shared by all agents with the same mb_policy
                         # - Name, no mb_policy   : fetch existing mb_policy from DB
                         # - Name, mb_policy      : store mb_policy using name
 
                         mb_policy_name = json_body["mb_policy_name"]
                         mb_policy = json_body["mb_policy"]
                         mb_policy_stored = None
+                        mb_policy_ref: Optional[shared_policies.SharedPolicy] = None
+                        mb_policy_shared = not mb_policy_name
 
                         if mb_policy_name:
                             try:
@@ -763,9 +822,17 @@ class AgentsHandler(BaseHandler):
                         if mb_policy_stored is None:
                             try:
                                 mb_policy_db_format = mba.mb_policy_db_contents(mb_policy_name, mb_policy)
-                                mb_policy_stored = VerifierMbpolicy(**mb_policy_db_format)
-                                session.add(mb_policy_stored)
-                                session.commit()
+                                if mb_policy_shared:
+                                    mb_policy_ref = shared_policies.SharedPolicy(
+                                        VerifierMbpolicy,
+                                        mb_policy_db_format["checksum"],
+                                        lambda name: {**mb_policy_db_format, "name": name},
+                                    )
+                                    mb_policy_stored = shared_policies.get_shared_policy(session, *mb_policy_ref)
+                                else:
+                                    mb_policy_stored = VerifierMbpolicy(**mb_policy_db_format)
+                                    session.add(mb_policy_stored)
+                                    session.commit()
                             except SQLAlchemyError as e:
                                 logger.error(
                                     "SQLAlchemy Error while updating mb_policy for agent ID %s: %s", agent_id, e
@@ -776,10 +843,12 @@ class AgentsHandler(BaseHandler):
                         try:
                             assert runtime_policy_stored
                             assert mb_policy_stored
-                            session.add(
-                                VerfierMain(**agent_data, ima_policy=runtime_policy_stored, mb_policy=mb_policy_stored)
+                            shared_policies.add_agent(
+                                session,
+                                agent_data,
+                                runtime_policy_ref or runtime_policy_stored,
+                                mb_policy_ref or mb_policy_stored,
                             )
-                            session.commit()
                         except SQLAlchemyError as e:
                             logger.error("SQLAlchemy Error for agent ID %s: %s", agent_id, e)
                             raise e
@@ -894,6 +963,11 @@ class AllowlistHandler(BaseHandler):
             logger.warning("%s returning 400 response: %s", method, self.request.path)
             return False, None
 
+        if method not in ("GET", "DELETE") and shared_policies.is_shared_policy_name(runtime_policy_name):
+            web_util.echo_json_response(self, 400, f"Runtime policy {runtime_policy_name} is shared and read-only")
+            logger.warning("%s returning 400 response: runtime policy %s is shared", method, runtime_policy_name)
+            return False, None
+
         return True, runtime_policy_name
 
     def get(self) -> None:
@@ -959,7 +1033,7 @@ class AllowlistHandler(BaseHandler):
                 raise
 
             try:
-                agent = session.query(VerfierMain).filter_by(ima_policy_id=runtime_policy.id).one_or_none()
+                agent = session.query(VerfierMain).filter_by(ima_policy_id=runtime_policy.id).first()
             except SQLAlchemyError as e:
                 logger.error("SQLAlchemy Error: %s", e)
                 raise
@@ -1109,6 +1183,89 @@ class AllowlistHandler(BaseHandler):
             web_util.echo_json_response(self, 201)
             logger.info("PUT returning 201")
 
+    def patch(self) -> None:
+        """Update an allowlist incrementally
+
+        PATCH /allowlists/{name}
+        body: {"base_checksum": "..", "digests": {"add": {..}, "remove": {..}}, "excludes": {"add": [..]} ...
+        """
+
+        params_valid, runtime_policy_name = self.__validate_input("PATCH")
+        if not params_valid or runtime_policy_name is None:
+            return
+
+        if len(self.request.body) == 0:
+            web_util.echo_json_response(self, 400, "Expected non zero content length")
+            logger.warning("PATCH returning 400 response. Expected non zero content length.")
+            return
+
+        if config.getboolean("verifier", "require_allow_list_signatures", fallback=False):
+            web_util.echo_json_response(self, 400, "Runtime policy deltas cannot be signed, use PUT instead")
+            logger.warning("PATCH returning 400 response. Runtime policies must be signed.")
+            return
+
+        try:
+            delta = json.loads(self.request.body)
+            policy_delta.validate_delta(delta)
+        except ValueError as e:
+            web_util.echo_json_response(self, 400, f"Runtime policy delta is not valid JSON: {e}")
+            logger.warning("PATCH returning 400 response. Runtime policy delta is not valid JSON: %s", e)
+            return
+        except ima.ImaValidationError as e:
+            message = f"Runtime policy delta is malformatted: {e.message}"
+            web_util.echo_json_response(self, e.code, message)
+            logger.warning(message)
+            return
+
+        with session_context() as session:
+            try:
+                stored = (
+                    session.query(VerifierAllowlist.ima_policy, VerifierAllowlist.checksum)
+                    .filter_by(name=runtime_policy_name)
+                    .one_or_none()
+                )
+            except SQLAlchemyError as e:
+                logger.error("SQLAlchemy Error: %s", e)
+                raise
+
+            if stored is None:
+                web_util.echo_json_response(self, 404, f"Runtime policy {runtime_policy_name} not found")
+                logger.warning("Runtime policy with name %s does not exist", runtime_policy_name)
+                return
+
+            try:
+                runtime_policy_db_format = policy_delta.runtime_policy_delta_db_contents(
+                    runtime_policy_name, stored[0], stored[1], delta
+                )
+            except ima.ImaValidationError as e:
+                web_util.echo_json_response(self, e.code, e.message)
+                logger.warning(e.message)
+                return
+
+            try:
+                # Only update the policy the delta was applied to
+                updated = (
+                    session.query(VerifierAllowlist)
+                    .filter_by(name=runtime_policy_name, checksum=stored[1])
+                    .update(runtime_policy_db_format)  # pyright: ignore
+                )
+            except SQLAlchemyError as e:
+                logger.error("SQLAlchemy Error: %s", e)
+                raise
+
+            if updated != 1:
+                web_util.echo_json_response(
+                    self, 409, f"Runtime policy {runtime_policy_name} was modified concurrently"
+                )
+                logger.warning("Runtime policy with name %s was modified concurrently", runtime_policy_name)
+                return
+
+            checksum = runtime_policy_db_format["checksum"]
+            RuntimePolicyCache.get_instance().apply_delta(checksum, runtime_policy_db_format["ima_policy_delta"])
+
+            web_util.echo_json_response(self, 200, "Success", {"name": runtime_policy_name, "checksum": checksum})
+            logger.info("PATCH returning 200")
+
     def data_received(self, chunk: Any) -> None:
         raise NotImplementedError()
 
@@ -1239,6 +1396,11 @@ class MbpolicyHandler(BaseHandler):
             logger.warning("%s returning 400 response: %s", method, self.request.path)
             return False, None
 
+        if method not in ("GET", "DELETE") and shared_policies.is_shared_policy_name(mb_policy_name):
+            web_util.echo_json_response(self, 400, f"mb_policy {mb_policy_name} is shared and read-only")
+            logger.warning("%s returning 400 response: mb_policy %s is shared", method, mb_policy_name)
+            return False, None
+
         return True, mb_policy_name
 
     def get(self) -> None:
@@ -1304,7 +1466,7 @@ class MbpolicyHandler(BaseHandler):
                 raise
 
             try:
-                agent = session.query(VerfierMain).filter_by(mb_policy_id=mbpolicy.id).one_or_none()
+                agent = session.query(VerfierMain).filter_by(mb_policy_id=mbpolicy.id).first()
             except SQLAlchemyError as e:
                 logger.error("SQLAlchemy Error: %s", e)
                 raise
@@ -1698,17 +1860,9 @@ async def update_agent_api_version(
 
             logger.info("Agent %s new API version %s is supported", agent_id, new_version)
 
-            with session_context() as session:
-                agent["supported_version"] = new_version
-
-                # Remove keys that should not go to the DB
-                agent_db = dict(agent)
-                for key in exclude_db:
-                    if key in agent_db:
-                        del agent_db[key]
-
-                session.query(VerfierMain).filter_by(agent_id=agent_id).update(agent_db)  # pyright: ignore
-                # session.commit() is automatically called by context manager
+            agent["supported_version"] = new_version
+            # Written along with the pending changes of the agent, so that these do not override it
+            get_agent_state_writer().update(agent_id, {"supported_version": new_version}, durable=True)
         else:
             logger.warning("Agent %s new API version %s is not supported", agent_id, new_version)
             return None
@@ -1727,7 +1881,7 @@ async def update_agent_api_version(
 async def invoke_get_quote(
     agent: Dict[str, Any],
     mb_policy: Optional[str],
-    runtime_policy: str,
+    runtime_policy: Optional[CompiledRuntimePolicy],
     need_pubkey: bool,
     timeout: float = DEFAULT_TIMEOUT,
 ) -> None:
@@ -1804,13 +1958,16 @@ async def invoke_get_quote(
                 agent["provide_V"] = True
             agentAttestState = get_AgentAttestStates().get_by_agent_id(agent["agent_id"])
 
+            if runtime_policy is None:
+                raise Exception(f"No valid runtime policy available for agent {agent['agent_id']}")
+
             if rmc:
-                rmc.record_create(agent, json_response, mb_policy, runtime_policy)
+                rmc.record_create(agent, json_response, mb_policy, runtime_policy.source)
 
-            failure = cloud_verifier_common.process_quote_response(
+            failure = await AttestationPool.get_instance().process_quote_response(
                 agent,
                 mb_policy,
-                ima.deserialize_runtime_policy(runtime_policy),
+                runtime_policy,
                 json_response["results"],
                 agentAttestState,
             )
@@ -1900,7 +2057,12 @@ async def invoke_provide_v(agent: Dict[str, Any], timeout: float = DEFAULT_TIMEO
         asyncio.ensure_future(process_agent(agent, states.GET_QUOTE))
 
 
-async def invoke_notify_error(agent: Dict[str, Any], tosend: Dict[str, Any], timeout: float = DEFAULT_TIMEOUT) -> None:
+async def invoke_notify_error(
+    agent: Dict[str, Any],
+    tosend: Dict[str, Any],
+    timeout: float = DEFAULT_TIMEOUT,
+    client: Optional[tornado.httpclient.AsyncHTTPClient] = None,
+) -> bool:
     kwargs = {
         "data": tosend,
     }
@@ -1912,6 +2074,7 @@ async def invoke_notify_error(agent: Dict[str, Any], tosend: Dict[str, Any], tim
         f"http://{agent['ip']}:{agent['port']}/v{agent['supported_version']}/notifications/revocation",
         **kwargs,  # type: ignore
         timeout=timeout,
+        client=client,
     )
     response = await res
 
@@ -1929,21 +2092,23 @@ async def invoke_notify_error(agent: Dict[str, Any], tosend: Dict[str, Any], tim
                     updated = await update
 
                     if updated:
-                        asyncio.ensure_future(invoke_notify_error(updated, tosend))
-                    else:
-                        logger.warning("Could not update stored agent %s API version", agent["agent_id"])
+                        return await invoke_notify_error(updated, tosend, timeout=timeout, client=client)
 
-                    return
+                    logger.warning("Could not update stored agent %s API version", agent["agent_id"])
+                    return False
 
             except Exception as e:
                 logger.exception(e)
-                return
+                return False
 
         logger.warning(
             "Unexpected Notify Revocation response error for cloud agent %s, Error: %s",
             agent["agent_id"],
             response.status_code,
         )
+    else:
+        return True
+    return False
 
 
 async def notify_error(
@@ -1965,30 +2130,40 @@ async def notify_error(
         verifier_id = config.get("verifier", "uuid", fallback=cloud_verifier_common.DEFAULT_VERIFIER_ID)
         with session_context() as session:
             try:
-                agents = session.query(VerfierMain).filter_by(verifier_id=verifier_id).all()
+                # Only the columns needed to reach the agents are loaded
+                recipients = [
+                    row._asdict()
+                    for row in session.query(
+                        VerfierMain.agent_id,
+                        VerfierMain.ip,
+                        VerfierMain.port,
+                        VerfierMain.supported_version,
+                        VerfierMain.mtls_cert,
+                    )
+                    .filter(VerfierMain.verifier_id == verifier_id, VerfierMain.agent_id != agent["agent_id"])
+                    .all()
+                ]
             except Exception as e:
                 logger.error("An issue happened querying the verifier for the list of agents to notify: %s", e)
                 return
 
-            futures = []
-            loop = asyncio.get_event_loop()
-            # Notify all agents asynchronously through a thread pool
-            with ThreadPoolExecutor() as pool:
-                for agent_db_obj in agents:
-                    if agent_db_obj.agent_id != agent["agent_id"]:
-                        agent = _from_db_obj(agent_db_obj)
-                        if agent["mtls_cert"] and agent["mtls_cert"] != "disabled":
-                            agent["ssl_context"] = web_util.generate_agent_tls_context(
-                                "verifier", agent["mtls_cert"], logger=logger
-                            )
-                    func = functools.partial(invoke_notify_error, agent, tosend, timeout=timeout)
-                    futures.append(await loop.run_in_executor(pool, func))
-                # Wait for all tasks complete in 60 seconds
-                try:
-                    for f in asyncio.as_completed(futures, timeout=60):
-                        await f
-                except asyncio.TimeoutError as e:
-                    logger.error("Timeout during notifying error to agents: %s", e)
+        dispatcher = RevocationDispatcher.get_instance()
+        for recipient in recipients:
+            recipient["ssl_context"] = dispatcher.tls_context(recipient["mtls_cert"])
+
+        stats = await dispatcher.dispatch(
+            recipients,
+            lambda recipient, client: invoke_notify_error(recipient, tosend, timeout=timeout, client=client),
+            timeout=config.getfloat("verifier", "revocation_notification_timeout", fallback=60.0),
+        )
+        logger.info(
+            "Notified %d agents of a revocation in %.3fs: %d succeeded, %d failed, %d timed out",
+            stats["recipients"],
+            stats["elapsed"],
+            stats["succeeded"],
+            stats["failed"],
+            stats["timed_out"],
+        )
 
 
 async def process_agent(
@@ -1998,18 +2173,25 @@ async def process_agent(
         main_agent_operational_state = agent["operational_state"]
         stored_agent = None
 
-        # First database operation - read agent data and extract all needed data within session context
+        # First database operation - read agent data and extract all needed data within session context.
+        # Only the ids and checksums of the policies are loaded; their content is only loaded if this
+        # process does not hold a policy with the same checksum already.
         ima_policy_data = {}
-        mb_policy_data = None
+        runtime_policy = None
+        mb_policy = None
         with session_context() as session:
             try:
                 stored_agent = (
                     session.query(VerfierMain)
                     .options(  # type: ignore
-                        joinedload(VerfierMain.ima_policy)  # Load full IMA policy object including content
+                        joinedload(VerfierMain.ima_policy).load_only(
+                            VerifierAllowlist.id, VerifierAllowlist.name, VerifierAllowlist.checksum  # pyright: ignore
+                        )
                     )
                     .options(  # type: ignore
-                        joinedload(VerfierMain.mb_policy).load_only(VerifierMbpolicy.mb_policy)  # pyright: ignore
+                        joinedload(VerfierMain.mb_policy).load_only(
+                            VerifierMbpolicy.id, VerifierMbpolicy.checksum  # pyright: ignore
+                        )
                     )
                     .filter_by(agent_id=str(agent["agent_id"]))
                     .first()
@@ -2017,16 +2199,37 @@ async def process_agent(
 
                 # Extract IMA policy data within session context to avoid DetachedInstanceError
                 if stored_agent and stored_agent.ima_policy:
-                    ima_policy_data = {
-                        "checksum": str(stored_agent.ima_policy.checksum),
-                        "name": stored_agent.ima_policy.name,
-                        "agent_id": str(stored_agent.agent_id),
-                        "ima_policy": stored_agent.ima_policy.ima_policy,  # Extract the large content too
-                    }
+                    checksum = str(stored_agent.ima_policy.checksum)
+                    runtime_policy = RuntimePolicyCache.get_instance().lookup(checksum)
+                    if runtime_policy is None:
+                        # The policy may have been updated with a delta to a policy this process holds
+                        ima_policy_delta = (
+                            session.query(VerifierAllowlist.ima_policy_delta)
+                            .filter_by(id=stored_agent.ima_policy.id)
+                            .scalar()
+                        )
+                        if ima_policy_delta:
+                            runtime_policy = RuntimePolicyCache.get_instance().apply_delta(checksum, ima_policy_delta)
+                    if runtime_policy is None:
+                        # The compiled artifact saves deserializing and compiling the policy
+                        row = (
+                            session.query(VerifierAllowlist.ima_policy, VerifierAllowlist.ima_policy_compiled)
+                            .filter_by(id=stored_agent.ima_policy.id)
+                            .first()
+                        )
+                        ima_policy_data = {
+                            "checksum": checksum,
+                            "name": stored_agent.ima_policy.name,
+                            "agent_id": str(stored_agent.agent_id),
+                            "ima_policy": row[0] if row is not None else None,
+                            "ima_policy_compiled": row[1] if row is not None else None,
+                        }
 
                 # Extract MB policy data within session context
                 if stored_agent and stored_agent.mb_policy:
-                    mb_policy_data = stored_agent.mb_policy.mb_policy
+                    mb_policy = verifier_read_mb_policy(
+                        session, stored_agent.mb_policy.id, stored_agent.mb_policy.checksum  # pyright: ignore
+                    )
 
             except SQLAlchemyError as e:
                 logger.error("SQLAlchemy Error for agent ID %s: %s", agent["agent_id"], e)
@@ -2034,15 +2237,16 @@ async def process_agent(
         # if the stored agent could not be recovered from the database, stop polling
         if not stored_agent:
             logger.warning("Unable to retrieve agent %s from database. Stopping polling", agent["agent_id"])
+            get_agent_state_writer().discard(agent["agent_id"])
             if agent["pending_event"] is not None:
-                tornado.ioloop.IOLoop.current().remove_timeout(agent["pending_event"])
+                AgentScheduler.get_instance().cancel(agent["pending_event"])
             return
 
         # if the user did terminated this agent
         if stored_agent.operational_state == states.TERMINATED:  # pyright: ignore
             logger.warning("Agent %s terminated by user.", agent["agent_id"])
             if agent["pending_event"] is not None:
-                tornado.ioloop.IOLoop.current().remove_timeout(agent["pending_event"])
+                AgentScheduler.get_instance().cancel(agent["pending_event"])
 
             # Second database operation - delete agent
             with session_context() as session:
@@ -2052,8 +2256,9 @@ async def process_agent(
         # if the user tells us to stop polling because the tenant quote check failed
         if stored_agent.operational_state == states.TENANT_FAILED:  # pyright: ignore
             logger.warning("Agent %s has failed tenant quote. Stopping polling", agent["agent_id"])
+            get_agent_state_writer().discard(agent["agent_id"])
             if agent["pending_event"] is not None:
-                tornado.ioloop.IOLoop.current().remove_timeout(agent["pending_event"])
+                AgentScheduler.get_instance().cancel(agent["pending_event"])
             return
 
         # Use the request timeout stored in the agent dict (read from the
@@ -2081,37 +2286,30 @@ async def process_agent(
                 # When the failure is irrecoverable we stop polling the agent
                 if not failure.recoverable or failure.highest_severity == MAX_SEVERITY_LABEL:
                     if agent["pending_event"] is not None:
-                        tornado.ioloop.IOLoop.current().remove_timeout(agent["pending_event"])
+                        AgentScheduler.get_instance().cancel(agent["pending_event"])
 
-                    # Third database operation - update agent with failure state
-                    with session_context() as session:
-                        for key in exclude_db:
-                            if key in agent:
-                                del agent[key]
-                        session.query(VerfierMain).filter_by(agent_id=agent["agent_id"]).update(
-                            agent  # type: ignore[arg-type]
-                        )
-                        # session.commit() is automatically called by context manager
+                    # Third database operation - update agent with failure state, along with
+                    # all pending changes
+                    for key in exclude_db:
+                        if key in agent:
+                            del agent[key]
+                    get_agent_state_writer().update(agent["agent_id"], _attestation_state(agent), durable=True)
 
-        # propagate all state, but remove none DB keys first (using exclude_db)
+        # propagate the attestation state
         try:
-            agent_db = dict(agent)
-            for key in exclude_db:
-                if key in agent_db:
-                    del agent_db[key]
-
-            # Fourth database operation - update agent state
-            with session_context() as session:
-                session.query(VerfierMain).filter_by(agent_id=agent_db["agent_id"]).update(agent_db)  # pyright: ignore
-                # session.commit() is automatically called by context manager
+            # Fourth database operation - update agent state; it is written right away if it failed,
+            # and with the changes of other agents otherwise
+            get_agent_state_writer().update(
+                agent["agent_id"],
+                _attestation_state(agent),
+                durable=new_operational_state in (states.FAILED, states.INVALID_QUOTE),
+            )
         except SQLAlchemyError as e:
             logger.error("SQLAlchemy Error for agent ID %s: %s", agent["agent_id"], e)
 
-        # Load agent's IMA policy
-        runtime_policy = verifier_read_policy_from_cache(ima_policy_data)
-
-        # Get agent's measured boot policy
-        mb_policy = mb_policy_data
+        # Load agent's IMA policy, unless it was already found in the policy cache
+        if runtime_policy is None:
+            runtime_policy = verifier_read_policy_from_cache(ima_policy_data)
 
         # If agent was in a failed state we check if we either stop polling
         # or just add it again to the event loop
@@ -2147,24 +2345,16 @@ async def process_agent(
             agent["num_retries"] = 0
             interval = config.getfloat("verifier", "quote_interval")
             agent["operational_state"] = states.GET_QUOTE
-            if interval == 0:
-                await invoke_get_quote(agent, mb_policy, runtime_policy, False, timeout=timeout)
-            else:
-                logger.debug(
-                    "Setting up callback to check agent ID %s again in %f seconds", agent["agent_id"], interval
-                )
-
-                pending = tornado.ioloop.IOLoop.current().call_later(
-                    # type: ignore  # due to python <3.9
-                    interval,
-                    invoke_get_quote,
-                    agent,
-                    mb_policy,
-                    runtime_policy,
-                    False,
-                    timeout=timeout,
-                )
-                agent["pending_event"] = pending
+            logger.debug("Scheduling agent ID %s to be checked again in %f seconds", agent["agent_id"], interval)
+            agent["pending_event"] = AgentScheduler.get_instance().schedule(
+                interval,
+                invoke_get_quote,
+                agent,
+                mb_policy,
+                runtime_policy,
+                False,
+                timeout=timeout,
+            )
             return
 
         maxr = config.getint("verifier", "max_retries")
@@ -2196,14 +2386,14 @@ async def process_agent(
                     maxr,
                     next_retry,
                 )
-                tornado.ioloop.IOLoop.current().call_later(
-                    # type: ignore  # due to python <3.9
+                agent["pending_event"] = AgentScheduler.get_instance().schedule(
                     next_retry,
                     invoke_get_quote,
                     agent,
                     mb_policy,
                     runtime_policy,
                     True,
+                    retry=True,
                     timeout=timeout,
                 )
             return
@@ -2230,8 +2420,8 @@ async def process_agent(
                     maxr,
                     next_retry,
                 )
-                tornado.ioloop.IOLoop.current().call_later(
-                    next_retry, invoke_provide_v, agent  # type: ignore  # due to python <3.9
+                agent["pending_event"] = AgentScheduler.get_instance().schedule(
+                    next_retry, invoke_provide_v, agent, retry=True
                 )
             return
         raise Exception("nothing should ever fall out of this!")
@@ -2246,6 +2436,8 @@ async def process_agent(
 
 async def activate_agents(agents: List[VerfierMain], verifier_ip: str, verifier_port: int) -> None:
     aas = get_AgentAttestStates()
+    scheduler = AgentScheduler.get_instance()
+    quote_interval = config.getfloat("verifier", "quote_interval")
     for agent in agents:
         agent.verifier_ip = verifier_ip  # pyright: ignore
         agent.verifier_port = verifier_port  # pyright: ignore
@@ -2256,7 +2448,10 @@ async def activate_agents(agents: List[VerfierMain], verifier_ip: str, verifier_
             )
 
         if agent.operational_state == states.START:  # pyright: ignore
-            asyncio.ensure_future(process_agent(agent_run, states.GET_QUOTE))
+            # Spread the first attestations over a quote interval to avoid a burst of requests
+            agent_run["pending_event"] = scheduler.schedule(
+                random.uniform(0, quote_interval), process_agent, agent_run, states.GET_QUOTE
+            )
         if agent.boottime:  # pyright: ignore
             ima_pcrs_dict = {}
             assert isinstance(agent.ima_pcrs, list)
@@ -2346,6 +2541,12 @@ def main() -> None:
         server = tornado.httpserver.HTTPServer(app, ssl_options=ssl_ctx, max_buffer_size=max_upload_size)
         server.add_sockets(sockets)
 
+        # Send the webhook notifications left in the outbox of this worker
+        if "webhook" in revocation_notifier.get_notifiers():
+            revocation_notifier.init_webhook_manager(task_id, num_workers)
+        if "zeromq" in revocation_notifier.get_notifiers():
+            revocation_notifier.start_publisher()
+
         def server_sig_handler(*_: Any) -> None:
             logger.info("Shutting down server %s..", task_id)
             # Stop server to not accept new incoming connections
@@ -2355,6 +2556,11 @@ def main() -> None:
             if "webhook" in revocation_notifier.get_notifiers():
                 revocation_notifier.shutdown_webhook_workers()
 
+            AttestationPool.get_instance().shutdown(wait=False)
+
+            # Write the pending agent changes
+            get_agent_state_writer().flush()
+
             # Wait for all connections to be closed and then stop ioloop
             async def stop() -> None:
                 await server.close_all_connections()
@@ -2369,9 +2575,18 @@ def main() -> None:
         loop.add_signal_handler(signal.SIGTERM, server_sig_handler)
 
         server.start()
+        # Write the changed agent columns periodically
+        db_write_interval = config.getfloat("verifier", "db_write_interval", fallback=DEFAULT_DB_WRITE_INTERVAL)
+        if db_write_interval > 0:
+            tornado.ioloop.PeriodicCallback(get_agent_state_writer().flush, db_write_interval * 1000).start()
+        # Report the load of the agent scheduler
+        tornado.ioloop.PeriodicCallback(
+            AgentScheduler.get_instance().log_stats, SCHEDULER_STATS_INTERVAL * 1000
+        ).start()
         # Reactivate agents
         asyncio.ensure_future(activate_agents(agents, verifier_host, int(verifier_port)))
         tornado.ioloop.IOLoop.current().start()
+        revocation_notifier.stop_publisher()
         logger.debug("Server %s stopped.", task_id)
         sys.exit(0)
 
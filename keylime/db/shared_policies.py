@@ -0,0 +1,166 @@
+"""Content-addressed storage of the policies given inline when adding agents
+
+Agents added with a runtime or measured boot policy, but without a policy
+name, used to store the policy in a row named after the agent, even when
+thousands of agents are added with the same policy. Such policies are now
+stored once, under a name derived from their checksum, and referenced by
+all the agents using them.
+
+The reference count of a shared policy is the number of agents whose
+foreign key points to it. It is maintained by the database itself and so
+can never drift from the actual references. A shared policy is deleted
+after the last agent using it.
+
+A shared policy is looked up, or stored, before the agent referencing it
+is inserted, so the last agent using it may be deleted in between, taking
+the policy with it. add_agent() therefore stores the policy again and
+retries when the insert fails on the foreign key, or when the policy is
+gone after the insert where foreign keys are not enforced. Conversely,
+release_shared_policies() keeps a policy that an agent added in the
+meantime references again.
+
+Named policies are never shared with inline ones, since they can be
+updated and deleted through the REST API.
+"""
+
+from typing import Any, Callable, Dict, NamedTuple, Optional, Type, Union
+
+from sqlalchemy import exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import ObjectDeletedError
+
+from keylime.db.verifier_db import VerfierMain, VerifierAllowlist, VerifierMbpolicy
+
+SHARED_POLICY_PREFIX = "shared:"
+
+# Maximum number of attempts to add an agent whose shared policies are deleted concurrently
+MAX_ADD_ATTEMPTS = 3
+
+PolicyModel = Union[Type[VerifierAllowlist], Type[VerifierMbpolicy]]
+
+
+class SharedPolicy(NamedTuple):
+    """The arguments of get_shared_policy() for a policy an agent is added with"""
+
+    model: PolicyModel
+    checksum: Optional[str]
+    db_contents: Callable[[str], Dict[str, Any]]
+
+
+def shared_policy_name(checksum: Optional[str]) -> str:
+    """Return the name of the shared policy with the given checksum, None for an absent policy"""
+    return f"{SHARED_POLICY_PREFIX}{checksum or 'none'}"
+
+
+def is_shared_policy_name(name: Optional[str]) -> bool:
+    return name is not None and name.startswith(SHARED_POLICY_PREFIX)
+
+
+def get_shared_policy(
+    session: Session, model: PolicyModel, checksum: Optional[str], db_contents: Callable[[str], Dict[str, Any]]
+) -> Any:
+    """Return the shared policy with the given checksum, storing it first if needed
+
+    :param session: the database session
+    :param model: VerifierAllowlist or VerifierMbpolicy
+    :param checksum: the checksum of the policy
+    :param db_contents: returns the columns of the policy to store given its name; it is only
+                        called when the policy is not stored yet
+    """
+    name = shared_policy_name(checksum)
+    stored = session.query(model).filter_by(name=name).one_or_none()
+    if stored is not None:
+        return stored
+
+    stored = model(**db_contents(name))
+    try:
+        session.add(stored)
+        session.commit()
+    except IntegrityError:
+        # Stored by another verifier in the meantime
+        session.rollback()
+        stored = session.query(model).filter_by(name=name).one()
+    return stored
+
+
+def _forget_shared_policies(session: Session, policies: Dict[str, Any], resolved: Dict[str, Any]) -> None:
+    """Remove the shared policies from the session, as they may have been deleted and are stored again"""
+    for attr, policy in policies.items():
+        if isinstance(policy, SharedPolicy) and resolved[attr] in session:
+            session.expunge(resolved[attr])
+
+
+def add_agent(
+    session: Session,
+    agent_data: Dict[str, Any],
+    ima_policy: Union[VerifierAllowlist, SharedPolicy],
+    mb_policy: Union[VerifierMbpolicy, SharedPolicy],
+) -> None:
+    """Store an agent referencing the given stored or shared policies, and commit
+
+    :param session: the database session
+    :param agent_data: the columns of the agent
+    :param ima_policy: the stored runtime policy, or the shared one to use
+    :param mb_policy: the stored measured boot policy, or the shared one to use
+    """
+    policies: Dict[str, Union[VerifierAllowlist, VerifierMbpolicy, SharedPolicy]] = {
+        "ima_policy": ima_policy,
+        "mb_policy": mb_policy,
+    }
+    for attempt in range(1, MAX_ADD_ATTEMPTS + 1):
+        resolved = {
+            attr: get_shared_policy(session, *policy) if isinstance(policy, SharedPolicy) else policy
+            for attr, policy in policies.items()
+        }
+        try:
+            shared_ids = [
+                (policy.model, resolved[attr].id)
+                for attr, policy in policies.items()
+                if isinstance(policy, SharedPolicy)
+            ]
+            session.add(VerfierMain(**agent_data, **resolved))
+            session.commit()
+        except (IntegrityError, ObjectDeletedError):
+            # Either a shared policy was deleted since it was looked up, or the insert fails
+            # for another reason, e.g. an existing agent, and so fails again
+            session.rollback()
+            if attempt == MAX_ADD_ATTEMPTS:
+                raise
+            _forget_shared_policies(session, policies, resolved)
+            continue
+
+        if all(session.query(model.id).filter_by(id=policy_id).first() is not None for model, policy_id in shared_ids):
+            return
+
+        # Foreign keys are not enforced and the agent references a deleted policy
+        session.query(VerfierMain).filter_by(agent_id=agent_data["agent_id"]).delete()
+        session.commit()
+        _forget_shared_policies(session, policies, resolved)
+
+    raise ValueError(f"Shared policies of agent {agent_data['agent_id']} were deleted while adding it")
+
+
+def release_shared_policies(session: Session, ima_policy_id: Optional[int], mb_policy_id: Optional[int]) -> None:
+    """Delete the given shared policies if no agent references them anymore, and commit
+
+    This is done in its own transaction, after the agent was deleted, so that a
+    policy referenced again by an agent added concurrently is kept instead of
+    failing the deletion of the agent.
+    """
+    for model, column, policy_id in (
+        (VerifierAllowlist, VerfierMain.ima_policy_id, ima_policy_id),
+        (VerifierMbpolicy, VerfierMain.mb_policy_id, mb_policy_id),
+    ):
+        if policy_id is None:
+            continue
+        try:
+            session.query(model).filter(
+                model.id == policy_id,
+                model.name.startswith(SHARED_POLICY_PREFIX),
+                ~exists().where(column == policy_id),
+            ).delete(synchronize_session=False)
+            session.commit()
+        except IntegrityError:
+            # Referenced by an agent added in the meantime
+            session.rollback()
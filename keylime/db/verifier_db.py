@@ -25,10 +25,10 @@ class VerfierMain(Base):
     public_key = Column(String(500))
     tpm_policy = Column(JSONPickleType(pickler=JSONPickler))
     meta_data = Column(Text().with_variant(Text(429400000), "mysql"))
-    ima_policy = relationship("VerifierAllowlist", back_populates="agent", uselist=False)
+    ima_policy = relationship("VerifierAllowlist", back_populates="agents", uselist=False)
     ima_policy_id = Column(Integer, ForeignKey("allowlists.id"))
     ima_sign_verification_keys = Column(Text().with_variant(Text(429400000), "mysql"))
-    mb_policy = relationship("VerifierMbpolicy", back_populates="agent", uselist=False)
+    mb_policy = relationship("VerifierMbpolicy", back_populates="agents", uselist=False)
     mb_policy_id = Column(Integer, ForeignKey("mbpolicies.id"))
     revocation_key = Column(String(2800))
     accept_tpm_hash_algs = Column(JSONPickleType(pickler=JSONPickler))
@@ -57,18 +57,21 @@ class VerifierAllowlist(Base):
     __tablename__ = "allowlists"
     __table_args__ = (schema.UniqueConstraint("name", name="uniq_allowlists0name"),)
     id = Column(Integer, primary_key=True)
-    agent = relationship("VerfierMain", back_populates="ima_policy")
+    agents = relationship("VerfierMain", back_populates="ima_policy")
     name = Column(String(255), nullable=False)
     checksum = Column(String(128))
     generator = Column(Integer)
     tpm_policy = Column(Text())
     ima_policy = Column(Text().with_variant(Text(429400000), "mysql"))
+    ima_policy_compiled = Column(LargeBinary().with_variant(LargeBinary(429400000), "mysql"))
+    ima_policy_delta = Column(Text().with_variant(Text(429400000), "mysql"))
 
 
 class VerifierMbpolicy(Base):
     __tablename__ = "mbpolicies"
     __table_args__ = (schema.UniqueConstraint("name", name="uniq_mbpolicies_name"),)
     id = Column(Integer, primary_key=True)
-    agent = relationship("VerfierMain", back_populates="mb_policy")
+    agents = relationship("VerfierMain", back_populates="mb_policy")
     name = Column(String(255), nullable=False)
+    checksum = Column(String(128))
     mb_policy = Column(Text().with_variant(Text(429400000), "mysql"))
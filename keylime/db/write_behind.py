@@ -0,0 +1,123 @@
+"""Write-behind buffer for the agent columns the verifier updates on every attestation
+
+The verifier keeps the authoritative state of the agents it polls in memory
+and used to write it back to the database after every state transition and
+quote, each time in its own session. The AgentStateWriter instead collects
+the changed columns per agent and writes them for all agents at once,
+either periodically or when enough agents have pending changes. Updates
+with the same set of columns are sent as a single executemany UPDATE.
+
+Rows whose operational state was changed to one of the protected states
+(e.g. TERMINATED by a tenant) in the meantime are left untouched, so that
+a delayed write never overrides such a decision.
+"""
+
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, List
+
+from sqlalchemy import bindparam
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from keylime import keylime_logging
+from keylime.db.keylime_db import SessionManager
+from keylime.db.verifier_db import VerfierMain
+
+logger = keylime_logging.init_logging("verifier")
+
+# Default number of agents with pending changes that triggers a write
+DEFAULT_BATCH_SIZE = 500
+
+_AGENT_ID_PARAM = "_agent_id"
+
+
+class AgentStateWriter:
+    def __init__(
+        self,
+        engine: Engine,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        protected_states: Iterable[int] = (),
+        enabled: bool = True,
+    ):
+        """constructor
+
+        :param engine: the engine of the verifier database
+        :param batch_size: the number of agents with pending changes that triggers a write
+        :param protected_states: the operational states of rows that must not be updated
+        :param enabled: whether to buffer the changes; if not, they are written right away
+        """
+        self.engine = engine
+        self.batch_size = batch_size
+        self.protected_states = tuple(protected_states)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.columns = frozenset(column.name for column in VerfierMain.__table__.columns)
+
+    def update(self, agent_id: str, fields: Dict[str, Any], durable: bool = False) -> None:
+        """Record changed columns of an agent
+
+        Unknown columns are ignored. If durable is set, all the pending
+        changes are written before returning.
+        """
+        changes = {key: value for key, value in fields.items() if key in self.columns and key != "agent_id"}
+        with self.lock:
+            pending = self.pending.setdefault(agent_id, {})
+            pending.update(changes)
+            num_pending = len(self.pending)
+
+        if durable or not self.enabled or num_pending >= self.batch_size:
+            self.flush()
+
+    def discard(self, agent_id: str) -> None:
+        """Drop the pending changes of an agent, e.g. because it is deleted"""
+        with self.lock:
+            self.pending.pop(agent_id, None)
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def _take_batches(self) -> List[List[Dict[str, Any]]]:
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+
+        batches: Dict[FrozenSet[str], List[Dict[str, Any]]] = {}
+        for agent_id, fields in pending.items():
+            if fields:
+                params = dict(fields)
+                params[_AGENT_ID_PARAM] = agent_id
+                batches.setdefault(frozenset(fields), []).append(params)
+        return list(batches.values())
+
+    def _restore(self, batches: List[List[Dict[str, Any]]]) -> None:
+        # Keep the changes that could not be written, newer changes take precedence
+        with self.lock:
+            for rows in batches:
+                for params in rows:
+                    fields = dict(params)
+                    agent_id = fields.pop(_AGENT_ID_PARAM)
+                    fields.update(self.pending.get(agent_id, {}))
+                    self.pending[agent_id] = fields
+
+    def flush(self) -> None:
+        """Write all pending changes"""
+        batches = self._take_batches()
+        if not batches:
+            return
+
+        table = VerfierMain.__table__
+        try:
+            with SessionManager().session_context(self.engine) as session:
+                for rows in batches:
+                    stmt = table.update().where(table.c.agent_id == bindparam(_AGENT_ID_PARAM))
+                    if self.protected_states:
+                        stmt = stmt.where(table.c.operational_state.notin_(self.protected_states))
+                    # The SET clause is derived from the columns of the parameters
+                    session.execute(stmt, rows)
+                # session.commit() is automatically called by context manager
+        except SQLAlchemyError as e:
+            logger.error(
+                "SQLAlchemy Error while writing the state of %d agents: %s", sum(len(rows) for rows in batches), e
+            )
+            self._restore(batches)
@@ -25,14 +25,17 @@ MD5_DIGEST_LEN = 16
 NULL_BYTE = ord("\0")
 COLON_BYTE = ord(":")
 
+# Serialized form of an empty variable length field
+EMPTY_FIELD = struct.pack("<I", 0)
+
 
 class Validator:
-    functions: Dict[typing.Type["Mode"], Callable[..., Failure]]
+    functions: Dict[typing.Type["Mode"], Callable[..., Optional[Failure]]]
 
-    def __init__(self, functions: Dict[typing.Type["Mode"], Callable[..., Failure]]):
+    def __init__(self, functions: Dict[typing.Type["Mode"], Callable[..., Optional[Failure]]]):
         self.functions = functions
 
-    def get_validator(self, class_type: typing.Type["Mode"]) -> Callable[..., Failure]:
+    def get_validator(self, class_type: typing.Type["Mode"]) -> Callable[..., Optional[Failure]]:
         validator = self.functions.get(class_type, None)
         if validator is None:
             logger.warning("No validator was implemented for: %s. Using always false validator!", class_type)
@@ -49,8 +52,10 @@ class ParserError(TypeError):
 
 
 class Mode(abc.ABC):
+    __slots__ = ()
+
     @abc.abstractmethod
-    def is_data_valid(self, validator: Validator) -> Failure:
+    def is_data_valid(self, validator: Validator) -> Optional[Failure]:
         pass
 
     @abc.abstractmethod
@@ -59,12 +64,16 @@ class Mode(abc.ABC):
 
 
 class Type(abc.ABC):
+    __slots__ = ()
+
     @abc.abstractmethod
     def struct(self) -> bytes:
         pass
 
 
 class HexData(Type):
+    __slots__ = ("data",)
+
     data: bytes
 
     def __init__(self, data: str):
@@ -77,7 +86,7 @@ class HexData(Type):
         return self.data.decode("utf-8")
 
     def struct(self) -> bytes:
-        return struct.pack(f"<I{len(self.data)}s", len(self.data), self.data)
+        return struct.pack("<I", len(self.data)) + self.data
 
 
 class Signature(HexData):
@@ -85,6 +94,8 @@ class Signature(HexData):
     Class for type "sig".
     """
 
+    __slots__ = ()
+
     def __init__(self, data: str):
         super().__init__(data)
         # basic checks on signature
@@ -103,14 +114,18 @@ class Buffer(HexData):
     Class for type "buf".
     """
 
+    __slots__ = ()
+
 
 class Name(Type):
     """
     Class for type "n" and "n-ng".
     """
 
+    __slots__ = ("name", "legacy")
+
     name: str
-    legacy: bool = False
+    legacy: bool
 
     def __init__(self, name: str, legacy: bool = False):
         self.name = name
@@ -131,7 +146,7 @@ class Name(Type):
                 bytearray(TCG_EVENT_NAME_LEN_MAX - len(name_bytes)),
             )
 
-        return struct.pack(f"<I{len(name_bytes)}sB", len(name_bytes) + 1, name_bytes, NULL_BYTE)
+        return struct.pack("<I", len(name_bytes) + 1) + name_bytes + b"\0"
 
 
 class Digest:
@@ -139,9 +154,11 @@ class Digest:
     Class for types "d" and "d-ng" with and without algorithm
     """
 
+    __slots__ = ("hash", "algorithm", "legacy")
+
     hash: bytes
     algorithm: str
-    legacy: bool = False
+    legacy: bool
 
     def __init__(self, digest: str, legacy: bool = False):
         self.legacy = legacy
@@ -171,20 +188,14 @@ class Digest:
     def struct(self) -> bytes:
         # The legacy format "d" has fixed length, so it does not contain a length attribute
         if self.legacy:
-            return struct.pack(f"<{len(self.hash)}s", self.hash)
+            return self.hash
 
         if self.algorithm is None:
-            return struct.pack(f"<I{len(self.hash)}s", len(self.hash), self.hash)
+            return struct.pack("<I", len(self.hash)) + self.hash
         # After the ':' must be a '\O':
         # https://elixir.bootlin.com/linux/v5.12.10/source/security/integrity/ima/ima_template_lib.c#L230
-        return struct.pack(
-            f"<I{len(self.algorithm)}sBB{len(self.hash)}s",
-            len(self.algorithm) + 2 + len(self.hash),
-            self.algorithm.encode("utf-8"),
-            COLON_BYTE,
-            NULL_BYTE,
-            self.hash,
-        )
+        algorithm = self.algorithm.encode("utf-8")
+        return struct.pack("<I", len(algorithm) + 2 + len(self.hash)) + algorithm + b":\0" + self.hash
 
     def __eq__(self, other: Any) -> bool:
         return (
@@ -200,6 +211,8 @@ class Ima(Mode):
     Class for "ima". Contains the digest and a path.
     """
 
+    __slots__ = ("digest", "path")
+
     digest: Digest
     path: Name
 
@@ -213,7 +226,7 @@ class Ima(Mode):
     def bytes(self) -> bytes:
         return self.digest.struct() + self.path.struct()
 
-    def is_data_valid(self, validator: Validator) -> Failure:
+    def is_data_valid(self, validator: Validator) -> Optional[Failure]:
         return validator.get_validator(type(self))(self.digest, self.path)
 
 
@@ -222,6 +235,8 @@ class ImaNg(Mode):
     Class for "ima-ng". Contains the digest and a path.
     """
 
+    __slots__ = ("digest", "path")
+
     digest: Digest
     path: Name
 
@@ -235,7 +250,7 @@ class ImaNg(Mode):
     def bytes(self) -> bytes:
         return self.digest.struct() + self.path.struct()
 
-    def is_data_valid(self, validator: Validator) -> Failure:
+    def is_data_valid(self, validator: Validator) -> Optional[Failure]:
         return validator.get_validator(type(self))(self.digest, self.path)
 
 
@@ -244,9 +259,11 @@ class ImaSig(Mode):
     Class for "ima-sig" template. Nearly the same as ImaNg but can contain a optional signature.
     """
 
+    __slots__ = ("digest", "path", "signature")
+
     digest: Digest
     path: Name
-    signature: Optional[Signature] = None
+    signature: Optional[Signature]
 
     def __init__(self, data: str):
         # There are always 3 fields in a valid entry, because:
@@ -278,12 +295,12 @@ class ImaSig(Mode):
         output = self.digest.struct() + self.path.struct()
         # If no signature is there we sill have to add the entry for it
         if self.signature is None:
-            output += struct.pack("<I0s", 0, b"")
+            output += EMPTY_FIELD
         else:
             output += self.signature.struct()
         return output
 
-    def is_data_valid(self, validator: Validator) -> Failure:
+    def is_data_valid(self, validator: Validator) -> Optional[Failure]:
         return validator.get_validator(type(self))(self.digest, self.path, self.signature)
 
 
@@ -293,6 +310,8 @@ class ImaBuf(Mode):
     For validation the buffer must be done based on the name because IMA only provides it as an byte array.
     """
 
+    __slots__ = ("digest", "name", "data")
+
     digest: Digest
     name: Name
     data: Buffer
@@ -316,7 +335,7 @@ class ImaBuf(Mode):
     def bytes(self) -> bytes:
         return self.digest.struct() + self.name.struct() + self.data.struct()
 
-    def is_data_valid(self, validator: Validator) -> Failure:
+    def is_data_valid(self, validator: Validator) -> Optional[Failure]:
         return validator.get_validator(type(self))(self.digest, self.name, self.data)
 
 
@@ -325,6 +344,17 @@ class Entry:
     IMA Entry. Contains the PCR, template hash and mode.
     """
 
+    __slots__ = (
+        "pcr",
+        "ima_template_hash",
+        "pcr_template_hash",
+        "mode",
+        "_bytes",
+        "_validator",
+        "_ima_hash_alg",
+        "_pcr_hash_alg",
+    )
+
     pcr: str
     ima_template_hash: bytes
     pcr_template_hash: bytes
@@ -374,23 +404,40 @@ class Entry:
             self.pcr_template_hash = pcr_hash_alg.get_ff_hash()
 
     def invalid(self) -> Failure:
+        failure = Entry.invalid_pcr(self.pcr)
+        measurement_failure = self.invalid_measurement()
+        if measurement_failure is not None:
+            failure.merge(measurement_failure)
+        return failure
+
+    @staticmethod
+    def invalid_pcr(pcr: str) -> Failure:
+        """Check that the entry was extended into the configured IMA PCR"""
         failure = Failure(Component.IMA, ["validation"])
-        if self.pcr != str(config.IMA_PCR):
-            logger.warning("IMA entry PCR does not match %s. It was: %s", config.IMA_PCR, self.pcr)
+        if pcr != str(config.IMA_PCR):
+            logger.warning("IMA entry PCR does not match %s. It was: %s", config.IMA_PCR, pcr)
             failure.add_event(
                 "ima_pcr",
-                {"message": "IMA PCR is not the configured one", "expected": str(config.IMA_PCR), "got": self.pcr},
+                {"message": "IMA PCR is not the configured one", "expected": str(config.IMA_PCR), "got": pcr},
                 True,
             )
+        return failure
 
+    def invalid_measurement(self) -> Optional[Failure]:
+        """Check the template hash and validate the measurement; the PCR is not checked
+
+        None is returned if the measurement is valid.
+        """
         # Ignore template hash for ToMToU errors
         if self.ima_template_hash == self._ima_hash_alg.get_ff_hash():
             logger.warning("Skipped template_hash validation entry with FF_HASH")
+            failure = Failure(Component.IMA, ["validation"])
             # By default ToMToU errors are not treated as a failure
             if config.getboolean("verifier", "ignore_tomtou_errors", fallback=True):
                 failure.add_event("tomtou", "hash validation was skipped", True)
             return failure
         if self.ima_template_hash != self._ima_hash_alg.hash(self._bytes):
+            failure = Failure(Component.IMA, ["validation"])
             failure.add_event(
                 "ima_hash",
                 {
@@ -402,8 +449,9 @@ class Entry:
             )
             return failure
         if self._validator is None:
+            failure = Failure(Component.IMA, ["validation"])
             failure.add_event("no_validator", "No validator specified", True)
             return failure
 
-        failure.merge(self.mode.is_data_valid(self._validator))
-        return failure
+        # The result of the validator is returned as is instead of being merged into a new Failure
+        return self.mode.is_data_valid(self._validator)
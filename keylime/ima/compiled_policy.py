@@ -0,0 +1,293 @@
+"""Immutable, pre-processed form of a runtime policy
+
+Parsing a runtime policy and compiling its exclude list is expensive for large
+policies, while the result only depends on the policy content. The
+CompiledRuntimePolicy holds the pre-processed form so that it can be computed
+once and shared, read-only, by every agent using the same policy.
+"""
+
+import copy
+import string
+import sys
+from types import MappingProxyType
+from typing import AbstractSet, Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Pattern, Tuple, Union
+
+from keylime import keylime_logging
+from keylime.common import algorithms, validators
+from keylime.ima.types import Policies, RuntimePolicyType
+
+logger = keylime_logging.init_logging("ima")
+
+DigestMapType = Mapping[str, AbstractSet[bytes]]
+
+_EMPTY_DIGESTS: FrozenSet[bytes] = frozenset()
+
+# Characters that have a special meaning in a regular expression unless escaped
+_REGEX_METACHARACTERS = frozenset(".^$*+?{}[]|()\\")
+
+# Escaped characters that stand for a class or a back-reference instead of themselves
+_REGEX_ESCAPES = frozenset(string.ascii_letters + string.digits)
+
+
+def _to_digest_set(hashes: Iterable[str]) -> FrozenSet[bytes]:
+    digests = set()
+    for value in hashes:
+        try:
+            digests.add(bytes.fromhex(value))
+        except ValueError:
+            # A measured digest can never match it anyway
+            logger.warning("Ignoring invalid digest %s in runtime policy", value)
+    return frozenset(digests)
+
+
+def _freeze_digests(digests: Optional[Dict[str, List[str]]]) -> DigestMapType:
+    if not digests:
+        return MappingProxyType({})
+    return MappingProxyType({sys.intern(path): _to_digest_set(hashes) for path, hashes in digests.items()})
+
+
+def _literal_prefix(pattern: str) -> Optional[str]:
+    """Return the prefix matched by an exclude pattern, or None if it is a real regular expression
+
+    Since exclude patterns are matched at the beginning of the path only,
+    "literal", "^literal" and "literal.*" all match exactly the paths that
+    start with "literal".
+    """
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+    if pattern.endswith(".*") and not pattern.endswith("\\.*"):
+        pattern = pattern[:-2]
+
+    prefix: List[str] = []
+    escaped = False
+    for c in pattern:
+        if escaped:
+            if c in _REGEX_ESCAPES:
+                return None
+            prefix.append(c)
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c in _REGEX_METACHARACTERS:
+            return None
+        else:
+            prefix.append(c)
+    if escaped:
+        return None
+    return "".join(prefix)
+
+
+class ExcludeMatcher:
+    """Matcher for the exclude list of a runtime policy
+
+    Exclude entries that are plain path prefixes are stored in a prefix
+    trie, so that checking a path costs at most one lookup per character of
+    the longest matching prefix no matter how many entries there are. The
+    remaining entries are real regular expressions and are combined into a
+    single one, like validators.valid_exclude_list() does.
+    """
+
+    __slots__ = ("trie", "regex")
+
+    # Key marking the end of a prefix in a trie node
+    END = ""
+
+    trie: Optional[Dict[str, Any]]
+    regex: Optional[Pattern[str]]
+
+    def __init__(self, prefixes: List[str], regex: Optional[Pattern[str]]):
+        self.trie = None
+        if prefixes:
+            self.trie = {}
+            for prefix in prefixes:
+                node = self.trie
+                for c in prefix:
+                    node = node.setdefault(c, {})
+                node[ExcludeMatcher.END] = True
+        self.regex = regex
+
+    @staticmethod
+    def compile(excludes: List[str]) -> Tuple[Optional["ExcludeMatcher"], Optional[str]]:
+        """Compile the exclude list, returning an error message if it is not valid"""
+        # The whole list must be valid, as before, even if parts of it end up in the trie
+        _, err_msg = validators.valid_exclude_list(excludes)
+        if err_msg or not excludes:
+            return None, err_msg
+
+        prefixes: List[str] = []
+        patterns: List[str] = []
+        for pattern in excludes:
+            prefix = _literal_prefix(pattern)
+            if prefix is None:
+                patterns.append(pattern)
+            else:
+                prefixes.append(prefix)
+
+        regex, err_msg = validators.valid_exclude_list(patterns)
+        if err_msg:
+            return None, err_msg
+        return ExcludeMatcher(prefixes, regex), None
+
+    def match(self, path: str) -> bool:
+        """Check whether the path is excluded"""
+        node = self.trie
+        if node is not None:
+            if ExcludeMatcher.END in node:
+                return True
+            for c in path:
+                node = node.get(c)
+                if node is None:
+                    break
+                if ExcludeMatcher.END in node:
+                    return True
+
+        return self.regex is not None and self.regex.match(path) is not None
+
+
+class CompiledRuntimePolicy:
+    """Read-only view of a runtime policy prepared for IMA log validation
+
+    The digest lists are stored as frozensets of raw digests indexed by
+    interned paths, the exclude list is compiled into an ExcludeMatcher and
+    the IMA specific settings are resolved. Instances must not be modified
+    after creation since they are shared between agents.
+    """
+
+    __slots__ = (
+        "checksum",
+        "digests",
+        "keyrings",
+        "ima_buf",
+        "excludes",
+        "exclude_matcher",
+        "ignored_keyrings",
+        "log_hash_alg",
+        "dm_policy",
+        "verification_keys",
+        "size",
+        "source",
+        "_boot_aggregates",
+    )
+
+    checksum: str
+    digests: DigestMapType
+    keyrings: DigestMapType
+    ima_buf: DigestMapType
+    excludes: Tuple[str, ...]
+    exclude_matcher: Optional[ExcludeMatcher]
+    ignored_keyrings: FrozenSet[str]
+    log_hash_alg: algorithms.Hash
+    dm_policy: Optional[Policies]
+    verification_keys: str
+    size: int
+    source: Optional[str]
+    _boot_aggregates: FrozenSet[bytes]
+
+    def __init__(self, runtime_policy: RuntimePolicyType, checksum: str = "", size: int = 0):
+        self.checksum = checksum
+        self.digests = _freeze_digests(runtime_policy.get("digests"))
+        self.keyrings = _freeze_digests(runtime_policy.get("keyrings"))
+        self.ima_buf = _freeze_digests(runtime_policy.get("ima-buf"))
+        self.excludes = tuple(runtime_policy.get("excludes") or [])
+
+        exclude_matcher, err_msg = ExcludeMatcher.compile(list(self.excludes))
+        if err_msg:
+            # This should not happen as the exclude list has already been validated
+            # by the verifier before acceping it. This is a safety net just in case.
+            err_msg += " Exclude list will be ignored."
+            logger.error(err_msg)
+        self.exclude_matcher = exclude_matcher
+
+        ima_settings: Dict[str, Any] = dict(runtime_policy.get("ima") or {})
+        self.ignored_keyrings = frozenset(ima_settings.get("ignored_keyrings") or [])
+
+        self.log_hash_alg = algorithms.Hash.SHA1
+        log_hash_alg = ima_settings.get("log_hash_alg")
+        if log_hash_alg is not None:
+            try:
+                self.log_hash_alg = algorithms.Hash(log_hash_alg)
+            except ValueError:
+                logger.warning(
+                    "Specified IMA log hash algorithm %s is not a valid algorithm! Defaulting to SHA1.",
+                    log_hash_alg,
+                )
+
+        self.dm_policy = ima_settings.get("dm_policy")
+        self.verification_keys = runtime_policy.get("verification-keys") or ""
+        self.size = size
+        self.source = None
+        self._boot_aggregates = _EMPTY_DIGESTS
+
+    def __copy__(self) -> "CompiledRuntimePolicy":
+        # Share the compiled data with the copy
+        clone = CompiledRuntimePolicy.__new__(CompiledRuntimePolicy)
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        return clone
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = {name: getattr(self, name) for name in self.__slots__}
+        for name in ("digests", "keyrings", "ima_buf"):
+            # Digests of mapped policies are sent as a reference to their file
+            if isinstance(state[name], MappingProxyType):
+                state[name] = dict(state[name])
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            if name in ("digests", "keyrings", "ima_buf") and isinstance(value, dict):
+                value = MappingProxyType(value)
+            setattr(self, name, value)
+
+    def get_digests(self, hash_types: str, name: str) -> Optional[AbstractSet[bytes]]:
+        """Return the accepted raw digests for the given name
+
+        The hash_types selects the section of the policy and is one of
+        "digests", "keyrings" or "ima-buf". None is returned if the policy
+        has no entry for the name.
+        """
+        if hash_types == "keyrings":
+            return self.keyrings.get(name)
+        if hash_types == "ima-buf":
+            return self.ima_buf.get(name)
+
+        accept_list = self.digests.get(name)
+        if name == "boot_aggregate" and self._boot_aggregates:
+            if accept_list is None:
+                return self._boot_aggregates
+            return accept_list | self._boot_aggregates
+        return accept_list
+
+    def with_boot_aggregates(self, boot_aggregates: Optional[Dict[str, List[str]]]) -> "CompiledRuntimePolicy":
+        """Return a view of this policy that also accepts the given boot aggregates
+
+        The shared policy is left untouched; the returned object shares all
+        the compiled data with it.
+        """
+        if not boot_aggregates:
+            return self
+
+        extra = _to_digest_set(val for values in boot_aggregates.values() for val in values)
+        if extra <= self._boot_aggregates:
+            return self
+
+        return CompiledRuntimePolicy._overlay(self, self._boot_aggregates | extra)
+
+    @classmethod
+    def _overlay(cls, policy: "CompiledRuntimePolicy", boot_aggregates: FrozenSet[bytes]) -> "CompiledRuntimePolicy":
+        """Return a copy of the policy sharing its compiled data, with the given boot aggregates"""
+        overlay = copy.copy(policy)
+        overlay._boot_aggregates = boot_aggregates  # pylint: disable=protected-access
+        return overlay
+
+
+RuntimePolicyInputType = Union[RuntimePolicyType, CompiledRuntimePolicy]
+
+
+def compile_runtime_policy(
+    runtime_policy: RuntimePolicyInputType, checksum: str = "", size: int = 0
+) -> CompiledRuntimePolicy:
+    """Compile the runtime policy, returning already compiled policies as they are"""
+    if isinstance(runtime_policy, CompiledRuntimePolicy):
+        return runtime_policy
+    return CompiledRuntimePolicy(runtime_policy, checksum=checksum, size=size)
@@ -0,0 +1,86 @@
+"""Process-wide memo of IMA entry validation results
+
+Machines installed from the same image measure the same files with the same
+digests, so the verifier sees identical IMA log entries from many agents.
+The validation of an entry against a runtime policy only depends on the
+policy and on the entry itself, apart from the PCR it was extended into.
+The ImaEntryCache remembers the template hash used to replay the PCR and
+the validation result of such entries, keyed by the policy checksum, the PCR
+bank algorithm and the entry without its PCR field, so that only the PCR
+replay has to be done for every agent.
+
+Only entries whose result does not depend on agent specific state may be
+added to the cache, see ima._process_measurement_list().
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Type
+
+from keylime import config
+from keylime.common.algorithms import Hash
+from keylime.failure import Failure
+from keylime.ima import ast
+
+# Default maximum number of cached entries
+DEFAULT_CACHE_SIZE = 200000
+
+EntryKeyType = Tuple[str, Hash, str]
+
+# The template of the entry, its template hash for the PCR bank and the validation failure, if any
+EntryResultType = Tuple[Type[ast.Mode], bytes, Optional[Failure]]
+
+
+class ImaEntryCache:
+    instance: Optional["ImaEntryCache"] = None
+
+    @staticmethod
+    def get_instance() -> "ImaEntryCache":
+        """Create and return a singleton ImaEntryCache"""
+        if ImaEntryCache.instance is None:
+            max_entries = config.getint("verifier", "ima_entry_cache_size", fallback=DEFAULT_CACHE_SIZE)
+            ImaEntryCache.instance = ImaEntryCache(max_entries)
+        return ImaEntryCache.instance
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        """constructor
+
+        :param max_entries: the maximum number of cached entries; 0 disables the cache
+        """
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[EntryKeyType, EntryResultType]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: EntryKeyType) -> Optional[EntryResultType]:
+        """Return the cached result for the entry, if any
+
+        The returned failure is shared and must not be modified; it can be
+        merged into another failure.
+        """
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return result
+
+    def add(self, key: EntryKeyType, result: EntryResultType) -> None:
+        """Add the result for an entry, evicting the least recently used entries if needed"""
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
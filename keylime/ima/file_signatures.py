@@ -1,5 +1,7 @@
 import base64
 import enum
+import functools
+import hashlib
 import json
 import struct
 from typing import Any, Dict, List, Optional, Tuple, Union
@@ -17,12 +19,16 @@ from cryptography.x509 import Certificate, oid
 from cryptography.x509.extensions import ExtensionNotFound, SubjectKeyIdentifier
 
 from keylime import keylime_logging
+from keylime.ima.signature_cache import VerifiedSignatureCache
 
 logger = keylime_logging.init_logging("file_signatures")
 
 
 SupportedKeyTypes = Union[RSAPublicKey, EllipticCurvePublicKey]
 
+# Maximum number of distinct keyrings kept loaded by get_shared_keyring()
+SHARED_KEYRING_CACHE_SIZE = 1024
+
 IMA_KEYRING_JSON_SCHEMA = {
     "type": "object",
     "required": ["keyids", "pubkeys"],
@@ -121,10 +127,13 @@ class ImaKeyring:
     """ImaKeyring models an IMA keyring where keys are indexed by their keyid"""
 
     ringv2: Dict[int, SupportedKeyTypes]
+    generation: int
 
     def __init__(self) -> None:
         """Constructor"""
         self.ringv2 = {}
+        # Incremented on every change so that users can tell when the keys changed
+        self.generation = 0
 
     @staticmethod
     def _get_keyidv2(pubkey: SupportedKeyTypes) -> int:
@@ -147,6 +156,12 @@ class ImaKeyring:
         keydigest = digest.finalize()
         return int.from_bytes(keydigest[16:], "big")
 
+    @staticmethod
+    def get_fingerprint(pubkey: SupportedKeyTypes) -> bytes:
+        """Calculate the sha256 hash over the DER-encoded SubjectPublicKeyInfo of a public key object"""
+        fmt = serialization.PublicFormat.SubjectPublicKeyInfo
+        return hashlib.sha256(pubkey.public_bytes(encoding=serialization.Encoding.DER, format=fmt)).digest()
+
     def add_pubkey(self, pubkey: SupportedKeyTypes, keyidv2: Optional[int]) -> None:
         """Add a public key object to the keyring; a keyidv2 may be passed in
         and if it is 'None' it will be determined using the commonly used
@@ -156,12 +171,19 @@ class ImaKeyring:
             keyidv2 = ImaKeyring._get_keyidv2(pubkey)
         # it's unlikely that two different public keys have the same 32 bit keyidv2
         self.ringv2[keyidv2] = pubkey
+        self.generation += 1
         logger.debug("Added key with keyid: 0x%08x", keyidv2)
 
     def get_pubkey_by_keyidv2(self, keyidv2: int) -> Optional[SupportedKeyTypes]:
         """Get a public key object given its keyidv2"""
         return self.ringv2.get(keyidv2)
 
+    def copy(self) -> "ImaKeyring":
+        """Create a copy of the keyring that can be modified independently"""
+        ima_keyring = ImaKeyring()
+        ima_keyring.ringv2 = dict(self.ringv2)
+        return ima_keyring
+
     def to_json(self) -> Dict[str, Union[List[int], List[str]]]:
         """Convert the ImaKeyring into a JSON object"""
         fmt = serialization.PublicFormat.SubjectPublicKeyInfo
@@ -240,6 +262,8 @@ class ImaKeyrings:
     def __init__(self) -> None:
         """Constructor"""
         self.keyrings = {}
+        self._keyid_index: Dict[int, Tuple[SupportedKeyTypes, bytes]] = {}
+        self._keyid_index_stamp: Tuple[Tuple[ImaKeyring, int], ...] = ()
 
     def add_to_keyring_from_data(self, filedata: bytes, keyring_name: str) -> None:
         """Add the public key, given as a plain filedata (bytes), to the keyring by the given name
@@ -258,6 +282,10 @@ class ImaKeyrings:
         if not keyring:
             keyring = ImaKeyring()
             self.keyrings[keyring_name] = keyring
+        elif keyring_name == "tenant_keyring":
+            # The tenant keyring may be shared with other agents, see get_shared_keyring()
+            keyring = keyring.copy()
+            self.keyrings[keyring_name] = keyring
         keyring.add_pubkey(pubkey, keyidv2)
 
     def set_tenant_keyring(self, tenant_keyring: Optional[ImaKeyring]) -> None:
@@ -314,6 +342,22 @@ class ImaKeyrings:
 
         return ima_keyrings
 
+    def get_pubkey_by_keyidv2(self, keyidv2: int) -> Optional[Tuple[SupportedKeyTypes, bytes]]:
+        """Get a public key object and its fingerprint given its keyidv2 from the first keyring
+        holding a key with that keyidv2
+        """
+        # The keyrings may be modified directly, so the index is rebuilt whenever one of them changed
+        stamp = tuple((keyring, keyring.generation) for keyring in self.keyrings.values())
+        if stamp != self._keyid_index_stamp:
+            index: Dict[int, Tuple[SupportedKeyTypes, bytes]] = {}
+            for keyring in self.keyrings.values():
+                for keyid, pubkey in keyring.ringv2.items():
+                    if keyid not in index:
+                        index[keyid] = (pubkey, ImaKeyring.get_fingerprint(pubkey))
+            self._keyid_index = index
+            self._keyid_index_stamp = stamp
+        return self._keyid_index.get(keyidv2)
+
     @staticmethod
     def _verify(pubkey: SupportedKeyTypes, sig: bytes, filehash: bytes, hashfunc: hashes.HashAlgorithm) -> None:
         """Do signature verification with the given public key"""
@@ -355,21 +399,23 @@ class ImaKeyrings:
             logger.warning("Mismatching filehash type %s and ima signature hash used %s", filehash_type, hashfunc.name)
             return False
 
-        # Try all the keyrings until we find one with a key with the given keyidv2
-        pubkey = None
-        for keyring in self.get_all_keyrings():
-            pubkey = keyring.get_pubkey_by_keyidv2(keyidv2)
-            if pubkey:
-                break
-
-        if not pubkey:
+        key = self.get_pubkey_by_keyidv2(keyidv2)
+        if not key:
             logger.warning("No key with id 0x%08x available", keyidv2)
             return False
+        pubkey, fingerprint = key
+
+        # The same signatures are seen again and again, so only verify them once per key
+        cache = VerifiedSignatureCache.get_instance()
+        cache_key = (fingerprint, filehash, signature)
+        if cache.contains(cache_key):
+            return True
 
         try:
             ImaKeyrings._verify(pubkey, signature[hdrlen:], filehash, hashfunc)
         except InvalidSignature:
             return False
+        cache.add(cache_key)
         return True
 
     def integrity_digsig_verify(self, signature: bytes, filehash: bytes, filehash_type: str) -> bool:
@@ -394,6 +440,17 @@ class ImaKeyrings:
         return False
 
 
+@functools.lru_cache(maxsize=SHARED_KEYRING_CACHE_SIZE)
+def get_shared_keyring(stringrepr: str) -> Optional[ImaKeyring]:
+    """Convert a string-encoded ImaKeyring to an ImaKeyring object shared by all callers
+
+    Loading the keys of a keyring is expensive, while the same keyring, e.g.
+    the verification keys of a runtime policy, is used for every quote of
+    many agents. The returned keyring must not be modified.
+    """
+    return ImaKeyring.from_string(stringrepr)
+
+
 def _get_pubkey_from_der_public_key(filedata: bytes, backend: Any) -> Tuple[Any, None]:
     """Load the filedata as a DER public key"""
     try:
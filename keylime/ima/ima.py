@@ -3,7 +3,8 @@ import enum
 import functools
 import hashlib
 import json
-from typing import Any, Dict, List, Optional, Pattern, Tuple, Type
+import re
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Type
 
 import jsonschema
 
@@ -14,7 +15,15 @@ from keylime.common.algorithms import Hash
 from keylime.dsse import dsse
 from keylime.failure import Component, Failure
 from keylime.ima import ast, file_signatures, ima_dm
+from keylime.ima.compiled_policy import (
+    CompiledRuntimePolicy,
+    ExcludeMatcher,
+    RuntimePolicyInputType,
+    compile_runtime_policy,
+)
+from keylime.ima.entry_cache import ImaEntryCache
 from keylime.ima.file_signatures import IMA_KEYRING_JSON_SCHEMA, ImaKeyrings
+from keylime.ima.policy_artifact import serialize_policy
 from keylime.ima.types import RuntimePolicyType
 
 logger = keylime_logging.init_logging("ima")
@@ -105,102 +114,105 @@ RUNTIME_POLICY_SCHEMA = {
 
 
 def _validate_ima_ng(
-    exclude_regex: Optional[Pattern[str]],
-    runtime_policy: Optional[RuntimePolicyType],
+    exclude_matcher: Optional[ExcludeMatcher],
+    runtime_policy: Optional[CompiledRuntimePolicy],
     digest: ast.Digest,
     path: ast.Name,
     hash_types: str = "digests",
-) -> Failure:
-    failure = Failure(Component.IMA, ["validation", "ima-ng"])
+) -> Optional[Failure]:
     if runtime_policy is not None:
-        if exclude_regex is not None and exclude_regex.match(path.name):
+        if exclude_matcher is not None and exclude_matcher.match(path.name):
             logger.debug("IMA: ignoring excluded path %s", path)
-            return failure
+            return None
 
-        accept_list = runtime_policy[hash_types].get(path.name, None)  # type: ignore
+        accept_list = runtime_policy.get_digests(hash_types, path.name)
         if accept_list is None:
             logger.warning("File not found in allowlist: %s", path.name)
+            failure = Failure(Component.IMA, ["validation", "ima-ng"])
             failure.add_event("not_in_allowlist", f"File not found in allowlist: {path.name}", True)
             return failure
 
-        hex_hash = digest.hash.hex()
-        if hex_hash not in accept_list:
+        if digest.hash not in accept_list:
+            hex_hash = digest.hash.hex()
+            expected = sorted(value.hex() for value in accept_list)
             logger.warning(
                 "Hashes for file %s don't match %s not in %s",
                 path.name,
                 hex_hash,
-                str(accept_list),
+                str(expected),
             )
+            failure = Failure(Component.IMA, ["validation", "ima-ng"])
             failure.add_event(
                 "runtime_policy_hash",
                 {
                     "message": "Hash not found in runtime policy",
                     "got": hex_hash,
-                    "expected": accept_list,
+                    "expected": expected,
                 },
                 True,
             )
             return failure
 
-    return failure
+    return None
 
 
 def _validate_ima_sig(
-    exclude_regex: Optional[Pattern[str]],
+    exclude_matcher: Optional[ExcludeMatcher],
     ima_keyrings: Optional[file_signatures.ImaKeyrings],
-    runtime_policy: Optional[RuntimePolicyType],
+    runtime_policy: Optional[CompiledRuntimePolicy],
     digest: ast.Digest,
     path: ast.Name,
     signature: ast.Signature,
-) -> Failure:
-    failure = Failure(Component.IMA, ["validator", "ima-sig"])
+) -> Optional[Failure]:
     if ima_keyrings and signature:
-        if exclude_regex is not None and exclude_regex.match(path.name):
+        if exclude_matcher is not None and exclude_matcher.match(path.name):
             logger.debug("IMA: ignoring excluded path %s", path.name)
-            return failure
+            return None
 
         if ima_keyrings.integrity_digsig_verify(signature.data, digest.hash, digest.algorithm):
             logger.debug("signature for file %s is good", path)
-            return failure
+            return None
 
     # If signature validation failed check if the runtime_policy matches
     if runtime_policy is not None:
         logger.debug("signature for file %s could not be validated. Trying runtime_policy.", path.name)
-        return _validate_ima_ng(exclude_regex, runtime_policy, digest, path)
+        return _validate_ima_ng(exclude_matcher, runtime_policy, digest, path)
 
     # If we don't have a runtime_policy and don't have a keyring we just ignore the validation.
     if ima_keyrings is None:
-        return failure
+        return None
 
     logger.warning("signature verification for file %s failed and no runtime_policy is available", path.name)
+    failure = Failure(Component.IMA, ["validator", "ima-sig"])
     failure.add_event("invalid_signature", f"signature for file {path.name} could not be validated", True)
     return failure
 
 
 def _validate_ima_buf(
-    exclude_regex: Optional[Pattern[str]],
-    runtime_policy: Optional[RuntimePolicyType],
+    exclude_matcher: Optional[ExcludeMatcher],
+    runtime_policy: Optional[CompiledRuntimePolicy],
     ima_keyrings: Optional[file_signatures.ImaKeyrings],
     dm_validator: Optional[ima_dm.DmIMAValidator],
     digest: ast.Digest,
     path: ast.Name,
     data: ast.Buffer,
-) -> Failure:
-    failure = Failure(Component.IMA)
+) -> Optional[Failure]:
+    failure: Optional[Failure] = None
     # Is data.data a key?
     try:
         pubkey, keyidv2 = file_signatures.get_pubkey(data.data)
     except ValueError as ve:
+        failure = Failure(Component.IMA)
         failure.add_event("invalid_key", f"key from {path.name} does not have a supported key: {ve}", True)
         return failure
 
     if pubkey:
-        ignored_keyrings = []
+        ignored_keyrings: FrozenSet[str] = frozenset()
         if runtime_policy:
-            ignored_keyrings = runtime_policy.get("ima", {}).get("ignored_keyrings", [])
+            ignored_keyrings = runtime_policy.ignored_keyrings
 
         if "*" not in ignored_keyrings and path.name not in ignored_keyrings:
-            failure = _validate_ima_ng(exclude_regex, runtime_policy, digest, path, hash_types="keyrings")
+            failure = _validate_ima_ng(exclude_matcher, runtime_policy, digest, path, hash_types="keyrings")
             if not failure:
                 # Add the key only now that it's validated (no failure)
                 if ima_keyrings is not None:
@@ -210,17 +222,66 @@ def _validate_ima_buf(
         failure = dm_validator.validate(digest, path, data)
     else:
         # handling of generic ima-buf entries that for example carry a hash in the buf field
-        failure = _validate_ima_ng(exclude_regex, runtime_policy, digest, path, hash_types="ima-buf")
+        failure = _validate_ima_ng(exclude_matcher, runtime_policy, digest, path, hash_types="ima-buf")
 
     # Anything else evaluates to true for now
     return failure
 
 
+def iterate_measurement_list(ima_measurement_list: str) -> Iterator[str]:
+    """Iterate over the lines of an IMA measurement list
+
+    The lines are the same as those of ima_measurement_list.split("\n"), but
+    they are produced one at a time instead of building the list of all the
+    lines of a possibly very long log at once.
+    """
+    start = 0
+    while True:
+        end = ima_measurement_list.find("\n", start)
+        if end < 0:
+            yield ima_measurement_list[start:]
+            return
+        yield ima_measurement_list[start:end]
+        start = end + 1
+
+
+def _is_entry_shareable(
+    entry: ast.Entry,
+    exclude_matcher: Optional[ExcludeMatcher],
+    runtime_policy: CompiledRuntimePolicy,
+    measurement_failure: Optional[Failure],
+) -> bool:
+    """Check whether the validation result of the entry only depends on the entry and the runtime policy
+
+    ima-buf entries may add keys to the keyrings of the agent or update its
+    device mapper state, and boot_aggregate entries are validated against
+    the boot aggregates of the agent. The result for signed ima-sig entries
+    depends on the keyrings of the agent unless the policy alone accepts them.
+    """
+    mode = entry.mode
+    if isinstance(mode, ast.ImaBuf):
+        return False
+
+    assert isinstance(mode, (ast.Ima, ast.ImaNg, ast.ImaSig))
+    if mode.path.name == "boot_aggregate":
+        return False
+
+    if isinstance(mode, ast.ImaSig) and mode.signature:
+        if measurement_failure:
+            return False
+        if exclude_matcher is not None and exclude_matcher.match(mode.path.name):
+            return True
+        accept_list = runtime_policy.get_digests("digests", mode.path.name)
+        return accept_list is not None and mode.digest.hash in accept_list
+
+    return True
+
+
 def _process_measurement_list(
     agentAttestState: Optional[AgentAttestState],
-    lines: List[str],
+    lines: Iterable[str],
     hash_alg: Hash,
-    runtime_policy: Optional[RuntimePolicyType] = None,
+    runtime_policy: Optional[CompiledRuntimePolicy] = None,
     pcrval: Optional[str] = None,
     ima_keyrings: Optional[ImaKeyrings] = None,
     boot_aggregates: Optional[Dict[str, List[str]]] = None,
@@ -239,43 +300,19 @@ def _process_measurement_list(
     if pcrval is not None:
         pcrval_bytes = bytes.fromhex(pcrval)
 
-    if runtime_policy is not None:
-        exclude_list = runtime_policy.get("excludes")
-    else:
-        exclude_list = None
-
     ima_log_hash_alg = algorithms.Hash.SHA1
-    if runtime_policy is not None:
-        try:
-            ima_log_hash_alg = algorithms.Hash(runtime_policy["ima"]["log_hash_alg"])
-        except ValueError:
-            logger.warning(
-                "Specified IMA log hash algorithm %s is not a valid algorithm! Defaulting to SHA1.",
-                runtime_policy["ima"]["log_hash_alg"],
-            )
-
-    if boot_aggregates and runtime_policy:
-        if "boot_aggregate" not in runtime_policy["digests"]:
-            runtime_policy["digests"]["boot_aggregate"] = []
-        for alg in boot_aggregates.keys():
-            for val in boot_aggregates[alg]:
-                if val not in runtime_policy["digests"]["boot_aggregate"]:
-                    runtime_policy["digests"]["boot_aggregate"].append(val)
-
-    exclude_list_compiled_regex, err_msg = validators.valid_exclude_list(exclude_list)
-    if err_msg:
-        # This should not happen as the exclude list has already been validated
-        # by the verifier before acceping it. This is a safety net just in case.
-        err_msg += " Exclude list will be ignored."
-        logger.error(err_msg)
-
-    # Setup device mapper validation
+    exclude_matcher = None
     dm_validator = None
     if runtime_policy is not None:
-        dm_policy = runtime_policy["ima"]["dm_policy"]
+        ima_log_hash_alg = runtime_policy.log_hash_alg
+        exclude_matcher = runtime_policy.exclude_matcher
+
+        # The compiled policy is shared, so the boot aggregates are added to a private view of it
+        runtime_policy = runtime_policy.with_boot_aggregates(boot_aggregates)
 
-        if dm_policy is not None:
-            dm_validator = ima_dm.DmIMAValidator(dm_policy)
+        # Setup device mapper validation
+        if runtime_policy.dm_policy is not None:
+            dm_validator = ima_dm.DmIMAValidator(runtime_policy.dm_policy)
             if agentAttestState is not None:
                 dm_state = agentAttestState.get_ima_dm_state()
                 # Only load state when using incremental attestation
@@ -284,17 +321,24 @@ def _process_measurement_list(
 
     ima_validator = ast.Validator(
         {
-            ast.ImaSig: functools.partial(_validate_ima_sig, exclude_list_compiled_regex, ima_keyrings, runtime_policy),
-            ast.ImaNg: functools.partial(_validate_ima_ng, exclude_list_compiled_regex, runtime_policy),
-            ast.Ima: functools.partial(_validate_ima_ng, exclude_list_compiled_regex, runtime_policy),
+            ast.ImaSig: functools.partial(_validate_ima_sig, exclude_matcher, ima_keyrings, runtime_policy),
+            ast.ImaNg: functools.partial(_validate_ima_ng, exclude_matcher, runtime_policy),
+            ast.Ima: functools.partial(_validate_ima_ng, exclude_matcher, runtime_policy),
             ast.ImaBuf: functools.partial(
-                _validate_ima_buf, exclude_list_compiled_regex, runtime_policy, ima_keyrings, dm_validator
+                _validate_ima_buf, exclude_matcher, runtime_policy, ima_keyrings, dm_validator
             ),
         }
     )
 
+    entry_cache = None
+    if runtime_policy is not None and runtime_policy.checksum:
+        entry_cache = ImaEntryCache.get_instance()
+        if not entry_cache.enabled:
+            entry_cache = None
+
     pcr_match_line = -1
     log_length = 0
+    ima_pcr = str(config.IMA_PCR)
 
     # Iterative attestation may send us no log [len(lines) == 1]; compare last know PCR 10 state
     # against current PCR state.
@@ -317,16 +361,41 @@ def _process_measurement_list(
         log_length += 1
 
         try:
-            entry = ast.Entry(line, ima_validator, ima_hash_alg=ima_log_hash_alg, pcr_hash_alg=hash_alg)
+            # The validation of the measurement does not depend on the PCR, so the
+            # result for the rest of the line can be shared between agents
+            pcr, _, measurement = line.partition(" ")
+            cache_key = None
+            cached = None
+            if entry_cache is not None:
+                assert runtime_policy is not None
+                cache_key = (runtime_policy.checksum, hash_alg, measurement)
+                cached = entry_cache.get(cache_key)
+
+            if cached is not None:
+                mode_type, pcr_template_hash, measurement_failure = cached
+            else:
+                entry = ast.Entry(line, ima_validator, ima_hash_alg=ima_log_hash_alg, pcr_hash_alg=hash_alg)
+                mode_type = type(entry.mode)
+                pcr_template_hash = entry.pcr_template_hash
+                measurement_failure = entry.invalid_measurement()
+                if entry_cache is not None and cache_key is not None:
+                    assert runtime_policy is not None
+                    if _is_entry_shareable(entry, exclude_matcher, runtime_policy, measurement_failure):
+                        entry_cache.add(cache_key, (mode_type, pcr_template_hash, measurement_failure or None))
 
             # update hash
-            running_hash = hash_alg.hash(running_hash + entry.pcr_template_hash)
+            running_hash = hash_alg.hash(running_hash + pcr_template_hash)
 
-            validation_failure = entry.invalid()
+            # Only create a new Failure if the PCR is wrong
+            validation_failure = measurement_failure
+            if pcr != ima_pcr:
+                validation_failure = ast.Entry.invalid_pcr(pcr)
+                if measurement_failure is not None:
+                    validation_failure.merge(measurement_failure)
 
             if validation_failure:
                 failure.merge(validation_failure)
-                errors[type(entry.mode)] = errors.get(type(entry.mode), 0) + 1
+                errors[mode_type] = errors.get(mode_type, 0) + 1
 
             if not found_pcr:
                 # End of list should equal pcr value
@@ -341,7 +410,7 @@ def _process_measurement_list(
 
                     # We always want to have the very last line for the attestation, so
                     # we keep the previous runninghash, which is not the last one!
-                    agentAttestState.update_ima_attestation(int(entry.pcr), running_hash, linenum + 1)
+                    agentAttestState.update_ima_attestation(int(pcr), running_hash, linenum + 1)
                     if dm_validator:
                         agentAttestState.set_ima_dm_state(dm_validator.state_dump())
 
@@ -368,8 +437,8 @@ def _process_measurement_list(
 
 def process_measurement_list(
     agentAttestState: Optional[AgentAttestState],
-    lines: List[str],
-    runtime_policy: Optional[RuntimePolicyType] = None,
+    lines: Iterable[str],
+    runtime_policy: Optional[RuntimePolicyInputType] = None,
     pcrval: Optional[str] = None,
     ima_keyrings: Optional[ImaKeyrings] = None,
     boot_aggregates: Optional[Dict[str, List[str]]] = None,
@@ -381,7 +450,7 @@ def process_measurement_list(
             agentAttestState,
             lines,
             hash_alg,
-            runtime_policy=runtime_policy,
+            runtime_policy=compile_runtime_policy(runtime_policy) if runtime_policy is not None else None,
             pcrval=pcrval,
             ima_keyrings=ima_keyrings,
             boot_aggregates=boot_aggregates,
@@ -456,8 +525,17 @@ def read_runtime_policy(
     return alist_bytes, al_key
 
 
-def runtime_policy_db_contents(runtime_policy_name: str, runtime_policy: str, tpm_policy: str = "") -> Dict[str, Any]:
-    """Assembles a runtime policy dictionary to be written on the database"""
+def runtime_policy_db_contents(
+    runtime_policy_name: str,
+    runtime_policy: str,
+    tpm_policy: str = "",
+    runtime_policy_dict: Optional[RuntimePolicyType] = None,
+) -> Dict[str, Any]:
+    """Assembles a runtime policy dictionary to be written on the database
+
+    The runtime_policy_dict is the deserialized runtime policy, if the
+    caller has deserialized and validated it already.
+    """
     runtime_policy_db_format: Dict[str, Any] = {}
     runtime_policy_db_format["name"] = runtime_policy_name
     # TODO: This was required to ensure e2e CI tests pass
@@ -466,9 +544,17 @@ def runtime_policy_db_contents(runtime_policy_name: str, runtime_policy: str, tp
     else:
         runtime_policy_db_format["ima_policy"] = runtime_policy
     runtime_policy_bytes = runtime_policy.encode()
-    runtime_policy_dict = deserialize_runtime_policy(runtime_policy)
+    if runtime_policy_dict is None:
+        runtime_policy_dict = deserialize_runtime_policy(runtime_policy)
+        validate_runtime_policy(runtime_policy_dict)
+
+    # A new policy replaces the delta of the previous one, see policy_delta
+    runtime_policy_db_format["ima_policy_delta"] = None
 
-    validate_runtime_policy(runtime_policy_dict)
+    # Compile the policy once here instead of in every verifier process using it
+    runtime_policy_db_format["ima_policy_compiled"] = None
+    if runtime_policy_db_format["ima_policy"] is not None:
+        runtime_policy_db_format["ima_policy_compiled"] = serialize_policy(dict(runtime_policy_dict))
 
     if "meta" in runtime_policy_dict:
         if "generator" in runtime_policy_dict["meta"]:
@@ -556,12 +642,47 @@ def deserialize_runtime_policy(runtime_policy: str | None) -> RuntimePolicyType:
     return runtime_policy_deserialized
 
 
+_DIGEST_PATTERN = re.compile(
+    RUNTIME_POLICY_SCHEMA["definitions"]["digests-object"]["patternProperties"]["^"]["items"]["pattern"]  # type: ignore[index]
+)
+
+
+def invalid_digests(digests: Any) -> Any:
+    """Return the entries of a digests object that do not match the digests-object schema
+
+    The digests sections of large policies hold hundreds of thousands of
+    paths, which jsonschema takes seconds to check one patternProperties
+    match at a time. Checking them here in a single pass and leaving only
+    the invalid entries to jsonschema gives the same error messages.
+    Anything that is not a dictionary is returned as is.
+    """
+    if not isinstance(digests, dict):
+        return digests
+
+    search = _DIGEST_PATTERN.search
+    invalid = {}
+    for path, values in digests.items():
+        if not isinstance(values, list) or not values:
+            invalid[path] = values
+            continue
+        for value in values:
+            if not isinstance(value, str) or search(value) is None:
+                invalid[path] = values
+                break
+    return invalid
+
+
 def validate_runtime_policy(runtime_policy: RuntimePolicyType) -> None:
     """
     Validate a runtime policy against the schema.
     """
     try:
-        jsonschema.validate(instance=runtime_policy, schema=RUNTIME_POLICY_SCHEMA)
+        # Only the invalid digests and the remaining, small, fields are validated by jsonschema
+        instance: Dict[str, Any] = dict(runtime_policy)
+        for section in ("digests", "keyrings", "ima-buf"):
+            if section in instance:
+                instance[section] = invalid_digests(instance[section])
+        jsonschema.validate(instance=instance, schema=RUNTIME_POLICY_SCHEMA)
         verification_keys = runtime_policy.get("verification-keys", "")
         if verification_keys:
             # Verification keys is a string in JSON format. Parse it to verify
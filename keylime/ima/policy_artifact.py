@@ -0,0 +1,310 @@
+"""Compiled artifact of a runtime policy
+
+A runtime policy may hold millions of digests, and parsing and validating
+its JSON form is expensive. The artifact is a compact binary form of the
+compiled policy that is built once, when the policy is uploaded, and that
+the verifier processes use without parsing it: the digests are looked up in
+place, whether the artifact is held in memory or mapped from a file.
+
+Layout, all integers are native 64 bit values aligned to 8 bytes:
+
+    magic | metadata offset | metadata length
+    for each of "digests", "keyrings" and "ima-buf":
+        path offsets    (paths + 1 entries, into the artifact)
+        digest starts   (paths + 1 entries, into the digest offsets)
+        digest offsets  (digests + 1 entries, into the artifact)
+        path strings, sorted by their UTF-8 encoding
+        digests, sorted per path
+    metadata            (JSON: the remaining policy fields and the section offsets)
+
+Paths are looked up by binary search in the path table, and digests by
+binary search in the digests of the path. Artifacts written on a machine
+with a different byte order are rejected, so that the policy is compiled
+from its JSON form instead.
+"""
+
+import array
+import json
+import mmap
+import struct
+import sys
+import threading
+import weakref
+from collections.abc import Mapping, Set
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from keylime import keylime_logging
+from keylime.ima.compiled_policy import CompiledRuntimePolicy
+
+logger = keylime_logging.init_logging("ima")
+
+MAGIC = b"KLRTPOL1"
+
+BufferType = Union[bytes, mmap.mmap]
+
+_T = TypeVar("_T")
+
+_HEADER = struct.Struct("=8sQQ")
+
+# The sections of the policy that are stored as digest indexes, and the matching CompiledRuntimePolicy attributes
+SECTIONS = {"digests": "digests", "keyrings": "keyrings", "ima-buf": "ima_buf"}
+
+_OFFSET_SIZE = array.array("Q").itemsize
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class PolicyArtifactError(Exception):
+    pass
+
+
+def _offsets(buf: BufferType, start: int, count: int) -> memoryview:
+    end = start + count * _OFFSET_SIZE
+    if start % _OFFSET_SIZE or end > len(buf):
+        raise PolicyArtifactError("offset table out of bounds")
+    return memoryview(buf)[start:end].cast("Q")
+
+
+class MappedDigestSet(Set):  # type: ignore[type-arg]
+    """Read-only set of the raw digests of one path, kept in the artifact"""
+
+    __slots__ = ("_section", "_start", "_end")
+
+    def __init__(self, section: "MappedDigestMap", start: int, end: int):
+        self._section = section
+        self._start = start
+        self._end = end
+
+    @classmethod
+    def _from_iterable(cls, it: Iterable[_T]) -> FrozenSet[_T]:
+        # Results of set operations are regular frozensets
+        return frozenset(it)
+
+    def _digest(self, index: int) -> bytes:
+        offsets = self._section.digest_offsets
+        return self._section.buf[offsets[index] : offsets[index + 1]]
+
+    def __contains__(self, value: object) -> bool:
+        if not isinstance(value, bytes):
+            return False
+        lo, hi = self._start, self._end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            digest = self._digest(mid)
+            if digest == value:
+                return True
+            if digest < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return False
+
+    def __iter__(self) -> Iterator[bytes]:
+        for index in range(self._start, self._end):
+            yield self._digest(index)
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __repr__(self) -> str:
+        return f"MappedDigestSet({sorted(self)!r})"
+
+
+class MappedDigestMap(Mapping):  # type: ignore[type-arg]
+    """Read-only mapping of paths to MappedDigestSets for one section of an artifact"""
+
+    def __init__(self, artifact: "PolicyArtifact", name: str, layout: Dict[str, int]):
+        self.artifact = artifact
+        self.name = name
+        self.buf = artifact.buf
+        self.count = layout["paths"]
+
+        self.path_offsets = _offsets(artifact.buf, layout["path_offsets"], self.count + 1)
+        self.digest_starts = _offsets(artifact.buf, layout["digest_starts"], self.count + 1)
+        self.digest_offsets = _offsets(artifact.buf, layout["digest_offsets"], layout["digests"] + 1)
+
+    def __reduce__(self) -> Tuple[Any, Tuple["PolicyArtifact", str]]:
+        # The artifact is pickled once for all its sections
+        return (_get_section, (self.artifact, self.name))
+
+    def _path(self, index: int) -> bytes:
+        return self.buf[self.path_offsets[index] : self.path_offsets[index + 1]]
+
+    def _find(self, path: str) -> int:
+        key = path.encode("utf-8", "surrogatepass")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self._path(mid)
+            if value == key:
+                return mid
+            if value < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return -1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        index = self._find(key)
+        if index < 0:
+            return default
+        return MappedDigestSet(self, self.digest_starts[index], self.digest_starts[index + 1])
+
+    def __getitem__(self, key: str) -> MappedDigestSet:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value  # type: ignore[no-any-return]
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._find(key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(self.count):
+            yield self._path(index).decode("utf-8", "surrogatepass")
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class PolicyArtifact:
+    """A compiled runtime policy artifact, held in memory or mapped read-only from a file"""
+
+    def __init__(self, buf: BufferType, filename: Optional[str] = None):
+        """constructor
+
+        :param buf: the content of the artifact
+        :param filename: the file the content is mapped from, if any
+        """
+        self.buf = buf
+        self.filename = filename
+        source = filename or "Runtime policy artifact"
+
+        try:
+            magic, metadata_offset, metadata_length = _HEADER.unpack_from(buf, 0)
+            if magic != MAGIC:
+                raise PolicyArtifactError(f"{source} is not a compiled runtime policy")
+            self.metadata = json.loads(buf[metadata_offset : metadata_offset + metadata_length])
+            if self.metadata["byteorder"] != sys.byteorder:
+                raise PolicyArtifactError(f"{source} was written on a machine with a different byte order")
+            # Only the part that is not shared with other processes counts for mapped artifacts
+            self.size = metadata_length if filename is not None else len(buf)
+            self.sections = {
+                name: MappedDigestMap(self, name, layout) for name, layout in self.metadata["sections"].items()
+            }
+        except (struct.error, ValueError, KeyError, TypeError) as e:
+            raise PolicyArtifactError(f"{source} is not a valid compiled runtime policy: {e}") from e
+
+    @staticmethod
+    def open(filename: str) -> "PolicyArtifact":
+        """Map the artifact stored in a file"""
+        with open(filename, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return PolicyArtifact(buf, filename)
+
+    def __reduce__(self) -> Tuple[Any, Tuple[Any, ...]]:
+        # Processes receiving a mapped artifact map the file themselves
+        if self.filename is not None:
+            return (open_artifact, (self.filename,))
+        return (PolicyArtifact, (bytes(self.buf),))
+
+    def compile(self, checksum: str) -> CompiledRuntimePolicy:
+        """Return a compiled runtime policy whose digests are looked up in the artifact"""
+        settings = {name: value for name, value in self.metadata.items() if name not in ("byteorder", "sections")}
+        compiled = CompiledRuntimePolicy(settings, checksum, self.size)  # type: ignore[arg-type]
+        for name, attribute in SECTIONS.items():
+            setattr(compiled, attribute, self.sections[name])
+        return compiled
+
+
+# Files mapped by this process, so that policies unpickled from other processes share them
+_mapped_files: "weakref.WeakValueDictionary[str, PolicyArtifact]" = weakref.WeakValueDictionary()
+_mapped_files_lock = threading.Lock()
+
+
+def open_artifact(filename: str) -> PolicyArtifact:
+    """Map the artifact stored in a file, sharing the mapping with other users in this process
+
+    Raises OSError if the file cannot be mapped and PolicyArtifactError if
+    its content is not a valid artifact.
+    """
+    with _mapped_files_lock:
+        artifact = _mapped_files.get(filename)
+        if artifact is None:
+            try:
+                artifact = PolicyArtifact.open(filename)
+            except ValueError as e:
+                # mmap() refuses empty files
+                raise PolicyArtifactError(f"{filename} is not a valid compiled runtime policy: {e}") from e
+            _mapped_files[filename] = artifact
+        return artifact
+
+
+def _get_section(artifact: PolicyArtifact, name: str) -> "MappedDigestMap":
+    return artifact.sections[name]
+
+
+def _write_section(out: bytearray, digests: Dict[str, List[str]]) -> Dict[str, int]:
+    entries: List[Tuple[bytes, List[bytes]]] = []
+    for path, hashes in digests.items():
+        raw_digests: List[bytes] = []
+        for value in hashes:
+            try:
+                raw_digests.append(bytes.fromhex(value))
+            except ValueError:
+                logger.warning("Ignoring invalid digest %s in runtime policy", value)
+        entries.append((path.encode("utf-8", "surrogatepass"), sorted(set(raw_digests))))
+    entries.sort()
+
+    path_offsets = array.array("Q")
+    digest_starts = array.array("Q")
+    digest_offsets = array.array("Q")
+    num_digests = sum(len(values) for _, values in entries)
+
+    layout = {"paths": len(entries), "digests": num_digests}
+    layout["path_offsets"] = _align(len(out))
+    layout["digest_starts"] = layout["path_offsets"] + (len(entries) + 1) * _OFFSET_SIZE
+    layout["digest_offsets"] = layout["digest_starts"] + (len(entries) + 1) * _OFFSET_SIZE
+    offset = layout["digest_offsets"] + (num_digests + 1) * _OFFSET_SIZE
+
+    for encoded_path, _ in entries:
+        path_offsets.append(offset)
+        offset += len(encoded_path)
+    path_offsets.append(offset)
+
+    for _, sorted_digests in entries:
+        digest_starts.append(len(digest_offsets))
+        for digest in sorted_digests:
+            digest_offsets.append(offset)
+            offset += len(digest)
+    digest_starts.append(len(digest_offsets))
+    digest_offsets.append(offset)
+
+    out.extend(bytes(layout["path_offsets"] - len(out)))
+    out.extend(path_offsets.tobytes())
+    out.extend(digest_starts.tobytes())
+    out.extend(digest_offsets.tobytes())
+    for encoded_path, _ in entries:
+        out.extend(encoded_path)
+    for _, sorted_digests in entries:
+        for digest in sorted_digests:
+            out.extend(digest)
+    return layout
+
+
+def serialize_policy(runtime_policy: Dict[str, Any]) -> bytes:
+    """Return the compiled artifact of a deserialized runtime policy"""
+    out = bytearray(_HEADER.size)
+    metadata = {name: value for name, value in runtime_policy.items() if name not in SECTIONS}
+    metadata["byteorder"] = sys.byteorder
+    metadata["sections"] = {}
+    for name in SECTIONS:
+        metadata["sections"][name] = _write_section(out, runtime_policy.get(name) or {})
+
+    metadata_offset = len(out)
+    encoded = json.dumps(metadata).encode()
+    out.extend(encoded)
+    _HEADER.pack_into(out, 0, MAGIC, metadata_offset, len(encoded))
+    return bytes(out)
@@ -0,0 +1,193 @@
+"""Process-wide cache of compiled runtime policies
+
+Runtime policies are content addressed by their checksum. Agents attested
+against the same policy share a single CompiledRuntimePolicy, so a large
+policy is parsed once per verifier process instead of once per agent and
+quote. The cache is bounded by an approximate byte budget and evicts the
+least recently used policies first.
+
+Policies are built from the compiled artifact stored along with them when
+there is one, and large policies are mapped from the RuntimePolicyStore when
+it is enabled, so that their digests are shared by all the verifier
+processes.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from keylime import config, keylime_logging
+from keylime.ima import ima, policy_delta
+from keylime.ima.compiled_policy import CompiledRuntimePolicy
+from keylime.ima.policy_artifact import PolicyArtifact, PolicyArtifactError
+from keylime.ima.policy_store import RuntimePolicyStore
+
+logger = keylime_logging.init_logging("ima")
+
+# Default budget for the cached policies, in bytes
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+class RuntimePolicyCache:
+    instance: Optional["RuntimePolicyCache"] = None
+
+    @staticmethod
+    def get_instance() -> "RuntimePolicyCache":
+        """Create and return a singleton RuntimePolicyCache"""
+        if RuntimePolicyCache.instance is None:
+            max_size = config.getint("verifier", "runtime_policy_cache_size", fallback=DEFAULT_CACHE_SIZE)
+            RuntimePolicyCache.instance = RuntimePolicyCache(max_size, store=RuntimePolicyStore.get_instance())
+        return RuntimePolicyCache.instance
+
+    def __init__(
+        self, max_size: int = DEFAULT_CACHE_SIZE, keep_source: bool = False, store: Optional[RuntimePolicyStore] = None
+    ):
+        """constructor
+
+        :param max_size: the approximate number of bytes the cached policies may use
+        :param keep_source: whether to keep the serialized policy in the cached entries
+        :param store: the store to map large policies from, if any
+        """
+        self.max_size = max_size
+        self.keep_source = keep_source
+        self.store = store
+        self.size = 0
+        self.lock = threading.Lock()
+        self.policies: "OrderedDict[str, CompiledRuntimePolicy]" = OrderedDict()
+
+    @staticmethod
+    def _key(runtime_policy: str, checksum: Optional[str]) -> str:
+        if checksum and checksum != "None":
+            return checksum
+        return hashlib.sha256(runtime_policy.encode()).hexdigest()
+
+    def lookup(self, checksum: Optional[str]) -> Optional[CompiledRuntimePolicy]:
+        """Return the cached policy with the given checksum, if any
+
+        This allows callers to avoid loading the serialized policy when it
+        is already present in the cache.
+        """
+        if not checksum or checksum == "None":
+            return None
+
+        with self.lock:
+            compiled = self.policies.get(checksum)
+            if compiled is not None:
+                self.policies.move_to_end(checksum)
+                return compiled
+
+        # Stored policies do not keep their serialized form
+        if self.store is None or self.keep_source:
+            return None
+
+        compiled = self.store.load(checksum)
+        if compiled is None:
+            return None
+        return self.add(compiled)
+
+    def get(
+        self, runtime_policy: str, checksum: Optional[str] = None, artifact: Optional[bytes] = None
+    ) -> CompiledRuntimePolicy:
+        """Return the compiled form of the serialized runtime policy
+
+        The policy is looked up by its checksum, and is only compiled if it is
+        not present in the cache yet. The compiled artifact of the policy is
+        used if one is given and valid; otherwise the policy is deserialized.
+        Raises the same exceptions as ima.deserialize_runtime_policy() for
+        invalid policies.
+        """
+        key = RuntimePolicyCache._key(runtime_policy, checksum)
+
+        with self.lock:
+            compiled = self.policies.get(key)
+            if compiled is not None:
+                self.policies.move_to_end(key)
+                return compiled
+
+        logger.debug("Runtime policy with checksum %s not present in the policy cache, compiling it", key)
+
+        # Compile outside the lock; a concurrent compile of the same policy is harmless
+        compiled = None
+        if self.store is not None:
+            compiled = self.store.get(runtime_policy, key, artifact)
+        if compiled is None and artifact is not None:
+            try:
+                compiled = PolicyArtifact(artifact).compile(key)
+            except PolicyArtifactError as e:
+                logger.warning("Ignoring compiled artifact of runtime policy with checksum %s: %s", key, e)
+        if compiled is None:
+            compiled = CompiledRuntimePolicy(ima.deserialize_runtime_policy(runtime_policy), key, len(runtime_policy))
+        if self.keep_source:
+            compiled.source = runtime_policy
+
+        return self.add(compiled)
+
+    def apply_delta(self, checksum: str, delta: str) -> Optional[CompiledRuntimePolicy]:
+        """Return the policy with the given checksum, built from the cached policy the delta applies to
+
+        None is returned if the policy the delta applies to is not cached;
+        the caller then has to load the updated policy. See policy_delta for
+        the format of the serialized delta.
+        """
+        # Policies built from a delta do not keep their serialized form
+        if self.keep_source:
+            return None
+
+        delta_dict = json.loads(delta)
+        base = self.lookup(delta_dict.get("base_checksum"))
+        if base is None:
+            return None
+
+        logger.debug("Applying delta to runtime policy with checksum %s", base.checksum)
+        return self.add(policy_delta.apply_delta_compiled(base, delta_dict, checksum, len(delta)))
+
+    def add(self, compiled: CompiledRuntimePolicy) -> CompiledRuntimePolicy:
+        """Add a policy compiled elsewhere to the cache under its checksum
+
+        If a policy with the same checksum is cached already, that policy
+        is returned instead.
+        """
+        key = compiled.checksum
+
+        with self.lock:
+            cached = self.policies.get(key)
+            if cached is not None:
+                self.policies.move_to_end(key)
+                return cached
+
+            if compiled.size > self.max_size:
+                logger.warning(
+                    "Runtime policy with checksum %s (%d bytes) exceeds the policy cache size, not caching it",
+                    key,
+                    compiled.size,
+                )
+                return compiled
+
+            self.policies[key] = compiled
+            self.size += compiled.size
+            while self.size > self.max_size:
+                evicted_key, evicted = self.policies.popitem(last=False)
+                self.size -= evicted.size
+                logger.debug("Evicted runtime policy with checksum %s from the policy cache", evicted_key)
+
+        return compiled
+
+    def invalidate(self, checksum: str) -> None:
+        """Remove the policy with the given checksum from the cache"""
+        with self.lock:
+            compiled = self.policies.pop(checksum, None)
+            if compiled is not None:
+                self.size -= compiled.size
+
+    def clear(self) -> None:
+        with self.lock:
+            self.policies.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.policies)
+
+    def __contains__(self, checksum: str) -> bool:
+        return checksum in self.policies
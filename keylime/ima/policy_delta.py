@@ -0,0 +1,246 @@
+"""Incremental updates of runtime policies
+
+A runtime policy delta adds and removes digests, keyrings, ima-buf entries
+and excludes of a stored runtime policy:
+
+    {
+        "base_checksum": "<checksum of the policy the delta applies to>",
+        "digests": {"add": {"/usr/bin/dd": ["<hex>", ...]}, "remove": {"/usr/bin/cat": ["<hex>", ...]}},
+        "keyrings": {"add": {...}, "remove": {...}},
+        "ima-buf": {"add": {...}, "remove": {...}},
+        "excludes": {"add": ["<regex>", ...], "remove": ["<regex>", ...]}
+    }
+
+All the fields are optional. Removals are applied before additions, and a
+path whose last digest is removed is removed from the policy. Applying a
+delta increments the release of the policy.
+
+Only the delta is validated, the stored policy was validated when it was
+uploaded. Policies that have already been compiled by a verifier process
+are updated with the same delta instead of being compiled again, see
+apply_delta_compiled().
+"""
+
+import copy
+import json
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import AbstractSet, Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+import jsonschema
+
+from keylime.common import validators
+from keylime.ima import ima
+from keylime.ima.compiled_policy import CompiledRuntimePolicy, DigestMapType, ExcludeMatcher
+from keylime.ima.types import RuntimePolicyType
+
+# The sections of the policy holding digests, and the matching CompiledRuntimePolicy attributes
+DIGEST_SECTIONS = {"digests": "digests", "keyrings": "keyrings", "ima-buf": "ima_buf"}
+
+_DIGESTS_OBJECT = ima.RUNTIME_POLICY_SCHEMA["definitions"]["digests-object"]  # type: ignore[index]
+
+_EXCLUDES_ARRAY = {"type": "array", "items": {"type": "string"}}
+
+RUNTIME_POLICY_DELTA_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "properties": {
+        "base_checksum": {"type": "string"},
+        "digests": {"$ref": "#/definitions/digests-delta"},
+        "keyrings": {"$ref": "#/definitions/digests-delta"},
+        "ima-buf": {"$ref": "#/definitions/digests-delta"},
+        "excludes": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {"add": _EXCLUDES_ARRAY, "remove": _EXCLUDES_ARRAY},
+        },
+    },
+    "definitions": {
+        "digests-object": _DIGESTS_OBJECT,
+        "digests-delta": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {
+                "add": {"$ref": "#/definitions/digests-object"},
+                "remove": {"$ref": "#/definitions/digests-object"},
+            },
+        },
+    },
+}
+
+
+def validate_delta(delta: Dict[str, Any]) -> None:
+    """Validate a runtime policy delta against the schema"""
+    try:
+        instance = dict(delta)
+        for section in DIGEST_SECTIONS:
+            if isinstance(instance.get(section), dict):
+                instance[section] = {
+                    operation: ima.invalid_digests(value) if operation in ("add", "remove") else value
+                    for operation, value in instance[section].items()
+                }
+        jsonschema.validate(instance=instance, schema=RUNTIME_POLICY_DELTA_SCHEMA)
+    except Exception as error:
+        msg = str(error).split("\n", 1)[0]
+        raise ima.ImaValidationError(message=f"{msg}", code=400) from error
+
+    _, err_msg = validators.valid_exclude_list(delta.get("excludes", {}).get("add"))
+    if err_msg:
+        raise ima.ImaValidationError(message=err_msg, code=400)
+
+
+def _apply_digests(digests: Dict[str, List[str]], delta: Dict[str, Dict[str, List[str]]]) -> Dict[str, List[str]]:
+    digests = dict(digests)
+    for path, hashes in delta.get("remove", {}).items():
+        if path not in digests:
+            continue
+        remaining = [value for value in digests[path] if value not in hashes]
+        if remaining:
+            digests[path] = remaining
+        else:
+            del digests[path]
+    for path, hashes in delta.get("add", {}).items():
+        current = digests.get(path, [])
+        digests[path] = current + [value for value in dict.fromkeys(hashes) if value not in current]
+    return digests
+
+
+def apply_delta(runtime_policy: RuntimePolicyType, delta: Dict[str, Any]) -> RuntimePolicyType:
+    """Return the runtime policy with the delta applied; the given policy is not modified"""
+    updated = copy.copy(runtime_policy)
+    if "digests" in delta:
+        updated["digests"] = _apply_digests(runtime_policy.get("digests") or {}, delta["digests"])
+    if "keyrings" in delta:
+        updated["keyrings"] = _apply_digests(runtime_policy.get("keyrings") or {}, delta["keyrings"])
+    if "ima-buf" in delta:
+        updated["ima-buf"] = _apply_digests(runtime_policy.get("ima-buf") or {}, delta["ima-buf"])
+
+    if "excludes" in delta:
+        removed = set(delta["excludes"].get("remove", []))
+        excludes = [value for value in runtime_policy.get("excludes") or [] if value not in removed]
+        excludes += [value for value in dict.fromkeys(delta["excludes"].get("add", [])) if value not in excludes]
+        updated["excludes"] = excludes
+
+    updated["release"] = runtime_policy.get("release", 0) + 1
+    return updated
+
+
+def runtime_policy_delta_db_contents(
+    runtime_policy_name: str, runtime_policy: str, checksum: str, delta: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Apply a delta to a stored runtime policy and assemble the changes to write on the database
+
+    :param runtime_policy_name: the name of the stored policy
+    :param runtime_policy: the serialized stored policy
+    :param checksum: the checksum of the stored policy
+    :param delta: the validated delta
+    """
+    if delta.get("base_checksum", checksum) != checksum:
+        raise ima.ImaValidationError(
+            message=f"Runtime policy {runtime_policy_name} has changed, its checksum is now {checksum}", code=409
+        )
+    stored: Dict[str, Any] = json.loads(runtime_policy) if runtime_policy else {}
+    if not stored or stored.get("payload"):
+        # The signature of a DSSE envelope would not match the updated policy
+        raise ima.ImaValidationError(
+            message=f"Runtime policy {runtime_policy_name} is empty or signed and can only be replaced", code=400
+        )
+
+    updated = apply_delta(stored, delta)  # type: ignore[arg-type]
+    _, err_msg = validators.valid_exclude_list(updated.get("excludes"))
+    if err_msg:
+        raise ima.ImaValidationError(message=err_msg, code=400)
+
+    runtime_policy_db_format = ima.runtime_policy_db_contents(
+        runtime_policy_name, json.dumps(updated), runtime_policy_dict=updated
+    )
+    # Let verifier processes holding the previous policy apply the delta themselves
+    runtime_policy_db_format["ima_policy_delta"] = json.dumps({**delta, "base_checksum": checksum})
+    return runtime_policy_db_format
+
+
+class OverlayDigestMap(Mapping):  # type: ignore[type-arg]
+    """Read-only view of a digest map with some paths replaced or removed"""
+
+    def __init__(self, base: DigestMapType, changes: Dict[str, Optional[FrozenSet[bytes]]]):
+        """constructor
+
+        :param base: the digest map of the base policy
+        :param changes: the new digests of the changed paths, None for removed paths
+        """
+        self.base = base
+        self.changes = changes
+
+    def __reduce__(self) -> Tuple[Any, Tuple[DigestMapType, Dict[str, Optional[FrozenSet[bytes]]]]]:
+        base = dict(self.base) if isinstance(self.base, MappingProxyType) else self.base
+        return (OverlayDigestMap, (base, self.changes))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.changes:
+            value = self.changes[key]
+            return default if value is None else value
+        return self.base.get(key, default)
+
+    def __getitem__(self, key: str) -> AbstractSet[bytes]:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value  # type: ignore[no-any-return]
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key) is not None  # type: ignore[arg-type]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.base:
+            if key not in self.changes:
+                yield key
+        for key, value in self.changes.items():
+            if value is not None:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def _apply_digests_compiled(digests: DigestMapType, delta: Dict[str, Dict[str, List[str]]]) -> DigestMapType:
+    changes: Dict[str, Optional[FrozenSet[bytes]]] = {}
+    base = digests
+    if isinstance(digests, OverlayDigestMap):
+        # Do not stack overlays
+        changes.update(digests.changes)
+        base = digests.base
+
+    for path in set(delta.get("remove", {})) | set(delta.get("add", {})):
+        current = digests.get(path) or frozenset()
+        removed = frozenset(bytes.fromhex(value) for value in delta.get("remove", {}).get(path, []))
+        added = frozenset(bytes.fromhex(value) for value in delta.get("add", {}).get(path, []))
+        value = (frozenset(current) - removed) | added
+        changes[path] = value or None
+    return OverlayDigestMap(base, changes)
+
+
+def apply_delta_compiled(
+    compiled: CompiledRuntimePolicy, delta: Dict[str, Any], checksum: str, size: int = 0
+) -> CompiledRuntimePolicy:
+    """Return a compiled policy with the delta applied, sharing the unchanged data with the given policy
+
+    :param compiled: the compiled policy the delta applies to
+    :param delta: the validated delta
+    :param checksum: the checksum of the updated policy
+    :param size: the size added to the size of the given policy
+    """
+    updated = copy.copy(compiled)
+    updated.checksum = checksum
+    updated.size = compiled.size + size
+    updated.source = None
+    for section, attribute in DIGEST_SECTIONS.items():
+        if section in delta:
+            setattr(updated, attribute, _apply_digests_compiled(getattr(compiled, attribute), delta[section]))
+
+    if "excludes" in delta:
+        removed = set(delta["excludes"].get("remove", []))
+        excludes = [value for value in compiled.excludes if value not in removed]
+        excludes += [value for value in dict.fromkeys(delta["excludes"].get("add", [])) if value not in excludes]
+        updated.excludes = tuple(excludes)
+        updated.exclude_matcher, _ = ExcludeMatcher.compile(excludes)
+    return updated
@@ -0,0 +1,111 @@
+"""Memory-mapped store of compiled runtime policies
+
+Every verifier worker process, and every attestation process of a worker,
+holds its own copy of the runtime policies it uses, which multiplies the
+memory used by large policies by the number of processes. When a store
+directory is configured, the compiled artifacts of large policies are
+written once per checksum into a read-only file of that directory, which all
+the processes then map into memory, see policy_artifact. The pages of the
+file are shared through the page cache, so the memory used scales with the
+number of distinct policies instead of the number of processes.
+
+Files are named after the SHA-256 of the policy checksum and are never
+modified once written; since policies are content addressed, stale files
+only use disk space and may be removed while the verifier is stopped.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from keylime import config, keylime_logging
+from keylime.ima import ima
+from keylime.ima.compiled_policy import CompiledRuntimePolicy
+from keylime.ima.policy_artifact import PolicyArtifactError, open_artifact, serialize_policy
+
+logger = keylime_logging.init_logging("ima")
+
+# Default minimum size of a serialized policy for it to be mapped, in bytes
+DEFAULT_MIN_POLICY_SIZE = 1024 * 1024
+
+
+class RuntimePolicyStore:
+    instance: Optional["RuntimePolicyStore"] = None
+
+    @staticmethod
+    def get_instance() -> "RuntimePolicyStore":
+        """Create and return a singleton RuntimePolicyStore"""
+        if RuntimePolicyStore.instance is None:
+            directory = config.get("verifier", "runtime_policy_store_dir", fallback="")
+            min_size = config.getint("verifier", "runtime_policy_store_min_size", fallback=DEFAULT_MIN_POLICY_SIZE)
+            RuntimePolicyStore.instance = RuntimePolicyStore(directory, min_size)
+        return RuntimePolicyStore.instance
+
+    def __init__(self, directory: str = "", min_size: int = DEFAULT_MIN_POLICY_SIZE):
+        """constructor
+
+        :param directory: the directory holding the policy files; an empty string disables the store
+        :param min_size: the minimum size of a serialized policy for it to be stored
+        """
+        self.directory = directory
+        self.min_size = min_size
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _filename(self, checksum: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(checksum.encode()).hexdigest() + ".policy")
+
+    def load(self, checksum: str) -> Optional[CompiledRuntimePolicy]:
+        """Return the stored policy with the given checksum, if any"""
+        if not self.enabled:
+            return None
+
+        try:
+            artifact = open_artifact(self._filename(checksum))
+        except FileNotFoundError:
+            return None
+        except (OSError, PolicyArtifactError) as e:
+            logger.warning("Could not map runtime policy with checksum %s: %s", checksum, e)
+            return None
+        return artifact.compile(checksum)
+
+    def get(
+        self, runtime_policy: str, checksum: str, artifact: Optional[bytes] = None
+    ) -> Optional[CompiledRuntimePolicy]:
+        """Return the mapped form of the serialized runtime policy
+
+        The policy is written to the store first if needed, using its compiled
+        artifact if one is given. None is returned if the store is disabled,
+        the policy is too small to be stored or it could not be stored; the
+        caller then compiles it in memory. Raises the same exceptions as
+        ima.deserialize_runtime_policy() for invalid policies.
+        """
+        if not self.enabled or len(runtime_policy) < self.min_size:
+            return None
+
+        compiled = self.load(checksum)
+        if compiled is not None:
+            return compiled
+
+        if artifact is None:
+            artifact = serialize_policy(dict(ima.deserialize_runtime_policy(runtime_policy)))
+        try:
+            os.makedirs(self.directory, 0o700, exist_ok=True)
+            # Concurrent writers of the same policy each write their own file and the last rename wins
+            fd, tmpname = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(artifact)
+                os.replace(tmpname, self._filename(checksum))
+            except BaseException:
+                os.unlink(tmpname)
+                raise
+        except OSError as e:
+            logger.warning("Could not store runtime policy with checksum %s: %s", checksum, e)
+            return None
+
+        logger.debug("Stored runtime policy with checksum %s in %s", checksum, self.directory)
+        return self.load(checksum)
@@ -0,0 +1,68 @@
+"""Process-wide memo of verified IMA file signatures
+
+The same signed files are measured on every machine of a fleet and are
+reported again on every full attestation, while verifying an RSA or ECDSA
+signature is expensive. The VerifiedSignatureCache remembers the signatures
+that have been verified successfully, keyed by the fingerprint of the key
+that verified them, the file hash and the signature, so that a signature is
+only verified once per key. Signatures that could not be verified are not
+remembered.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from keylime import config
+
+# Default maximum number of cached signatures
+DEFAULT_CACHE_SIZE = 100000
+
+SignatureKeyType = Tuple[bytes, bytes, bytes]
+
+
+class VerifiedSignatureCache:
+    instance: Optional["VerifiedSignatureCache"] = None
+
+    @staticmethod
+    def get_instance() -> "VerifiedSignatureCache":
+        """Create and return a singleton VerifiedSignatureCache"""
+        if VerifiedSignatureCache.instance is None:
+            max_entries = config.getint("verifier", "ima_signature_cache_size", fallback=DEFAULT_CACHE_SIZE)
+            VerifiedSignatureCache.instance = VerifiedSignatureCache(max_entries)
+        return VerifiedSignatureCache.instance
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        """constructor
+
+        :param max_entries: the maximum number of cached signatures; 0 disables the cache
+        """
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[SignatureKeyType, None]" = OrderedDict()
+
+    def contains(self, key: SignatureKeyType) -> bool:
+        """Check whether the signature was verified with the key before"""
+        with self.lock:
+            if key not in self.entries:
+                return False
+            self.entries.move_to_end(key)
+            return True
+
+    def add(self, key: SignatureKeyType) -> None:
+        """Remember a verified signature, evicting the least recently used entries if needed"""
+        if self.max_entries <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = None
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,143 @@
+"""Cache of measured boot log parse and evaluation results
+
+The UEFI event log of a machine does not change between reboots, so every
+quote carries the very same log. Parsing it and evaluating it against the
+measured boot reference state is deterministic, so the results are cached
+by the digest of the log, the PCR bank and the digest of the reference
+state. A repeated log then only costs computing its digest.
+
+Every verifier worker and attestation process holds its own cache, so the
+cache is bounded by an approximate byte budget, estimated from the size of
+the cached logs, and evicts the least recently used logs first.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+from keylime import config, keylime_logging
+from keylime.failure import Failure
+from keylime.mba import mba
+
+logger = keylime_logging.init_logging("measured_boot")
+
+# Default budget for the cached boot logs, in bytes
+DEFAULT_CACHE_SIZE = 32 * 1024 * 1024
+
+# The parsed form of a boot log uses about five times the memory of the base64 encoded log
+PARSED_SIZE_FACTOR = 6
+
+ParseResult = Tuple[mba.MBPCRDict, mba.MBAgg, mba.MBLog, Failure]
+EvaluationKey = Tuple[str, FrozenSet[int]]
+
+
+class _Entry:
+    __slots__ = ("parsed", "size", "evaluations")
+
+    def __init__(self, parsed: ParseResult, size: int):
+        self.parsed = parsed
+        self.size = size
+        self.evaluations: Dict[EvaluationKey, Failure] = {}
+
+
+class BootlogCache:
+    instance: Optional["BootlogCache"] = None
+
+    @staticmethod
+    def get_instance() -> "BootlogCache":
+        """Create and return a singleton BootlogCache"""
+        if BootlogCache.instance is None:
+            max_size = config.getint("verifier", "measured_boot_cache_size", fallback=DEFAULT_CACHE_SIZE)
+            BootlogCache.instance = BootlogCache(max_size)
+        return BootlogCache.instance
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        """constructor
+
+        :param max_size: the approximate number of bytes the cached boot logs may use; 0 disables caching
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+
+    @staticmethod
+    def digest(data: Optional[str]) -> str:
+        if not data:
+            return ""
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def parse(self, mb_measurement_list: Optional[str], hash_alg: str) -> ParseResult:
+        """Parse the boot log with mba.bootlog_parse(), reusing earlier results for the same log
+
+        The returned objects are shared and must not be modified.
+        """
+        size = len(mb_measurement_list) * PARSED_SIZE_FACTOR if mb_measurement_list else 0
+        if not mb_measurement_list or size > self.max_size:
+            return mba.bootlog_parse(mb_measurement_list, hash_alg)
+
+        key = (BootlogCache.digest(mb_measurement_list), str(hash_alg))
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry.parsed
+
+        parsed = mba.bootlog_parse(mb_measurement_list, hash_alg)
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = _Entry(parsed, size)
+                self.size += size
+                while self.size > self.max_size:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.size -= evicted.size
+        return parsed
+
+    def evaluate(
+        self,
+        mb_measurement_list: Optional[str],
+        hash_alg: str,
+        mb_policy: Optional[str],
+        mb_measurement_data: mba.MBLog,
+        pcrs_in_quote: Set[int],
+        agent_id: str,
+    ) -> Failure:
+        """Evaluate the parsed boot log with mba.bootlog_evaluate(), reusing earlier results
+
+        The result is cached along with the parsed log, so the boot log must
+        have been parsed with parse() first for it to be reused. The measured
+        boot policy name is not part of the key as it does not change while
+        the verifier is running.
+        """
+        key = (BootlogCache.digest(mb_measurement_list), str(hash_alg))
+        entry = self._lookup(key) if mb_measurement_list else None
+        if entry is None:
+            return mba.bootlog_evaluate(mb_policy, mb_measurement_data, pcrs_in_quote, agent_id)
+
+        eval_key = (BootlogCache.digest(mb_policy), frozenset(pcrs_in_quote))
+        with self.lock:
+            failure = entry.evaluations.get(eval_key)
+        if failure is not None:
+            if failure:
+                logger.error("Boot attestation failed for agent %s (cached result for an identical boot log)", agent_id)
+            return failure
+
+        failure = mba.bootlog_evaluate(mb_policy, mb_measurement_data, pcrs_in_quote, agent_id)
+        with self.lock:
+            entry.evaluations[eval_key] = failure
+        return failure
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
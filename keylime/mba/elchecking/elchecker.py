@@ -66,12 +66,6 @@ def bootlog_evaluate(
     if not mb_refstate_str:
         return failure
 
-    mb_refstate_data = json.loads(mb_refstate_str)
-
-    # no evaluation if the refstate does not load as JSON
-    if not mb_refstate_data:
-        return failure
-
     # load policy name
     mb_policy_name = config.get("verifier", "measured_boot_policy_name", fallback="accept-all")
 
@@ -85,6 +79,14 @@ def bootlog_evaluate(
         mb_policy_name = "reject-all"
         mb_policy = policies.RejectAll()
 
+    # the refstate is only decoded and compiled into a test once, and then reused
+    compiled = policies.compile_refstate(mb_policy_name, mb_refstate_str)
+    mb_refstate_data = compiled.refstate
+
+    # no evaluation if the refstate does not load as JSON
+    if not mb_refstate_data:
+        return failure
+
     # figure out whether the quote contains all quotes to evaluate the policy
     # if there are any PCRs in the policy that are not in the quote, we canot evaluate.
     mb_pcrs_policy = mb_policy.get_relevant_pcrs()
@@ -95,10 +97,7 @@ def bootlog_evaluate(
         failure.add_event("missing_pcrs", {"context": "PCRs are missing in quote", "data": missing_pcrs}, True)
     # evaluate the policy
     else:
-        try:
-            reason = mb_policy.evaluate(mb_refstate_data, mb_measurement_data)
-        except Exception as exn:
-            reason = f"policy evaluation failed: {str(exn)}"
+        reason = compiled.evaluate(mb_measurement_data)
 
     if reason:
         logger.error(
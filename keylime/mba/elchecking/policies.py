@@ -1,5 +1,9 @@
 import abc
+import hashlib
+import json
+import threading
 import typing
+from collections import OrderedDict
 
 from . import tests
 
@@ -55,6 +59,86 @@ class RejectAll(Policy):
         return tests.RejectAll("reject all")
 
 
+# A compiled policy is the Test that a Policy produces for a given
+# RefState. Tests can be used multiple times, even concurrently, so the
+# compiled policies are cached by policy name and digest of the RefState
+# and shared by all the evaluations of logs against the same RefState.
+
+
+class CompiledPolicy:
+    """The RefState and the Test compiled from it by a named policy"""
+
+    __slots__ = ("policy_name", "policy", "refstate", "tester", "error")
+
+    def __init__(self, policy_name: str, policy: Policy, refstate: typing.Optional[RefState]):
+        self.policy_name = policy_name
+        self.policy = policy
+        self.refstate = refstate
+        self.tester: typing.Optional[tests.Test] = None
+        self.error = ""
+
+    def evaluate(self, eventlog: tests.Data) -> str:
+        """Evaluate and return the reason for rejection or empty string for accept"""
+        if self.error:
+            return f"policy evaluation failed: {self.error}"
+        if self.refstate is None:
+            return ""
+        try:
+            if self.tester is None:
+                return self.policy.evaluate(self.refstate, eventlog)
+            return self.tester.why_not({}, eventlog)
+        except Exception as exn:
+            return f"policy evaluation failed: {str(exn)}"
+
+
+COMPILED_CACHE_SIZE = 128
+
+_compiled: "OrderedDict[typing.Tuple[str, str], CompiledPolicy]" = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def _forget_compiled(name: str) -> None:
+    with _compiled_lock:
+        for key in [key for key in _compiled if key[0] == name]:
+            del _compiled[key]
+
+
+def compile_refstate(policy_name: str, refstate_str: str) -> CompiledPolicy:
+    """Compile the given JSON encoded RefState with the named policy, reusing earlier compilations
+
+    A RefState that is empty or JSON null is compiled into a CompiledPolicy
+    with neither refstate nor tester. Policies that override evaluate() get
+    no tester and are evaluated as before. Errors raised by the policy while
+    compiling the RefState are kept in the CompiledPolicy and reported when
+    evaluating. Raises an Exception if the JSON cannot be decoded or there is
+    no policy with the given name.
+    """
+    key = (policy_name, hashlib.sha256(refstate_str.encode()).hexdigest())
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            return compiled
+
+    policy = get_policy(policy_name)
+    if policy is None:
+        raise Exception(f"there is no policy named {policy_name!a}")
+
+    refstate = json.loads(refstate_str)
+    compiled = CompiledPolicy(policy_name, policy, refstate or None)
+    if refstate and type(policy).evaluate is Policy.evaluate:
+        try:
+            compiled.tester = policy.refstate_to_test(refstate)
+        except Exception as exn:
+            compiled.error = str(exn)
+
+    with _compiled_lock:
+        _compiled[key] = compiled
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+
 def _mkreg() -> typing.Dict[str, Policy]:
     return {}
 
@@ -65,6 +149,7 @@ _registry = _mkreg()
 def register(name: str, policy: Policy) -> None:
     """Remember the given policy under the given name"""
     _registry[name] = policy
+    _forget_compiled(name)
 
 
 register("accept-all", AcceptAll())
@@ -632,17 +632,18 @@ class KeySuperset(TupleTest):
 
 
 class OnceTest(Test):
-    """Tests that only works once"""
+    """Tests that only works once per top-level use"""
 
     def __init__(self, test: Test):
-        self.executed = False
         self.test = test
+        # The state is kept in the globals so that the test can be reused
+        self.global_name = f"once_{id(self)}"
 
     def why_not(self, globs: Globals, subject: Data) -> str:
-        if self.executed:
+        if globs.get(self.global_name):
             return "test was already run once"
 
-        self.executed = True
+        globs[self.global_name] = True
         return self.test.why_not(globs, subject)
 
 
@@ -0,0 +1,805 @@
+"""Native parser for TCG2 (crypto agile) UEFI measured boot event logs
+
+The binary event log is decoded in-process into the same structure that
+`tpm2_eventlog` followed by `tpm_bootlog_enrich` produce, so the measured
+boot policies in `keylime.mba.elchecking` can evaluate it unchanged. No
+external tool, temporary file or YAML round-trip is involved.
+
+References:
+ - TCG PC Client Platform Firmware Profile Specification, Version 1.05
+ - UEFI Specification 2.10, Sections 3.1.3 (EFI_LOAD_OPTION), 5.3 (GPT),
+   10.3 (device path nodes), 10.6 (device path text) and 32.4.1 (signature lists)
+"""
+
+import base64
+import binascii
+import hashlib
+import struct
+import typing
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from keylime import keylime_logging
+from keylime.failure import Component, Failure
+
+if typing.TYPE_CHECKING:
+    from keylime.mba.mba import MBAgg, MBLog, MBPCRDict
+
+logger = keylime_logging.init_logging("elparsing")
+
+##################################################################################
+#
+# Constants from the TCG PC Client Platform Firmware Profile Specification
+#
+##################################################################################
+
+EV_EFI_EVENT_BASE = 0x80000000
+
+EVENT_TYPES = {
+    0x0: "EV_PREBOOT_CERT",
+    0x1: "EV_POST_CODE",
+    0x2: "EV_UNUSED",
+    0x3: "EV_NO_ACTION",
+    0x4: "EV_SEPARATOR",
+    0x5: "EV_ACTION",
+    0x6: "EV_EVENT_TAG",
+    0x7: "EV_S_CRTM_CONTENTS",
+    0x8: "EV_S_CRTM_VERSION",
+    0x9: "EV_CPU_MICROCODE",
+    0xA: "EV_PLATFORM_CONFIG_FLAGS",
+    0xB: "EV_TABLE_OF_DEVICES",
+    0xC: "EV_COMPACT_HASH",
+    0xD: "EV_IPL",
+    0xE: "EV_IPL_PARTITION_DATA",
+    0xF: "EV_NONHOST_CODE",
+    0x10: "EV_NONHOST_CONFIG",
+    0x11: "EV_NONHOST_INFO",
+    0x12: "EV_OMIT_BOOT_DEVICE_EVENTS",
+    0x13: "EV_POST_CODE2",
+    EV_EFI_EVENT_BASE + 0x1: "EV_EFI_VARIABLE_DRIVER_CONFIG",
+    EV_EFI_EVENT_BASE + 0x2: "EV_EFI_VARIABLE_BOOT",
+    EV_EFI_EVENT_BASE + 0x3: "EV_EFI_BOOT_SERVICES_APPLICATION",
+    EV_EFI_EVENT_BASE + 0x4: "EV_EFI_BOOT_SERVICES_DRIVER",
+    EV_EFI_EVENT_BASE + 0x5: "EV_EFI_RUNTIME_SERVICES_DRIVER",
+    EV_EFI_EVENT_BASE + 0x6: "EV_EFI_GPT_EVENT",
+    EV_EFI_EVENT_BASE + 0x7: "EV_EFI_ACTION",
+    EV_EFI_EVENT_BASE + 0x8: "EV_EFI_PLATFORM_FIRMWARE_BLOB",
+    EV_EFI_EVENT_BASE + 0x9: "EV_EFI_HANDOFF_TABLES",
+    EV_EFI_EVENT_BASE + 0xA: "EV_EFI_PLATFORM_FIRMWARE_BLOB2",
+    EV_EFI_EVENT_BASE + 0xB: "EV_EFI_HANDOFF_TABLES2",
+    EV_EFI_EVENT_BASE + 0xC: "EV_EFI_VARIABLE_BOOT2",
+    EV_EFI_EVENT_BASE + 0xD: "EV_EFI_GPT_EVENT2",
+    EV_EFI_EVENT_BASE + 0x10: "EV_EFI_HCRTM_EVENT",
+    EV_EFI_EVENT_BASE + 0xE0: "EV_EFI_VARIABLE_AUTHORITY",
+    EV_EFI_EVENT_BASE + 0xE1: "EV_EFI_SPDM_FIRMWARE_BLOB",
+    EV_EFI_EVENT_BASE + 0xE2: "EV_EFI_SPDM_FIRMWARE_CONFIG",
+}
+
+# TPM2_ALG_ID values of the supported digests, with their hashlib names
+TPM_ALGS = {
+    0x0004: "sha1",
+    0x000B: "sha256",
+    0x000C: "sha384",
+    0x000D: "sha512",
+    0x0012: "sm3_256",
+}
+
+SPEC_ID_EVENT03_SIGNATURE = b"Spec ID Event03\0"
+STARTUP_LOCALITY_SIGNATURE = b"StartupLocality\0"
+
+SHA1_DIGEST_SIZE = 20
+# PCRIndex, EventType, DigestCount/EventSize
+EVENT_HEADER_SIZE = 12
+
+# Variables whose content is a list of EFI_SIGNATURE_LIST structures
+SIGNATURE_LIST_VARIABLES = ("PK", "KEK", "db", "dbx", "vendor_db")
+# Variables with a single EFI_SIGNATURE_DATA when measured as authority
+SIGNATURE_DATA_VARIABLES = ("db", "vendor_db")
+# Boolean variables reported as "Enabled"
+BOOLEAN_VARIABLES = ("SecureBoot", "MokListTrusted")
+
+EFI_SIGNATURE_OWNER_SIZE = 16
+EFI_SIGNATURE_LIST_HEADER_SIZE = 28
+EFI_PARTITION_NAME_SIZE = 72
+
+
+class EventLogError(ValueError):
+    """Raised when the binary event log is malformed"""
+
+
+class _Reader:
+    """Bounds checked little-endian reader over a bytes buffer"""
+
+    __slots__ = ("data", "pos", "end")
+
+    def __init__(self, data: bytes, pos: int = 0, end: Optional[int] = None):
+        self.data = data
+        self.pos = pos
+        self.end = len(data) if end is None else end
+
+    def remaining(self) -> int:
+        return self.end - self.pos
+
+    def read(self, size: int) -> bytes:
+        if size < 0 or self.pos + size > self.end:
+            raise EventLogError(f"Truncated data: need {size} bytes at offset {self.pos}, have {self.remaining()}")
+        value = self.data[self.pos : self.pos + size]
+        self.pos += size
+        return value
+
+    def unpack(self, fmt: str) -> Tuple[Any, ...]:
+        size = struct.calcsize(fmt)
+        if self.pos + size > self.end:
+            raise EventLogError(f"Truncated data: need {size} bytes at offset {self.pos}, have {self.remaining()}")
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += size
+        return values
+
+    def u8(self) -> int:
+        return typing.cast(int, self.unpack("<B")[0])
+
+    def u16(self) -> int:
+        return typing.cast(int, self.unpack("<H")[0])
+
+    def u32(self) -> int:
+        return typing.cast(int, self.unpack("<I")[0])
+
+    def u64(self) -> int:
+        return typing.cast(int, self.unpack("<Q")[0])
+
+    def guid(self) -> str:
+        return guid_to_str(self.read(16))
+
+
+##################################################################################
+#
+# Helpers for UEFI data types
+#
+##################################################################################
+
+
+def guid_to_str(b: bytes) -> str:
+    """Format an EFI_GUID the same way as efivar's efi_guid_to_str"""
+    return str(uuid.UUID(bytes_le=bytes(b)))
+
+
+def ucs2_to_str(b: bytes) -> str:
+    """Decode a UCS-2 string, stopping at the first NUL character"""
+    s = b.decode("utf-16-le", errors="ignore")
+    nul = s.find("\0")
+    if nul >= 0:
+        s = s[:nul]
+    return s
+
+
+def bytes_to_str(b: bytes) -> str:
+    """Decode a (possibly NUL terminated) 8-bit string"""
+    s = b.decode("utf-8", errors="replace")
+    if s.endswith("\0"):
+        s = s[:-1]
+    return s
+
+
+def _format_dp_acpi(subtype: int, data: bytes) -> Optional[str]:
+    r = _Reader(data)
+    if subtype == 1:
+        hid, uid = r.unpack("<II")
+        if hid & 0xFFFF == 0x41D0:
+            pnp = hid >> 16
+            names = {
+                0x0A03: "PciRoot",
+                0x0A08: "PcieRoot",
+                0x0604: "Floppy",
+                0x0301: "Keyboard",
+                0x0501: "Serial",
+                0x0401: "ParallelPort",
+            }
+            if pnp in names:
+                return f"{names[pnp]}(0x{uid:x})"
+            return f"Acpi(PNP{pnp:04x},0x{uid:x})"
+        return f"Acpi(0x{hid:08x},0x{uid:x})"
+    if subtype == 3:
+        return "AcpiAdr(" + ",".join(f"0x{adr:x}" for adr in struct.unpack_from(f"<{len(data) // 4}I", data)) + ")"
+    return None
+
+
+def _format_dp_hardware(subtype: int, data: bytes) -> Optional[str]:
+    r = _Reader(data)
+    if subtype == 1:
+        function, device = r.unpack("<BB")
+        return f"Pci(0x{device:x},0x{function:x})"
+    if subtype == 2:
+        return f"PcCard(0x{r.u8():x})"
+    if subtype == 3:
+        memory_type, start, end = r.unpack("<IQQ")
+        return f"MemoryMapped(0x{memory_type:x},0x{start:x},0x{end:x})"
+    if subtype == 4:
+        return _format_dp_vendor("VenHw", r)
+    if subtype == 5:
+        return f"Ctrl(0x{r.u32():x})"
+    return None
+
+
+def _format_dp_vendor(name: str, r: _Reader) -> str:
+    guid = r.guid()
+    rest = r.read(r.remaining())
+    if rest:
+        return f"{name}({guid},{rest.hex()})"
+    return f"{name}({guid})"
+
+
+def _format_dp_messaging(subtype: int, data: bytes) -> Optional[str]:
+    r = _Reader(data)
+    if subtype == 1:
+        primary, slave, lun = r.unpack("<BBH")
+        return f"Ata({'Secondary' if primary else 'Primary'},{'Slave' if slave else 'Master'},0x{lun:x})"
+    if subtype == 2:
+        target, lun = r.unpack("<HH")
+        return f"Scsi(0x{target:x},0x{lun:x})"
+    if subtype == 5:
+        port, interface = r.unpack("<BB")
+        return f"USB(0x{port:x},0x{interface:x})"
+    if subtype == 10:
+        return _format_dp_vendor("VenMsg", r)
+    if subtype == 11:
+        mac = r.read(32)
+        if_type = r.u8()
+        mac_len = 6 if if_type in (0, 1) else 32
+        return f"MAC({mac[:mac_len].hex()},0x{if_type:x})"
+    if subtype == 12:
+        local, remote = r.read(4), r.read(4)
+        r.read(4)  # local and remote ports
+        protocol, static = r.unpack("<HB")
+        remote_ip = ".".join(map(str, remote))
+        local_ip = ".".join(map(str, local))
+        return f"IPv4({remote_ip},0x{protocol:x},{'Static' if static else 'DHCP'},{local_ip})"
+    if subtype == 18:
+        hba_port, multiplier_port, lun = r.unpack("<HHH")
+        return f"Sata(0x{hba_port:x},0x{multiplier_port:x},0x{lun:x})"
+    if subtype == 23:
+        nsid = r.u32()
+        eui = r.read(8)
+        return f"NVMe(0x{nsid:x}," + "-".join(f"{x:02X}" for x in eui) + ")"
+    if subtype == 24:
+        return f"Uri({bytes_to_str(data)})"
+    return None
+
+
+def _format_dp_media(subtype: int, data: bytes) -> Optional[str]:
+    r = _Reader(data)
+    if subtype == 1:
+        number, start, size = r.unpack("<IQQ")
+        signature = r.read(16)
+        _, signature_type = r.unpack("<BB")
+        if signature_type == 1:
+            return f"HD({number},MBR,0x{struct.unpack_from('<I', signature)[0]:08x},0x{start:x},0x{size:x})"
+        if signature_type == 2:
+            return f"HD({number},GPT,{guid_to_str(signature)},0x{start:x},0x{size:x})"
+        return f"HD({number},{signature_type},0,0x{start:x},0x{size:x})"
+    if subtype == 2:
+        entry, start, size = r.unpack("<IQQ")
+        return f"CDROM(0x{entry:x},0x{start:x},0x{size:x})"
+    if subtype == 3:
+        return _format_dp_vendor("VenMedia", r)
+    if subtype == 4:
+        return ucs2_to_str(data)
+    if subtype == 5:
+        return f"Media({r.guid()})"
+    if subtype == 6:
+        return f"FvFile({r.guid()})"
+    if subtype == 7:
+        return f"FvVol({r.guid()})"
+    if subtype == 8:
+        _, start, end = r.unpack("<IQQ")
+        return f"Offset(0x{start:x},0x{end:x})"
+    return None
+
+
+_DP_FORMATTERS: Dict[int, Callable[[int, bytes], Optional[str]]] = {
+    1: _format_dp_hardware,
+    2: _format_dp_acpi,
+    3: _format_dp_messaging,
+    4: _format_dp_media,
+}
+
+DP_TYPE_END = 0x7F
+DP_SUBTYPE_END_ENTIRE = 0xFF
+DP_NODE_HEADER_SIZE = 4
+
+
+def device_path_to_str(b: bytes) -> str:
+    """Convert a binary EFI_DEVICE_PATH_PROTOCOL into its text representation
+
+    The output follows the conventions of efivar's efidp_format_device_path;
+    nodes without a specific text form are rendered as Path(type,subtype,data).
+    """
+    r = _Reader(b)
+    out = ""
+    sep = ""
+    while r.remaining() >= DP_NODE_HEADER_SIZE:
+        node_type, node_subtype, node_len = r.unpack("<BBH")
+        if node_len < DP_NODE_HEADER_SIZE:
+            raise EventLogError(f"Invalid device path node length {node_len}")
+        data = r.read(node_len - DP_NODE_HEADER_SIZE)
+
+        if node_type == DP_TYPE_END:
+            if node_subtype == DP_SUBTYPE_END_ENTIRE:
+                break
+            out += ","
+            sep = ""
+            continue
+
+        text = None
+        formatter = _DP_FORMATTERS.get(node_type)
+        if formatter:
+            try:
+                text = formatter(node_subtype, data)
+            except (EventLogError, struct.error):
+                text = None
+        if text is None:
+            text = f"Path({node_type},{node_subtype},{data.hex()})"
+        out += sep + text
+        sep = "/"
+    return out
+
+
+##################################################################################
+#
+# Decoders for the event data of specific event types
+#
+##################################################################################
+
+
+def _parse_signature_lists(b: bytes) -> List[Dict[str, Any]]:
+    """Parse a sequence of EFI_SIGNATURE_LIST structures"""
+    r = _Reader(b)
+    lists = []
+    while r.remaining() > 0:
+        start = r.pos
+        signature_type = r.guid()
+        list_size, header_size, signature_size = r.unpack("<III")
+        if list_size < EFI_SIGNATURE_LIST_HEADER_SIZE + header_size or signature_size <= EFI_SIGNATURE_OWNER_SIZE:
+            raise EventLogError("Invalid EFI_SIGNATURE_LIST")
+        r.read(header_size)
+        keys = []
+        sigs = _Reader(b, r.pos, start + list_size)
+        if sigs.end > len(b):
+            raise EventLogError("Truncated EFI_SIGNATURE_LIST")
+        while sigs.remaining() >= signature_size:
+            owner = sigs.guid()
+            keys.append(
+                {"SignatureOwner": owner, "SignatureData": sigs.read(signature_size - EFI_SIGNATURE_OWNER_SIZE).hex()}
+            )
+        r.pos = start + list_size
+        lists.append(
+            {
+                "SignatureType": signature_type,
+                "SignatureListSize": list_size,
+                "SignatureHeaderSize": header_size,
+                "SignatureSize": signature_size,
+                "Keys": keys,
+            }
+        )
+    return lists
+
+
+def _parse_load_option(b: bytes) -> Dict[str, str]:
+    """Parse an EFI_LOAD_OPTION as stored in the Boot#### variables"""
+    r = _Reader(b)
+    attributes = r.u32()
+    file_path_list_length = r.u16()
+    description = ""
+    while r.remaining() >= 2:
+        w = r.read(2)
+        if w == b"\x00\x00":
+            break
+        description += w.decode("utf-16-le", errors="ignore")
+    device_path = r.read(min(file_path_list_length, r.remaining()))
+    return {
+        "Enabled": "Yes" if attributes & 1 else "No",
+        "FilePathListLength": str(file_path_list_length),
+        "Description": description,
+        "DevicePath": device_path_to_str(device_path),
+    }
+
+
+def _parse_variable_data(event_type: str, name: str, data: bytes) -> Any:
+    if name in BOOLEAN_VARIABLES:
+        return {"Enabled": "Yes" if data and data[0] == 1 else "No"}
+
+    if event_type == "EV_EFI_VARIABLE_DRIVER_CONFIG" and name in SIGNATURE_LIST_VARIABLES:
+        return _parse_signature_lists(data)
+
+    if event_type == "EV_EFI_VARIABLE_AUTHORITY" and name in SIGNATURE_DATA_VARIABLES:
+        if len(data) <= EFI_SIGNATURE_OWNER_SIZE:
+            raise EventLogError(f"Invalid EFI_SIGNATURE_DATA for {name}")
+        return [
+            {
+                "SignatureOwner": guid_to_str(data[:EFI_SIGNATURE_OWNER_SIZE]),
+                "SignatureData": data[EFI_SIGNATURE_OWNER_SIZE:].hex(),
+            }
+        ]
+
+    if event_type in ("EV_EFI_VARIABLE_BOOT", "EV_EFI_VARIABLE_BOOT2"):
+        if name == "BootOrder":
+            if len(data) % 2 != 0:
+                raise EventLogError(f"BootOrder length ({len(data)}) is not divisible by 2")
+            return [f"Boot{d:04x}" for (d,) in struct.iter_unpack("<H", data)]
+        if len(name) == 8 and name.startswith("Boot"):
+            try:
+                return _parse_load_option(data)
+            except (EventLogError, struct.error):
+                return data.hex()
+
+    return data.hex()
+
+
+def _parse_efi_variable(event_type: str, data: bytes) -> Dict[str, Any]:
+    """Parse an UEFI_VARIABLE_DATA event"""
+    r = _Reader(data)
+    variable_name = r.guid()
+    name_length, data_length = r.unpack("<QQ")
+    name = ucs2_to_str(r.read(name_length * 2))
+    variable_data = r.read(data_length)
+    return {
+        "VariableName": variable_name,
+        "UnicodeNameLength": name_length,
+        "VariableDataLength": data_length,
+        "UnicodeName": name,
+        "VariableData": _parse_variable_data(event_type, name, variable_data),
+    }
+
+
+def _parse_image_load(_: str, data: bytes) -> Dict[str, Any]:
+    """Parse an UEFI_IMAGE_LOAD_EVENT"""
+    r = _Reader(data)
+    location, length, link_time_address, device_path_length = r.unpack("<QQQQ")
+    device_path = r.read(device_path_length)
+    try:
+        device_path_str = device_path_to_str(device_path)
+    # Deal with garbage device paths
+    except (EventLogError, struct.error):
+        device_path_str = device_path.hex()
+    return {
+        "ImageLocationInMemory": location,
+        "ImageLengthInMemory": length,
+        "ImageLinkTimeAddress": link_time_address,
+        "LengthOfDevicePath": device_path_length,
+        "DevicePath": device_path_str,
+    }
+
+
+def _parse_gpt(_: str, data: bytes) -> Dict[str, Any]:
+    """Parse an UEFI_GPT_DATA event"""
+    r = _Reader(data)
+    signature = bytes_to_str(r.read(8))
+    revision, header_size, header_crc32, _reserved = r.unpack("<IIII")
+    my_lba, alternate_lba, first_usable_lba, last_usable_lba = r.unpack("<QQQQ")
+    disk_guid = r.guid()
+    partition_entry_lba, number_of_entries, size_of_entry, entries_crc32 = r.unpack("<QIII")
+    number_of_partitions = r.u64()
+    partitions = []
+    for _partition in range(number_of_partitions):
+        p = _Reader(r.read(size_of_entry))
+        partitions.append(
+            {
+                "PartitionTypeGUID": p.guid(),
+                "UniquePartitionGUID": p.guid(),
+                "StartingLBA": p.u64(),
+                "EndingLBA": p.u64(),
+                "Attributes": p.u64(),
+                "PartitionName": ucs2_to_str(p.read(EFI_PARTITION_NAME_SIZE)),
+            }
+        )
+    return {
+        "Header": {
+            "Signature": signature,
+            "Revision": revision,
+            "HeaderSize": header_size,
+            "HeaderCRC32": header_crc32,
+            "MyLBA": my_lba,
+            "AlternateLBA": alternate_lba,
+            "FirstUsableLBA": first_usable_lba,
+            "LastUsableLBA": last_usable_lba,
+            "DiskGUID": disk_guid,
+            "PartitionEntryLBA": partition_entry_lba,
+            "NumberOfPartitionEntry": number_of_entries,
+            "SizeOfPartitionEntry": size_of_entry,
+            "PartitionEntryArrayCRC32": entries_crc32,
+        },
+        "NumberOfPartitions": number_of_partitions,
+        "Partitions": partitions,
+    }
+
+
+def _parse_firmware_blob(_: str, data: bytes) -> Dict[str, Any]:
+    """Parse an UEFI_PLATFORM_FIRMWARE_BLOB event"""
+    base, length = _Reader(data).unpack("<QQ")
+    return {"BlobBase": base, "BlobLength": length}
+
+
+def _parse_firmware_blob2(_: str, data: bytes) -> Dict[str, Any]:
+    """Parse an UEFI_PLATFORM_FIRMWARE_BLOB2 event"""
+    r = _Reader(data)
+    description_size = r.u8()
+    description = bytes_to_str(r.read(description_size))
+    base, length = r.unpack("<QQ")
+    return {
+        "BlobDescriptionSize": description_size,
+        "BlobDescription": description,
+        "BlobBase": base,
+        "BlobLength": length,
+    }
+
+
+def _parse_handoff_tables(_: str, data: bytes) -> Dict[str, Any]:
+    """Parse an UEFI_HANDOFF_TABLE_POINTERS event"""
+    r = _Reader(data)
+    number_of_tables = r.u64()
+    tables = []
+    for _table in range(number_of_tables):
+        vendor_guid = r.guid()
+        tables.append({"VendorGuid": vendor_guid, "VendorTable": r.u64()})
+    return {"NumberOfTables": number_of_tables, "TableEntry": tables}
+
+
+def _parse_string(_: str, data: bytes) -> Dict[str, str]:
+    return {"String": bytes_to_str(data)}
+
+
+def _parse_ucs2_string(_: str, data: bytes) -> Dict[str, str]:
+    return {"String": ucs2_to_str(data)}
+
+
+def _parse_post_code(event_type: str, data: bytes) -> Dict[str, Any]:
+    if len(data) == 16:
+        return _parse_firmware_blob(event_type, data)
+    return _parse_string(event_type, data)
+
+
+def _parse_action(_: str, data: bytes) -> str:
+    return bytes_to_str(data)
+
+
+def _parse_no_action(_: str, data: bytes) -> Any:
+    if data.startswith(STARTUP_LOCALITY_SIGNATURE) and len(data) == len(STARTUP_LOCALITY_SIGNATURE) + 1:
+        return {"StartupLocality": data[-1]}
+    return data.hex()
+
+
+_EVENT_PARSERS: Dict[str, Callable[[str, bytes], Any]] = {
+    "EV_EFI_VARIABLE_DRIVER_CONFIG": _parse_efi_variable,
+    "EV_EFI_VARIABLE_BOOT": _parse_efi_variable,
+    "EV_EFI_VARIABLE_BOOT2": _parse_efi_variable,
+    "EV_EFI_VARIABLE_AUTHORITY": _parse_efi_variable,
+    "EV_EFI_BOOT_SERVICES_APPLICATION": _parse_image_load,
+    "EV_EFI_BOOT_SERVICES_DRIVER": _parse_image_load,
+    "EV_EFI_RUNTIME_SERVICES_DRIVER": _parse_image_load,
+    "EV_EFI_GPT_EVENT": _parse_gpt,
+    "EV_EFI_GPT_EVENT2": _parse_gpt,
+    "EV_EFI_PLATFORM_FIRMWARE_BLOB": _parse_firmware_blob,
+    "EV_EFI_PLATFORM_FIRMWARE_BLOB2": _parse_firmware_blob2,
+    "EV_EFI_HANDOFF_TABLES": _parse_handoff_tables,
+    "EV_IPL": _parse_string,
+    "EV_S_CRTM_VERSION": _parse_ucs2_string,
+    "EV_POST_CODE": _parse_post_code,
+    "EV_EFI_ACTION": _parse_action,
+    "EV_ACTION": _parse_action,
+    "EV_NO_ACTION": _parse_no_action,
+}
+
+
+def _parse_event_data(event_type: str, data: bytes) -> Any:
+    parser = _EVENT_PARSERS.get(event_type)
+    if parser is not None:
+        try:
+            return parser(event_type, data)
+        except (EventLogError, struct.error, ValueError) as e:
+            # Keep the raw data of events we fail to decode, the digests are what is attested
+            logger.debug("Could not decode event data of %s: %s", event_type, e)
+    return data.hex()
+
+
+##################################################################################
+#
+# Event log parsing
+#
+##################################################################################
+
+
+def _parse_spec_id_event(r: _Reader) -> Tuple[Dict[str, Any], Dict[int, Tuple[str, int]]]:
+    """Parse the TCG_PCClientPCREvent header carrying the TCG_EfiSpecIDEvent"""
+    pcr_index, event_type = r.unpack("<II")
+    digest = r.read(SHA1_DIGEST_SIZE)
+    event_size = r.u32()
+    ev = _Reader(r.read(event_size))
+
+    if event_type != 0x3 or ev.read(len(SPEC_ID_EVENT03_SIGNATURE)) != SPEC_ID_EVENT03_SIGNATURE:
+        raise EventLogError("Event log does not start with a 'Spec ID Event03' event; only TCG2 logs are supported")
+
+    platform_class = ev.u32()
+    spec_minor, spec_major, spec_errata, uintn_size = ev.unpack("<BBBB")
+    number_of_algorithms = ev.u32()
+    algorithms = []
+    digest_sizes: Dict[int, Tuple[str, int]] = {}
+    for i in range(number_of_algorithms):
+        alg_id, digest_size = ev.unpack("<HH")
+        alg_name = TPM_ALGS.get(alg_id, f"0x{alg_id:04x}")
+        digest_sizes[alg_id] = (alg_name, digest_size)
+        algorithms.append({f"Algorithm[{i}]": None, "algorithmId": alg_name, "digestSize": digest_size})
+    vendor_info_size = ev.u8()
+    ev.read(vendor_info_size)
+
+    event = {
+        "EventNum": 0,
+        "PCRIndex": pcr_index,
+        "EventType": EVENT_TYPES[event_type],
+        "Digest": digest.hex(),
+        "EventSize": event_size,
+        "SpecID": [
+            {
+                "Signature": SPEC_ID_EVENT03_SIGNATURE[:-1].decode(),
+                "platformClass": platform_class,
+                "specVersionMinor": spec_minor,
+                "specVersionMajor": spec_major,
+                "specErrata": spec_errata,
+                "uintnSize": uintn_size,
+                "numberOfAlgorithms": number_of_algorithms,
+                "Algorithms": algorithms,
+                "vendorInfoSize": vendor_info_size,
+            }
+        ],
+    }
+    return event, digest_sizes
+
+
+def _is_padding(r: _Reader) -> bool:
+    """Firmware may hand over the event log with trailing zeroes
+
+    Only a header with a zero PCR index and event type can start the padding,
+    so the rest of the log is not scanned for other events.
+    """
+    if struct.unpack_from("<II", r.data, r.pos) != (0, 0):
+        return False
+    return r.data.count(0, r.pos, r.end) == r.remaining()
+
+
+def parse_eventlog(log_bin: bytes) -> Dict[str, Any]:
+    """Parse a binary TCG2 event log
+
+    Returns a dict with the parsed "events", the "pcrs" values obtained by
+    replaying the log for each hash algorithm, with PCR indices as strings and
+    the values as integers, and the "boot_aggregates". Raises EventLogError if
+    the log is malformed.
+    """
+    r = _Reader(log_bin)
+    spec_id_event, digest_sizes = _parse_spec_id_event(r)
+    events: List[Dict[str, Any]] = [spec_id_event]
+
+    pcrs: Dict[str, Dict[int, bytes]] = {}
+    locality = 0
+
+    while r.remaining() >= EVENT_HEADER_SIZE and not _is_padding(r):
+        pcr_index, event_type, digest_count = r.unpack("<III")
+        event_type_str = EVENT_TYPES.get(event_type, "EV_UNKNOWN")
+
+        digests = []
+        for _ in range(digest_count):
+            alg_id = r.u16()
+            if alg_id not in digest_sizes:
+                raise EventLogError(
+                    f"Event {len(events)} uses algorithm 0x{alg_id:04x} not listed in the Spec ID event"
+                )
+            alg_name, digest_size = digest_sizes[alg_id]
+            digests.append((alg_name, r.read(digest_size)))
+
+        event_size = r.u32()
+        event_data = r.read(event_size)
+
+        parsed_data = _parse_event_data(event_type_str, event_data)
+        if event_type_str == "EV_NO_ACTION":
+            if isinstance(parsed_data, dict) and pcr_index == 0:
+                locality = parsed_data.get("StartupLocality", locality)
+        else:
+            for alg_name, digest in digests:
+                if alg_name not in hashlib.algorithms_available:
+                    continue
+                bank = pcrs.setdefault(alg_name, {})
+                current = bank.get(pcr_index)
+                if current is None:
+                    current = bytes(len(digest))
+                    if pcr_index == 0:
+                        current = current[:-1] + bytes([locality])
+                bank[pcr_index] = hashlib.new(alg_name, current + digest).digest()
+
+        events.append(
+            {
+                "EventNum": len(events),
+                "PCRIndex": pcr_index,
+                "EventType": event_type_str,
+                "DigestCount": digest_count,
+                "Digests": [{"AlgorithmId": alg_name, "Digest": digest.hex()} for alg_name, digest in digests],
+                "EventSize": event_size,
+                "Event": parsed_data,
+            }
+        )
+
+    log: Dict[str, Any] = {
+        "version": 2,
+        "events": events,
+        "pcrs": {
+            alg_name: {str(idx): int.from_bytes(value, "big") for idx, value in sorted(bank.items())}
+            for alg_name, bank in pcrs.items()
+        },
+    }
+    log["boot_aggregates"] = _boot_aggregates(pcrs)
+    return log
+
+
+def _boot_aggregates(pcrs: Dict[str, Dict[int, bytes]]) -> Dict[str, List[str]]:
+    """Calculate the possible boot aggregates for 8 and 10 participant PCRs"""
+    boot_aggregates: Dict[str, List[str]] = {}
+    for alg_name, bank in pcrs.items():
+        boot_aggregates[alg_name] = []
+        for maxpcr in [8, 10]:
+            if any(pcrno not in bank for pcrno in range(maxpcr)):
+                continue
+            h = hashlib.new(alg_name)
+            for pcrno in range(maxpcr):
+                h.update(bank[pcrno])
+            boot_aggregates[alg_name].append(h.hexdigest())
+    return boot_aggregates
+
+
+def parse_binary_bootlog(log_bin: bytes) -> typing.Tuple[Failure, typing.Optional[Dict[str, Any]]]:
+    """Parse a binary BIOS boot log
+    The input is the binary log.
+    The output is the parsed log, in the format used by `tpm2_tools_elparser`."""
+    failure = Failure(Component.MEASURED_BOOT, ["parser"])
+    try:
+        return failure, parse_eventlog(log_bin)
+    except (EventLogError, struct.error) as e:
+        logger.error("Could not parse the measured boot event log: %s", e)
+        failure.add_event("log.parse", {"context": "Measured boot event log could not be parsed", "data": str(e)}, True)
+        return failure, None
+
+
+def bootlog_parse(
+    mb_measurement_list: Optional[str], hash_alg: str
+) -> typing.Tuple["MBPCRDict", "MBAgg", "MBLog", Failure]:
+    """
+    Parse the measured boot log and return its object and the state of the PCRs
+    :param mb_measurement_list: The measured boot measurement list
+    :param hash_alg: the hash algorithm that should be used for the PCRs
+    :returns: Returns a map of the state of the PCRs, measured boot data object and True for success
+    and False in case an error occurred
+    """
+    failure = Failure(Component.MEASURED_BOOT, ["parser"])
+    if not mb_measurement_list:
+        return {}, None, {}, failure
+
+    try:
+        log_bin = base64.b64decode(mb_measurement_list, validate=True)
+    except binascii.Error:
+        failure.add_event("log.base64decode", "Measured boot log could not be decoded", True)
+        return {}, None, {}, failure
+
+    failure_mb, mb_measurement_data = parse_binary_bootlog(log_bin)
+    if not mb_measurement_data:
+        failure.merge(failure_mb)
+        logger.error("Unable to parse measured boot event log. Check previous messages for a reason for error.")
+        return {}, None, {}, failure
+
+    pcr_hashes = mb_measurement_data["pcrs"].get(hash_alg)
+    if not pcr_hashes:
+        logger.error("Parse of measured boot event log has unexpected value for .pcrs.%s: %r", hash_alg, pcr_hashes)
+        failure.add_event("invalid_pcrs_hashes", {"got": pcr_hashes}, True)
+        return {}, None, {}, failure
+
+    boot_aggregates = mb_measurement_data["boot_aggregates"]
+    if not boot_aggregates:
+        logger.error("Parse of measured boot event log has unexpected value for .boot_aggragtes: %r", boot_aggregates)
+        failure.add_event("invalid_boot_aggregates", {"got": boot_aggregates}, True)
+        return {}, None, {}, failure
+
+    return pcr_hashes, boot_aggregates, mb_measurement_data, failure
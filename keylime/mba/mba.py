@@ -1,3 +1,4 @@
+import hashlib
 import importlib
 from inspect import isfunction
 from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
@@ -73,7 +74,7 @@ def load_imports(skip_custom_policies: Optional[bool] = False) -> None:
         # these are the defaults
         imports.append("keylime.mba.elchecking.elchecker")
         imports.append("keylime.mba.elchecking.example")
-        imports.append("keylime.mba.elparsing.tpm2_tools_elparser")
+        imports.append("keylime.mba.elparsing.tcg_elparser")
         # initialize all modules if they carry an initialization function.
         for m in imports:
             _mba_imports.append(importlib.import_module(m, __package__))
@@ -201,5 +202,6 @@ def mb_policy_db_contents(mb_policy_name: str, mb_policy: Optional[str]) -> Dict
 
     mb_policy_db_format["name"] = mb_policy_name
     mb_policy_db_format["mb_policy"] = mb_policy
+    mb_policy_db_format["checksum"] = hashlib.sha256(mb_policy.encode()).hexdigest() if mb_policy is not None else None
 
     return mb_policy_db_format
@@ -0,0 +1,55 @@
+"""add checksum to mbpolicies
+
+Revision ID: 8a4f1c2d9e3b
+Revises: 57b24ee21dfa
+Create Date: 2026-10-16 09:12:41.207319
+
+"""
+
+import hashlib
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8a4f1c2d9e3b"
+down_revision = "57b24ee21dfa"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name):
+    globals()[f"upgrade_{engine_name}"]()
+
+
+def downgrade(engine_name):
+    globals()[f"downgrade_{engine_name}"]()
+
+
+def upgrade_registrar():
+    pass
+
+
+def downgrade_registrar():
+    pass
+
+
+def upgrade_cloud_verifier():
+    op.add_column("mbpolicies", sa.Column("checksum", sa.String(128)))
+
+    # Compute the checksum of the existing MB policies
+    conn = op.get_bind()
+    meta = sa.MetaData()
+    meta.reflect(bind=conn, only=("mbpolicies",))
+    mbpolicies = meta.tables["mbpolicies"]
+
+    res = conn.execute(sa.text("SELECT id, mb_policy FROM mbpolicies"))
+    for policy_id, mb_policy in res.fetchall():
+        if mb_policy is None:
+            continue
+        checksum = hashlib.sha256(mb_policy.encode()).hexdigest()
+        conn.execute(mbpolicies.update().where(mbpolicies.c.id == policy_id).values(checksum=checksum))
+
+
+def downgrade_cloud_verifier():
+    op.drop_column("mbpolicies", "checksum")
@@ -0,0 +1,67 @@
+"""add compiled runtime policies
+
+Revision ID: c71e5f0a2b94
+Revises: 8a4f1c2d9e3b
+Create Date: 2026-10-16 14:03:27.581934
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from keylime import keylime_logging
+from keylime.ima import ima
+from keylime.ima.policy_artifact import serialize_policy
+
+logger = keylime_logging.init_logging("db_migrations")
+
+# revision identifiers, used by Alembic.
+revision = "c71e5f0a2b94"
+down_revision = "8a4f1c2d9e3b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name):
+    globals()[f"upgrade_{engine_name}"]()
+
+
+def downgrade(engine_name):
+    globals()[f"downgrade_{engine_name}"]()
+
+
+def upgrade_registrar():
+    pass
+
+
+def downgrade_registrar():
+    pass
+
+
+def upgrade_cloud_verifier():
+    op.add_column(
+        "allowlists",
+        sa.Column("ima_policy_compiled", sa.LargeBinary().with_variant(sa.LargeBinary(429400000), "mysql")),
+    )
+
+    # Compile the existing runtime policies
+    conn = op.get_bind()
+    meta = sa.MetaData()
+    meta.reflect(bind=conn, only=("allowlists",))
+    allowlists = meta.tables["allowlists"]
+
+    res = conn.execute(sa.text("SELECT id, ima_policy FROM allowlists"))
+    for policy_id, ima_policy in res.fetchall():
+        if ima_policy is None:
+            continue
+        try:
+            artifact = serialize_policy(dict(ima.deserialize_runtime_policy(ima_policy)))
+        except Exception as e:
+            # The verifier compiles policies without artifact itself
+            logger.warning("Could not compile runtime policy %s: %s", policy_id, e)
+            continue
+        conn.execute(allowlists.update().where(allowlists.c.id == policy_id).values(ima_policy_compiled=artifact))
+
+
+def downgrade_cloud_verifier():
+    op.drop_column("allowlists", "ima_policy_compiled")
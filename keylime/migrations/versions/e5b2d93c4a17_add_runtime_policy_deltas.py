@@ -0,0 +1,40 @@
+"""add runtime policy deltas
+
+Revision ID: e5b2d93c4a17
+Revises: c71e5f0a2b94
+Create Date: 2026-10-16 16:41:08.112734
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e5b2d93c4a17"
+down_revision = "c71e5f0a2b94"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name):
+    globals()[f"upgrade_{engine_name}"]()
+
+
+def downgrade(engine_name):
+    globals()[f"downgrade_{engine_name}"]()
+
+
+def upgrade_registrar():
+    pass
+
+
+def downgrade_registrar():
+    pass
+
+
+def upgrade_cloud_verifier():
+    op.add_column("allowlists", sa.Column("ima_policy_delta", sa.Text().with_variant(sa.Text(429400000), "mysql")))
+
+
+def downgrade_cloud_verifier():
+    op.drop_column("allowlists", "ima_policy_delta")
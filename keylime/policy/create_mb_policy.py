@@ -10,7 +10,7 @@ import re
 import sys
 from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-from keylime.mba.elparsing.tpm2_tools_elparser import parse_binary_bootlog
+from keylime.mba.elparsing.tcg_elparser import parse_binary_bootlog
 from keylime.policy.logger import Logger
 
 if TYPE_CHECKING:
@@ -0,0 +1,112 @@
+"""Fan-out of revocation notifications to the agents of a verifier
+
+With the "agent" revocation notifier, every failed attestation is sent to
+all the agents of the verifier. The RevocationDispatcher sends these
+notifications from the IOLoop of the verifier worker through its own
+pooled Tornado HTTP client. At most the configured number of requests are
+outstanding at the same time, and each recipient is given up on after its
+timeout, so that one unreachable agent does not hold up the others.
+
+The TLS contexts for the agents are kept in an LRU cache keyed by the
+agent certificate, instead of being created for every notification.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from tornado import httpclient
+
+from keylime import config, keylime_logging, web_util
+
+logger = keylime_logging.init_logging("verifier")
+
+# Default maximum number of notifications sent at the same time
+DEFAULT_CONCURRENCY = 100
+
+# Default number of agent TLS contexts kept
+DEFAULT_TLS_CONTEXT_CACHE_SIZE = 10000
+
+SendFunc = Callable[[Dict[str, Any], httpclient.AsyncHTTPClient], Awaitable[bool]]
+
+
+class RevocationDispatcher:
+    instance: Optional["RevocationDispatcher"] = None
+
+    @staticmethod
+    def get_instance() -> "RevocationDispatcher":
+        """Create and return a singleton RevocationDispatcher"""
+        if RevocationDispatcher.instance is None:
+            concurrency = config.getint("verifier", "revocation_notification_concurrency", fallback=DEFAULT_CONCURRENCY)
+            RevocationDispatcher.instance = RevocationDispatcher(concurrency)
+        return RevocationDispatcher.instance
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, tls_cache_size: int = DEFAULT_TLS_CONTEXT_CACHE_SIZE):
+        """constructor
+
+        :param concurrency: the maximum number of notifications sent at the same time
+        :param tls_cache_size: the maximum number of agent TLS contexts kept
+        """
+        self.concurrency = max(concurrency, 1)
+        self.tls_cache_size = tls_cache_size
+        self.tls_contexts: "OrderedDict[str, Any]" = OrderedDict()
+        self.lock = Lock()
+        self._client: Optional[httpclient.AsyncHTTPClient] = None
+
+    @property
+    def client(self) -> httpclient.AsyncHTTPClient:
+        """The HTTP client of the dispatcher, created on first use on the IOLoop of the caller"""
+        if self._client is None:
+            # The shared AsyncHTTPClient only has 10 connections and would queue the rest
+            self._client = httpclient.AsyncHTTPClient(force_instance=True, max_clients=self.concurrency)
+        return self._client
+
+    def tls_context(self, mtls_cert: Optional[str]) -> Any:
+        """Return the TLS context to connect to the agent with the given certificate"""
+        if not mtls_cert or mtls_cert == "disabled":
+            return None
+
+        with self.lock:
+            if mtls_cert in self.tls_contexts:
+                self.tls_contexts.move_to_end(mtls_cert)
+                return self.tls_contexts[mtls_cert]
+
+        context = web_util.generate_agent_tls_context("verifier", mtls_cert, logger=logger)
+        with self.lock:
+            self.tls_contexts[mtls_cert] = context
+            while len(self.tls_contexts) > self.tls_cache_size:
+                self.tls_contexts.popitem(last=False)
+        return context
+
+    async def dispatch(self, recipients: Iterable[Dict[str, Any]], send: SendFunc, timeout: float) -> Dict[str, Any]:
+        """Send a notification to all recipients and return the statistics of the fan-out
+
+        :param recipients: the agents to notify, passed to send
+        :param send: sends the notification to one agent with the given client, True on success
+        :param timeout: the time after which a recipient is given up on
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        stats: Dict[str, Any] = {"recipients": 0, "succeeded": 0, "failed": 0, "timed_out": 0}
+
+        async def send_one(recipient: Dict[str, Any]) -> None:
+            async with semaphore:
+                try:
+                    succeeded = await asyncio.wait_for(send(recipient, self.client), timeout)
+                except asyncio.TimeoutError:
+                    logger.warning("Timeout notifying agent %s of a revocation", recipient["agent_id"])
+                    stats["timed_out"] += 1
+                    return
+                except Exception as e:
+                    logger.warning("Failed to notify agent %s of a revocation: %s", recipient["agent_id"], e)
+                    succeeded = False
+                stats["succeeded" if succeeded else "failed"] += 1
+
+        start = time.monotonic()
+        tasks = [send_one(recipient) for recipient in recipients]
+        stats["recipients"] = len(tasks)
+        if tasks:
+            await asyncio.gather(*tasks)
+        stats["elapsed"] = round(time.monotonic() - start, 3)
+        return stats
@@ -1,11 +1,13 @@
-import functools
+import heapq
 import os
+import shutil
 import signal
 import sys
 import threading
 import time
+from collections import deque
 from multiprocessing import Process
-from typing import Any, Callable, Dict, Optional, Set
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
 
 import requests
 
@@ -13,23 +15,73 @@ from keylime import config, crypto, json, keylime_logging, web_util
 from keylime.common import retry
 from keylime.config import DEFAULT_MAX_RETRIES, DEFAULT_TIMEOUT
 from keylime.requests_client import RequestsClient
+from keylime.revocation_outbox import RevocationOutbox
 
 logger = keylime_logging.init_logging("revocation_notifier")
 broker_proc: Optional[Process] = None
 
 _SOCKET_PATH = "/var/run/keylime/keylime.verifier.ipc"
 
+# Default maximum number of revocation notifications queued for the ZeroMQ broker
+DEFAULT_ZMQ_QUEUE_SIZE = 1000
+
+# Time allowed to send the queued ZeroMQ notifications when a worker stops
+ZMQ_LINGER_MS = 1000
+
+# Maximum interval between attempts to reconnect to the ZeroMQ broker
+ZMQ_RECONNECT_IVL_MAX_MS = 5000
+
+# Default maximum number of webhook notifications waiting to be sent
+DEFAULT_WEBHOOK_QUEUE_SIZE = 10000
+
 # Global webhook manager instance (initialized when needed)
 _webhook_manager: Optional["WebhookNotificationManager"] = None
 
 
-class WebhookNotificationManager:
-    """Manages webhook worker threads and graceful shutdown for revocation notifications."""
+class _WebhookDelivery:
+    """Revocation events sent to the webhook in one request"""
+
+    __slots__ = ("due", "seq", "events", "outbox_ids", "attempt")
+
+    def __init__(self, seq: int, entries: List[Tuple[Optional[int], Dict[str, Any]]]):
+        self.due = 0.0
+        self.seq = seq
+        self.events = [event for _, event in entries]
+        self.outbox_ids = [entry_id for entry_id, _ in entries if entry_id is not None]
+        self.attempt = 0
+
+    def __lt__(self, other: "_WebhookDelivery") -> bool:
+        return (self.due, self.seq) < (other.due, other.seq)
 
-    def __init__(self) -> None:
+
+class WebhookNotificationManager:
+    """Delivers revocation notifications to the webhook from a single worker thread.
+
+    Notifications are queued in a bounded queue and sent by one long-lived
+    worker thread through a single HTTP session, so that connections are
+    reused. Failed deliveries are scheduled for a retry with backoff instead
+    of keeping a thread sleeping, and the other notifications are sent in
+    the meantime. Up to webhook_batch_size queued notifications can be sent
+    in one request, as a JSON list.
+
+    If webhook_outbox_dir is set, the notifications are also kept in a
+    RevocationOutbox until the webhook accepts them. Each verifier worker
+    process uses its own subdirectory and sends the notifications left there
+    by the previous run when it starts.
+    """
+
+    def __init__(self, worker_id: int = 0, num_workers: int = 1) -> None:
+        """constructor
+
+        :param worker_id: the number of the verifier worker process, selecting its outbox
+        :param num_workers: the number of verifier worker processes
+        """
         self._shutdown_event = threading.Event()
-        self._workers: Set[threading.Thread] = set()
-        self._workers_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._queue: Deque[Tuple[Optional[int], Dict[str, Any]]] = deque()
+        self._retries: List[_WebhookDelivery] = []
+        self._seq = 0
+        self._worker: Optional[threading.Thread] = None
 
         # Read all configuration once during initialization
         self._webhook_url = config.get("verifier", "webhook_url", section="revocations", fallback="")
@@ -37,6 +89,10 @@ class WebhookNotificationManager:
         self._retry_interval = config.getfloat("verifier", "retry_interval")
         self._exponential_backoff = config.getboolean("verifier", "exponential_backoff")
         self._max_retries = config.getint("verifier", "max_retries")
+        self._queue_size = config.getint(
+            "verifier", "webhook_queue_size", section="revocations", fallback=DEFAULT_WEBHOOK_QUEUE_SIZE
+        )
+        self._batch_size = max(config.getint("verifier", "webhook_batch_size", section="revocations", fallback=1), 1)
 
         # Validate max_retries
         if self._max_retries <= 0:
@@ -53,8 +109,38 @@ class WebhookNotificationManager:
             cert, key, trusted_ca, key_password, is_client=True, logger=logger
         )
 
+        self._outbox: Optional[RevocationOutbox] = None
+        outbox_dir = config.get("verifier", "webhook_outbox_dir", section="revocations", fallback="")
+        if outbox_dir and self._webhook_url != "":
+            self._outbox = RevocationOutbox(os.path.join(outbox_dir, str(worker_id)))
+            if worker_id == 0:
+                self._adopt_outboxes(outbox_dir, num_workers)
+            self._queue.extend(self._outbox.unacknowledged())
+            if self._queue:
+                self._start_worker()
+
+    def _adopt_outboxes(self, outbox_dir: str, num_workers: int) -> None:
+        """Move the notifications left by workers of a previous run with more workers to this outbox"""
+        assert self._outbox is not None
+        for name in os.listdir(outbox_dir):
+            if not name.isdigit() or int(name) < num_workers:
+                continue
+            path = os.path.join(outbox_dir, name)
+            outbox = RevocationOutbox(path)
+            for _, msg in outbox.unacknowledged():
+                self._outbox.append(msg)
+            outbox.close()
+            self._outbox.sync()
+            shutil.rmtree(path)
+
+    def _start_worker(self) -> None:
+        """Start the worker thread if it is not running; must be called with the condition held"""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="webhook", daemon=True)
+            self._worker.start()
+
     def notify_webhook(self, tosend: Dict[str, Any]) -> None:
-        """Send webhook notification with worker thread management."""
+        """Queue a webhook notification for the worker thread."""
         # Check if a url was specified
         if self._webhook_url == "":
             return
@@ -62,128 +148,215 @@ class WebhookNotificationManager:
         # Similarly to notify(), let's convert `tosend' to str to prevent
         # possible issues with json handling by python-requests.
         tosend = json.bytes_to_str(tosend)
-
-        def worker_webhook(tosend: Dict[str, Any]) -> None:
-            is_shutdown_mode = False
-            try:
-                # Use cached configuration values
-                max_retries = self._max_retries
-
-                # During shutdown, use fewer retries but still make best effort
-                if self._shutdown_event.is_set():
-                    is_shutdown_mode = True
-                    max_retries = min(max_retries, 3)  # Reduce retries during shutdown but still try
-                    logger.info(
-                        "Shutdown mode: attempting to send critical revocation notification with %d retries",
-                        max_retries,
+        outbox_id = self._outbox.append(tosend) if self._outbox is not None else None
+
+        with self._condition:
+            if len(self._queue) >= self._queue_size:
+                if outbox_id is not None:
+                    logger.error(
+                        "Webhook notification queue is full with %d notifications, "
+                        "revocation notification is only kept in the outbox until the next start",
+                        len(self._queue),
                     )
-
-                logger.info("Sending revocation event via webhook to %s ...", self._webhook_url)
-                for i in range(max_retries):
-                    next_retry = retry.retry_time(self._exponential_backoff, self._retry_interval, i, logger)
-
-                    with RequestsClient(
-                        self._webhook_url,
-                        self._verify_server_cert,
-                        self._tls_context,
-                    ) as client:
-                        try:
-                            res = client.post("", json=tosend, timeout=self._request_timeout)
-                        except requests.exceptions.SSLError as ssl_error:
-                            if "TLSV1_ALERT_UNKNOWN_CA" in str(ssl_error):
-                                logger.warning(
-                                    "Keylime does not recognize certificate from peer. Check if verifier 'trusted_server_ca' is configured correctly"
-                                )
-
-                            raise ssl_error from ssl_error
-                        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
-                            # During shutdown, only suppress errors on the final attempt after all retries exhausted
-                            if is_shutdown_mode and i == max_retries - 1:
-                                logger.warning(
-                                    "Final attempt to send revocation notification failed during shutdown: %s", e
-                                )
-                                return
-                            # Otherwise, let the retry logic handle it
-                            raise e
-
-                        if res and res.status_code in [200, 202]:
-                            if is_shutdown_mode:
-                                logger.info("Successfully sent revocation notification during shutdown")
-                            break
-
-                        logger.debug(
-                            "Unable to publish revocation message %d times via webhook, "
-                            "trying again in %d seconds. "
-                            "Server returned status code: %s",
-                            i + 1,
-                            next_retry,
-                            res.status_code,
-                        )
-
-                        # During shutdown, use shorter retry intervals to complete faster
-                        if is_shutdown_mode:
-                            next_retry = min(next_retry, 2.0)  # Cap retry interval during shutdown
-
-                        time.sleep(next_retry)
-
-            except Exception as e:
-                # Only suppress errors during final shutdown phase and log appropriately
-                if is_shutdown_mode:
-                    logger.warning("Failed to send revocation notification during shutdown: %s", e)
                 else:
-                    logger.error("Error in webhook worker: %s", e)
-            finally:
-                # Remove this worker from the active set
-                current_thread = threading.current_thread()
-                with self._workers_lock:
-                    self._workers.discard(current_thread)
-
-        w = functools.partial(worker_webhook, tosend)
-        t = threading.Thread(target=w, daemon=True)
+                    logger.error(
+                        "Webhook notification queue is full with %d notifications, dropping revocation notification",
+                        len(self._queue),
+                    )
+                return
+            self._queue.append((outbox_id, tosend))
+            self._start_worker()
+            self._condition.notify()
+
+    def _next_delivery(self) -> Optional[_WebhookDelivery]:
+        """Return the next delivery that is due, retries first; must be called with the condition held"""
+        if self._retries and self._retries[0].due <= time.monotonic():
+            return heapq.heappop(self._retries)
+        if self._queue:
+            events = [self._queue.popleft() for _ in range(min(self._batch_size, len(self._queue)))]
+            self._seq += 1
+            return _WebhookDelivery(self._seq, events)
+        return None
+
+    def _run(self) -> None:
+        logger.info("Sending revocation events via webhook to %s ...", self._webhook_url)
+        # The session keeps the connection to the webhook open between notifications
+        with RequestsClient(self._webhook_url, self._verify_server_cert, self._tls_context) as client:
+            while True:
+                with self._condition:
+                    delivery = self._next_delivery()
+                    while delivery is None:
+                        if self._shutdown_event.is_set() and not self._retries:
+                            # Notifications queued from now on start a new worker
+                            self._worker = None
+                            return
+                        timeout = max(self._retries[0].due - time.monotonic(), 0) if self._retries else None
+                        self._condition.wait(timeout)
+                        delivery = self._next_delivery()
+                if self._outbox is not None:
+                    # Write all the notifications queued so far to disk at once
+                    self._outbox.sync()
+                self._deliver(client, delivery)
+
+    def _deliver(self, client: RequestsClient, delivery: _WebhookDelivery) -> None:
+        is_shutdown_mode = self._shutdown_event.is_set()
+        # During shutdown, use fewer retries but still make best effort
+        max_retries = min(self._max_retries, 3) if is_shutdown_mode else self._max_retries
+
+        payload: Any = delivery.events if self._batch_size > 1 else delivery.events[0]
+        try:
+            res = client.post("", json=payload, timeout=self._request_timeout)
+            if res and res.status_code in [200, 202]:
+                if is_shutdown_mode:
+                    logger.info("Successfully sent revocation notification during shutdown")
+                if self._outbox is not None:
+                    for outbox_id in delivery.outbox_ids:
+                        self._outbox.ack(outbox_id)
+                return
+            error = f"Server returned status code: {res.status_code}"
+        except requests.exceptions.SSLError as ssl_error:
+            if "TLSV1_ALERT_UNKNOWN_CA" in str(ssl_error):
+                logger.warning(
+                    "Keylime does not recognize certificate from peer. Check if verifier 'trusted_server_ca' is configured correctly"
+                )
+            logger.error("Error in webhook worker: %s", ssl_error)
+            return
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = str(e)
+        except Exception as e:
+            logger.error("Error in webhook worker: %s", e)
+            return
 
-        # Add this worker to the active set
-        with self._workers_lock:
-            self._workers.add(t)
+        delivery.attempt += 1
+        if delivery.attempt >= max_retries:
+            if is_shutdown_mode:
+                logger.warning("Failed to send revocation notification during shutdown: %s", error)
+            else:
+                logger.error(
+                    "Unable to publish %d revocation messages via webhook after %d attempts: %s",
+                    len(delivery.events),
+                    delivery.attempt,
+                    error,
+                )
+            if delivery.outbox_ids:
+                logger.info(
+                    "%d revocation messages are kept in the outbox until the next start", len(delivery.outbox_ids)
+                )
+            return
 
-        t.start()
+        next_retry = retry.retry_time(self._exponential_backoff, self._retry_interval, delivery.attempt - 1, logger)
+        if is_shutdown_mode:
+            # During shutdown, use shorter retry intervals to complete faster
+            next_retry = min(next_retry, 2.0)
+        logger.debug(
+            "Unable to publish revocation message %d times via webhook, trying again in %d seconds. %s",
+            delivery.attempt,
+            next_retry,
+            error,
+        )
+        delivery.due = time.monotonic() + next_retry
+        with self._condition:
+            heapq.heappush(self._retries, delivery)
 
     def shutdown_workers(self) -> None:
-        """Signal webhook workers to shut down gracefully and wait for them to complete.
+        """Signal the webhook worker to shut down gracefully and wait for it to complete.
 
-        This gives workers time to complete their critical revocation notifications
+        This gives the worker time to send the queued revocation notifications
         before the service shuts down completely.
         """
         logger.info("Shutting down webhook workers gracefully...")
-        self._shutdown_event.set()
+        with self._condition:
+            self._shutdown_event.set()
+            # Retries scheduled before the shutdown are not waited for longer than during shutdown
+            deadline = time.monotonic() + 2.0
+            for delivery in self._retries:
+                delivery.due = min(delivery.due, deadline)
+            heapq.heapify(self._retries)
+            self._condition.notify_all()
+            worker = self._worker
+            pending = len(self._queue) + len(self._retries)
+
+        if worker is not None and worker.is_alive():
+            if pending:
+                logger.info("Waiting for webhook worker to complete %d revocation notifications...", pending)
+            # Give the worker generous time to complete critical revocation notifications
+            worker.join(timeout=30.0)
+            if worker.is_alive():
+                logger.warning("Webhook worker did not complete within timeout")
+
+        if self._outbox is not None:
+            self._outbox.close()
 
-        # Give workers generous time to complete critical revocation notifications
-        timeout = 30.0  # Increased timeout for critical security notifications
-        end_time = time.time() + timeout
+        logger.info("Webhook workers shutdown complete")
 
-        with self._workers_lock:
-            workers_to_wait = list(self._workers)
 
-        if workers_to_wait:
-            logger.info("Waiting for %d webhook workers to complete revocation notifications...", len(workers_to_wait))
+class ZmqPublisher:
+    """Long-lived socket sending the revocation notifications of a verifier worker to the broker
 
-        for worker in workers_to_wait:
-            remaining_time = max(0, end_time - time.time())
-            if remaining_time > 0:
-                logger.debug(
-                    "Waiting for webhook worker %s to complete (timeout: %.1f seconds)", worker.name, remaining_time
-                )
-                worker.join(timeout=remaining_time)
-                if worker.is_alive():
-                    logger.warning("Webhook worker %s did not complete within timeout", worker.name)
-            else:
-                logger.warning("Timeout exceeded while waiting for webhook workers")
-                break
+    The socket is a PUSH socket connected once to the IPC socket of the
+    broker. ZeroMQ queues up to zmq_queue_size notifications while the
+    broker is not reachable and reconnects by itself; further notifications
+    are dropped instead of blocking the verifier.
+    """
 
-        # Clean up completed workers
-        with self._workers_lock:
-            self._workers.clear()
+    instance: Optional["ZmqPublisher"] = None
 
-        logger.info("Webhook workers shutdown complete")
+    @staticmethod
+    def get_instance() -> "ZmqPublisher":
+        """Create and return the ZmqPublisher of this process"""
+        # A ZeroMQ context must not be used across fork()
+        if ZmqPublisher.instance is None or ZmqPublisher.instance.pid != os.getpid():
+            queue_size = config.getint(
+                "verifier", "zmq_queue_size", section="revocations", fallback=DEFAULT_ZMQ_QUEUE_SIZE
+            )
+            ZmqPublisher.instance = ZmqPublisher(f"ipc://{_SOCKET_PATH}", queue_size)
+        return ZmqPublisher.instance
+
+    def __init__(self, address: str, queue_size: int = DEFAULT_ZMQ_QUEUE_SIZE) -> None:
+        """constructor
+
+        :param address: the address of the broker
+        :param queue_size: the maximum number of notifications queued for the broker
+        """
+        zmq = _import_zmq()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.context = zmq.Context()  # pylint: disable=abstract-class-instantiated
+        self.socket: Any = self.context.socket(zmq.PUSH)
+        self.socket.setsockopt(zmq.SNDHWM, queue_size)
+        self.socket.setsockopt(zmq.LINGER, ZMQ_LINGER_MS)
+        self.socket.setsockopt(zmq.RECONNECT_IVL_MAX, ZMQ_RECONNECT_IVL_MAX_MS)
+        self.socket.connect(address)
+
+    def send(self, tosend: Dict[str, Any]) -> bool:
+        """Queue a notification for the broker without blocking, False if it was dropped"""
+        zmq = _import_zmq()
+        with self.lock:
+            if self.socket is None:
+                logger.error("ZeroMQ publisher is closed, dropping revocation notification")
+                return False
+            try:
+                self.socket.send_string(json.dumps(tosend), zmq.NOBLOCK)
+            except zmq.Again:
+                logger.error(
+                    "ZeroMQ revocation notification queue is full, the broker is not reachable; "
+                    "dropping revocation notification"
+                )
+                return False
+            except zmq.ZMQError as e:
+                logger.error("Unable to publish revocation message: %s", e)
+                return False
+        return True
+
+    def close(self) -> None:
+        """Close the socket, waiting up to ZMQ_LINGER_MS for the queued notifications to be sent"""
+        with self.lock:
+            if self.socket is None:
+                return
+            self.socket.close()
+            self.socket = None
+            if self.pid == os.getpid():
+                self.context.term()
 
 
 def _get_webhook_manager() -> WebhookNotificationManager:
@@ -200,12 +373,17 @@ def get_notifiers() -> Set[str]:
     return notifiers.intersection({"zeromq", "webhook", "agent"})
 
 
-def start_broker() -> None:
-    assert "zeromq" in get_notifiers()
+def _import_zmq() -> Any:
     try:
         import zmq  # pylint: disable=import-outside-toplevel
     except ImportError as error:
         raise Exception("install PyZMQ for 'zeromq' in 'enabled_revocation_notifications' option") from error
+    return zmq
+
+
+def start_broker() -> None:
+    assert "zeromq" in get_notifiers()
+    zmq = _import_zmq()
 
     def worker() -> None:
         def sig_handler(*_: Any) -> None:
@@ -224,11 +402,10 @@ def start_broker() -> None:
                 raise Exception(msg)
 
         context = zmq.Context(1)  # pylint: disable=abstract-class-instantiated
-        frontend = context.socket(zmq.SUB)
+        # Socket facing the publishers of the verifier workers
+        frontend = context.socket(zmq.PULL)
         frontend.bind(f"ipc://{_SOCKET_PATH}")
 
-        frontend.setsockopt(zmq.SUBSCRIBE, b"")
-
         # Socket facing services
         backend = context.socket(zmq.PUB)
         backend.bind(
@@ -258,18 +435,33 @@ def stop_broker() -> None:
             broker_proc.kill()  # pylint: disable=E1101
 
 
+def init_webhook_manager(worker_id: int, num_workers: int) -> None:
+    """Create the global webhook manager of a verifier worker process, sending the notifications left in its outbox"""
+    global _webhook_manager
+    if _webhook_manager is None:
+        _webhook_manager = WebhookNotificationManager(worker_id, num_workers)
+
+
 def shutdown_webhook_workers() -> None:
     """Convenience function to shutdown webhook workers using the global manager."""
-    manager = _get_webhook_manager()
-    manager.shutdown_workers()
+    if _webhook_manager is not None:
+        _webhook_manager.shutdown_workers()
+
+
+def start_publisher() -> None:
+    """Connect the ZeroMQ publisher of this verifier worker to the broker"""
+    assert "zeromq" in get_notifiers()
+    ZmqPublisher.get_instance()
+
+
+def stop_publisher() -> None:
+    if ZmqPublisher.instance is not None:
+        ZmqPublisher.instance.close()
+        ZmqPublisher.instance = None
 
 
 def notify(tosend: Dict[str, Any]) -> None:
     assert "zeromq" in get_notifiers()
-    try:
-        import zmq  # pylint: disable=import-outside-toplevel
-    except ImportError as error:
-        raise Exception("install PyZMQ for 'zeromq' in 'revocation_notifier' option") from error
 
     # python-requests internally uses either simplejson (preferred) or
     # the built-in json module, and when it is using the built-in one,
@@ -277,34 +469,8 @@ def notify(tosend: Dict[str, Any]) -> None:
     # To avoid such issues, let's convert `tosend' to str beforehand.
     tosend = json.bytes_to_str(tosend)
 
-    def worker(tosend: Dict[str, Any]) -> None:
-        context = zmq.Context()  # pylint: disable=abstract-class-instantiated
-        mysock = context.socket(zmq.PUB)
-        mysock.connect(f"ipc://{_SOCKET_PATH}")
-        # wait 100ms for connect to happen
-        time.sleep(0.2)
-        # now send it out via 0mq
-        logger.info("Sending revocation event to listening nodes...")
-        for i in range(config.getint("verifier", "max_retries")):
-            try:
-                mysock.send_string(json.dumps(tosend))
-                break
-            except Exception as e:
-                interval = config.getfloat("verifier", "retry_interval")
-                exponential_backoff = config.getboolean("verifier", "exponential_backoff")
-                next_retry = retry.retry_time(exponential_backoff, interval, i, logger)
-                logger.debug(
-                    "Unable to publish revocation message %d times, trying again in %f seconds: %s",
-                    i,
-                    next_retry,
-                    e,
-                )
-                time.sleep(next_retry)
-        mysock.close()
-
-    cb = functools.partial(worker, tosend)
-    t = threading.Thread(target=cb)
-    t.start()
+    logger.info("Sending revocation event to listening nodes...")
+    ZmqPublisher.get_instance().send(tosend)
 
 
 def notify_webhook(tosend: Dict[str, Any]) -> None:
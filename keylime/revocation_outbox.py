@@ -0,0 +1,180 @@
+"""Durable outbox for revocation notifications
+
+Revocation notifications are appended to a log file in the outbox
+directory before they are sent, and acknowledged once the receiver has
+accepted them. Notifications that were not acknowledged when the verifier
+stopped, e.g. because the receiver was down for longer than the retry
+budget, are found again and sent when the verifier starts. Delivery is
+therefore at least once: a notification whose acknowledgement was not yet
+written may be sent twice.
+
+The log consists of JSON lines, either {"id": <id>, "msg": <notification>}
+or {"ack": <id>}. Writes are flushed to disk in batches: whenever the
+sender is about to send and, on the appending side, at most once per
+sync interval. When the log grows beyond the segment size, it is replaced
+by a new segment holding only the pending notifications.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from keylime import json, keylime_logging
+
+logger = keylime_logging.init_logging("revocation_notifier")
+
+# Default size of the log after which it is compacted
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+
+# Default maximum time appended notifications are kept only in the page cache
+DEFAULT_SYNC_INTERVAL = 1.0
+
+_SEGMENT_PREFIX = "outbox-"
+_SEGMENT_SUFFIX = ".log"
+
+
+class RevocationOutbox:
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        sync_interval: float = DEFAULT_SYNC_INTERVAL,
+    ):
+        """constructor
+
+        :param directory: the directory holding the log, created if needed
+        :param segment_size: the size of the log after which it is compacted
+        :param sync_interval: the maximum time appended notifications are not synced to disk
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.pending: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.next_id = 1
+        self.segment = 0
+        self.file: Optional[IO[str]] = None
+        self.dirty = False
+        self.last_sync = time.monotonic()
+
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        segments = self._replay()
+        self._compact(segments)
+        if self.pending:
+            logger.info("Found %d unacknowledged revocation notifications in %s", len(self.pending), directory)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{_SEGMENT_PREFIX}{segment:08d}{_SEGMENT_SUFFIX}")
+
+    def _replay(self) -> List[int]:
+        """Load the pending notifications from the existing segments and return the segment numbers"""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                try:
+                    segments.append(int(name[len(_SEGMENT_PREFIX) : -len(_SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        segments.sort()
+
+        for segment in segments:
+            with open(self._segment_path(segment), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A record partially written when the verifier stopped
+                        continue
+                    if "ack" in record:
+                        self.pending.pop(record["ack"], None)
+                    elif "id" in record:
+                        self.pending[record["id"]] = record["msg"]
+                        self.next_id = max(self.next_id, record["id"] + 1)
+            self.segment = segment
+        return segments
+
+    def _compact(self, old_segments: List[int]) -> None:
+        """Replace the given segments with a new one holding the pending notifications"""
+        if self.file is not None:
+            self.file.close()
+
+        self.segment += 1
+        path = self._segment_path(self.segment)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".outbox-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for entry_id, msg in self.pending.items():
+                f.write(json.dumps({"id": entry_id, "msg": msg}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        for segment in old_segments:
+            try:
+                os.remove(self._segment_path(segment))
+            except FileNotFoundError:
+                pass
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        self.file = open(path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+        self.dirty = False
+        self.last_sync = time.monotonic()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self.file is None:
+            # Closed, the record is written again at the next start
+            return
+        self.file.write(json.dumps(record) + "\n")
+        self.dirty = True
+        if self.file.tell() > self.segment_size:
+            self._compact([self.segment])
+
+    def _sync(self) -> None:
+        if self.dirty and self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+        self.last_sync = time.monotonic()
+
+    def append(self, msg: Dict[str, Any]) -> int:
+        """Add a notification to the outbox and return its id"""
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.pending[entry_id] = msg
+            self._write({"id": entry_id, "msg": msg})
+            if time.monotonic() - self.last_sync >= self.sync_interval:
+                self._sync()
+            return entry_id
+
+    def ack(self, entry_id: int) -> None:
+        """Remove a notification that was accepted by its receiver from the outbox
+
+        Acknowledgements are synced with the next batch; losing one only
+        means that the notification is sent again.
+        """
+        with self.lock:
+            if self.pending.pop(entry_id, None) is not None:
+                self._write({"ack": entry_id})
+
+    def sync(self) -> None:
+        """Write all appended notifications and acknowledgements to disk"""
+        with self.lock:
+            self._sync()
+
+    def unacknowledged(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Return the notifications not acknowledged yet, oldest first"""
+        with self.lock:
+            return list(self.pending.items())
+
+    def close(self) -> None:
+        with self.lock:
+            self._sync()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,84 @@
+"""Signing of revocation notifications with cached agent revocation keys
+
+Each agent can be given a revocation key, an RSA private key stored as PEM
+with the agent, with which the verifier signs the revocation notifications
+about the agent. Parsing the PEM key is much more expensive than signing,
+and the same keys are used again and again when many agents fail at once.
+The RevocationSigner keeps the parsed keys in an LRU cache keyed by the
+fingerprint of the PEM key, so that a key that is changed is never served
+from the cache. The key of a deleted agent is removed from the cache.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+
+from keylime import config, crypto
+
+# Default maximum number of cached revocation keys
+DEFAULT_CACHE_SIZE = 10000
+
+
+def key_fingerprint(revocation_key: Union[str, bytes]) -> str:
+    if isinstance(revocation_key, str):
+        revocation_key = revocation_key.encode("utf-8")
+    return hashlib.sha256(revocation_key).hexdigest()
+
+
+class RevocationSigner:
+    instance: Optional["RevocationSigner"] = None
+
+    @staticmethod
+    def get_instance() -> "RevocationSigner":
+        """Create and return a singleton RevocationSigner"""
+        if RevocationSigner.instance is None:
+            max_entries = config.getint("verifier", "revocation_key_cache_size", fallback=DEFAULT_CACHE_SIZE)
+            RevocationSigner.instance = RevocationSigner(max_entries)
+        return RevocationSigner.instance
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        """constructor
+
+        :param max_entries: the maximum number of cached keys; 0 disables the cache
+        """
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.keys: "OrderedDict[str, RSAPrivateKey]" = OrderedDict()
+
+    def get_key(self, revocation_key: Union[str, bytes]) -> RSAPrivateKey:
+        """Return the parsed revocation key, parsing it only if it is not cached"""
+        fingerprint = key_fingerprint(revocation_key)
+        with self.lock:
+            key = self.keys.get(fingerprint)
+            if key is not None:
+                self.keys.move_to_end(fingerprint)
+                return key
+
+        key = crypto.rsa_import_privkey(revocation_key)
+        if self.max_entries > 0:
+            with self.lock:
+                self.keys[fingerprint] = key
+                while len(self.keys) > self.max_entries:
+                    self.keys.popitem(last=False)
+        return key
+
+    def sign(self, revocation_key: Union[str, bytes], message: bytes) -> bytes:
+        """Sign a revocation message with the given PEM key, returning the base64 encoded signature"""
+        return crypto.rsa_sign(self.get_key(revocation_key), message)
+
+    def forget(self, revocation_key: Optional[Union[str, bytes]]) -> None:
+        """Remove a key from the cache, e.g. when its agent is deleted"""
+        if not revocation_key:
+            return
+        with self.lock:
+            self.keys.pop(key_fingerprint(revocation_key), None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.keys.clear()
+
+    def __len__(self) -> int:
+        return len(self.keys)
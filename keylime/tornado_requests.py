@@ -22,8 +22,9 @@ async def request(
     context: Optional[ssl.SSLContext] = None,
     headers: Optional[Union[Dict[str, str], HTTPHeaders]] = None,
     timeout: float = DEFAULT_TIMEOUT,
+    client: Optional[httpclient.AsyncHTTPClient] = None,
 ) -> TornadoResponse:
-    http_client = httpclient.AsyncHTTPClient()
+    http_client = client if client is not None else httpclient.AsyncHTTPClient()
     if params is not None and len(list(params.keys())) > 0:
         url += "?"
         for key in list(params.keys()):
@@ -1,25 +1,68 @@
 import base64
+import functools
 import struct
 import zlib
 from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 from cryptography.exceptions import InvalidSignature
-from cryptography.hazmat.primitives import serialization as crypto_serialization
 from cryptography.hazmat.primitives.asymmetric.ec import EllipticCurvePublicKey
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
 
-from keylime import cert_utils, config, json, keylime_logging
+from keylime import cert_utils, config, keylime_logging
 from keylime.agentstates import AgentAttestState, TPMClockInfo
 from keylime.common.algorithms import Hash
 from keylime.failure import Component, Failure
 from keylime.ima import ima
+from keylime.ima.compiled_policy import RuntimePolicyInputType
 from keylime.ima.file_signatures import ImaKeyrings
-from keylime.ima.types import RuntimePolicyType
 from keylime.mba import mba
+from keylime.mba.bootlog_cache import BootlogCache
 from keylime.tpm import tpm2_objects, tpm_util
+from keylime.tpm.tpm_policy import CompiledTpmPolicy, compile_tpm_policy
+from keylime.tpm.types import TpmsAttestType
 
 logger = keylime_logging.init_logging("tpm")
 
+# Maximum number of AK public keys kept loaded
+AK_CACHE_SIZE = 16384
+
+
+@functools.lru_cache(maxsize=AK_CACHE_SIZE)
+def _load_aik(aik_tpm: str) -> tpm2_objects.pubkey_type:
+    """Load the public key object from the base64-encoded TPM2B_PUBLIC of an AK
+
+    The AK of an agent does not change between quotes, so the loaded key is
+    kept instead of being converted again for every quote.
+    """
+    return tpm2_objects.pubkey_from_tpm2b_public(base64.b64decode(aik_tpm))
+
+
+class DecodedQuote:
+    """Quote data decoded once and shared by all the checks of a quote"""
+
+    __slots__ = ("quoteblob", "sigblob", "pcrblob", "_attest")
+
+    def __init__(self, quote: str, compressed: bool):
+        """Decode quote data in the format 'r<b64-compressed-quoteblob>:<b64-compressed-sigblob>:<b64-compressed-pcrblob>'
+
+        This throws an Exception on bad input.
+        """
+        self.quoteblob, self.sigblob, self.pcrblob = Tpm._get_quote_parameters(quote, compressed)
+        self._attest: Optional[TpmsAttestType] = None
+
+    @property
+    def attest(self) -> TpmsAttestType:
+        """The unmarshalled TPMS_ATTEST structure of the quote"""
+        if self._attest is None:
+            self._attest = tpm2_objects.unmarshal_tpms_attest(self.quoteblob)
+        return self._attest
+
+    @staticmethod
+    def get(quote: Union[str, "DecodedQuote"], compressed: bool) -> "DecodedQuote":
+        if isinstance(quote, DecodedQuote):
+            return quote
+        return DecodedQuote(quote, compressed)
+
 
 class Tpm:
     @staticmethod
@@ -132,7 +175,7 @@ class Tpm:
         return quoteblob, sigblob, pcrblob
 
     @staticmethod
-    def _tpm2_clock_info_from_quote(quote: str, compressed: bool) -> Dict[str, Any]:
+    def _tpm2_clock_info_from_quote(quote: Union[str, DecodedQuote], compressed: bool) -> Dict[str, Any]:
         """Get TPM timestamp info from quote
         :param quote: quote data in the format 'r<b64-compressed-quoteblob>:<b64-compressed-sigblob>:<b64-compressed-pcrblob>
         :param compressed: if the quote data is compressed with zlib or not
@@ -140,17 +183,17 @@ class Tpm:
         This function throws an Exception on bad input.
         """
 
-        quoteblob, _, _ = Tpm._get_quote_parameters(quote, compressed)
+        decoded = DecodedQuote.get(quote, compressed)
 
         try:
-            return tpm2_objects.get_tpms_attest_clock_info(quoteblob)
+            return decoded.attest["clockInfo"]
         except Exception:
             logger.exception("Error extracting clock info from quote")
             return {}
 
     @staticmethod
     def _tpm2_checkquote(
-        aikTpmFromRegistrar: str, quote: str, nonce: str, hash_alg: str, compressed: bool
+        aikTpmFromRegistrar: str, quote: Union[str, DecodedQuote], nonce: str, hash_alg: str, compressed: bool
     ) -> Tuple[Dict[int, str], str]:
         """Write the files from data returned from tpm2_quote for running tpm2_checkquote
         :param aikTpmFromRegistrar: AIK used to generate the quote and is needed for verifying it now.
@@ -161,17 +204,20 @@ class Tpm:
         :returns: Returns the 'retout' from running tpm2_checkquote and True in case of success, None and False in case of error.
         This function throws an Exception on bad input.
         """
-        aikFromRegistrar = tpm2_objects.pubkey_from_tpm2b_public(
-            base64.b64decode(aikTpmFromRegistrar),
-        ).public_bytes(
-            crypto_serialization.Encoding.PEM,
-            crypto_serialization.PublicFormat.SubjectPublicKeyInfo,
-        )
+        aikFromRegistrar = _load_aik(aikTpmFromRegistrar)
 
-        quoteblob, sigblob, pcrblob = Tpm._get_quote_parameters(quote, compressed)
+        decoded = DecodedQuote.get(quote, compressed)
 
         try:
-            pcrs_dict = tpm_util.checkquote(aikFromRegistrar, nonce, sigblob, quoteblob, pcrblob, hash_alg)
+            pcrs_dict = tpm_util.checkquote(
+                aikFromRegistrar,
+                nonce,
+                decoded.sigblob,
+                decoded.quoteblob,
+                decoded.pcrblob,
+                hash_alg,
+                attest=decoded.attest,
+            )
         except Exception as e:
             logger.exception("Error verifying quote")
             return {}, str(e)
@@ -183,7 +229,7 @@ class Tpm:
         agentAttestState: Optional[AgentAttestState],
         pcrval: str,
         ima_measurement_list: str,
-        runtime_policy: Optional[RuntimePolicyType],
+        runtime_policy: Optional[RuntimePolicyInputType],
         ima_keyrings: Optional[ImaKeyrings],
         boot_aggregates: Optional[Dict[str, List[str]]],
         hash_alg: Hash,
@@ -197,7 +243,7 @@ class Tpm:
 
         _, ima_failure = ima.process_measurement_list(
             agentAttestState,
-            ima_measurement_list.split("\n"),
+            ima.iterate_measurement_list(ima_measurement_list),
             runtime_policy,
             pcrval=pcrval,
             ima_keyrings=ima_keyrings,
@@ -212,11 +258,11 @@ class Tpm:
     def check_pcrs(
         self,
         agentAttestState: Optional[AgentAttestState],
-        tpm_policy: Union[str, Dict[str, Any]],
+        tpm_policy: Union[str, Dict[str, Any], CompiledTpmPolicy],
         pcrs_dict: Dict[int, str],
         data: str,
         ima_measurement_list: Optional[str],
-        runtime_policy: Optional[RuntimePolicyType],
+        runtime_policy: Optional[RuntimePolicyInputType],
         ima_keyrings: Optional[ImaKeyrings],
         mb_measurement_list: Optional[str],
         mb_policy: Optional[str],
@@ -232,18 +278,15 @@ class Tpm:
             agent_id = "<unknown>"
 
         if isinstance(tpm_policy, str):
-            tpm_policy_dict = json.loads(tpm_policy)
+            pcr_allowlist = compile_tpm_policy(tpm_policy)
+        elif isinstance(tpm_policy, dict):
+            pcr_allowlist = CompiledTpmPolicy(tpm_policy)
         else:
-            tpm_policy_dict = tpm_policy
+            pcr_allowlist = tpm_policy
+        policy_pcrs = pcr_allowlist.pcrs
 
-        pcr_allowlist = tpm_policy_dict.copy()
-
-        if "mask" in pcr_allowlist:
-            del pcr_allowlist["mask"]
-        # convert all pcr num keys to integers
-        pcr_allowlist = {int(k): v for k, v in list(pcr_allowlist.items())}
-
-        mb_pcrs_hashes, boot_aggregates, mb_measurement_data, mb_failure = mba.bootlog_parse(
+        bootlog_cache = BootlogCache.get_instance()
+        mb_pcrs_hashes, boot_aggregates, mb_measurement_data, mb_failure = bootlog_cache.parse(
             mb_measurement_list, hash_alg
         )
         failure.merge(mb_failure)
@@ -304,9 +347,10 @@ class Tpm:
         # Collect mismatched measured boot PCRs as measured_boot failures
         mb_pcr_failure = Failure(Component.MEASURED_BOOT)
         # Handle measured boot PCRs only if the parsing worked
+        mb_policy_is_valid = not mb_failure and mba.policy_is_valid(mb_policy)
         if not mb_failure:
             for pcr_num in set(config.MEASUREDBOOT_PCRS) & pcr_nums:
-                if mba.policy_is_valid(mb_policy):
+                if mb_policy_is_valid:
                     if not mb_measurement_list:
                         logger.error(
                             "Measured Boot PCR %d in policy, but no measurement list provided by agent %s",
@@ -343,20 +387,20 @@ class Tpm:
                             True,
                         )
 
-                    if pcr_num in pcr_allowlist and pcrs_dict[pcr_num] not in pcr_allowlist[pcr_num]:
+                    if pcr_num in policy_pcrs and not pcr_allowlist.is_allowed(pcr_num, pcrs_dict[pcr_num]):
                         logger.error(
                             "PCR #%s: %s from quote (from agent %s) does not match expected value %s",
                             pcr_num,
                             pcrs_dict[pcr_num],
                             agent_id,
-                            pcr_allowlist[pcr_num],
+                            pcr_allowlist.expected_values(pcr_num),
                         )
                         failure.add_event(
                             f"invalid_pcr_{pcr_num}",
                             {
                                 "context": "PCR value is not in allowlist",
                                 "got": pcrs_dict[pcr_num],
-                                "expected": pcr_allowlist[pcr_num],
+                                "expected": pcr_allowlist.expected_values(pcr_num),
                             },
                             True,
                         )
@@ -365,39 +409,39 @@ class Tpm:
 
         # Check the remaining non validated PCRs
         for pcr_num in pcr_nums - pcrs_in_quote:
-            if pcr_num not in list(pcr_allowlist.keys()):
+            if pcr_num not in policy_pcrs:
                 logger.warning(
                     "PCR #%s in quote (from agent %s) not found in tpm_policy, skipping.",
                     pcr_num,
                     agent_id,
                 )
                 continue
-            if pcrs_dict[pcr_num] not in pcr_allowlist[pcr_num]:
+            if not pcr_allowlist.is_allowed(pcr_num, pcrs_dict[pcr_num]):
                 logger.error(
                     "PCR #%s: %s from quote (from agent %s) does not match expected value %s",
                     pcr_num,
                     pcrs_dict[pcr_num],
                     agent_id,
-                    pcr_allowlist[pcr_num],
+                    pcr_allowlist.expected_values(pcr_num),
                 )
                 failure.add_event(
                     f"invalid_pcr_{pcr_num}",
                     {
                         "context": "PCR value is not in allowlist",
                         "got": pcrs_dict[pcr_num],
-                        "expected": pcr_allowlist[pcr_num],
+                        "expected": pcr_allowlist.expected_values(pcr_num),
                     },
                     True,
                 )
 
             pcrs_in_quote.add(pcr_num)
 
-        missing = set(pcr_allowlist.keys()) - pcrs_in_quote
+        missing = set(policy_pcrs - pcrs_in_quote)
         if len(missing) > 0:
             logger.error("PCRs specified in policy not in quote (from agent %s): %s", agent_id, missing)
             failure.add_event("missing_pcrs", {"context": "PCRs are missing in quote", "data": list(missing)}, True)
 
-        if not mb_failure and mba.policy_is_valid(mb_policy):
+        if mb_policy_is_valid:
             mb_evaluate = config.get("verifier", "measured_boot_evaluate", fallback="once")
 
             # Value of measured_boot_evaluate can be only 'once' or 'always'
@@ -408,7 +452,9 @@ class Tpm:
                 )
 
             if mb_evaluate == "always":
-                mb_policy_failure = mba.bootlog_evaluate(
+                mb_policy_failure = bootlog_cache.evaluate(
+                    mb_measurement_list,
+                    hash_alg,
                     mb_policy,
                     mb_measurement_data,
                     pcrs_in_quote,
@@ -417,7 +463,9 @@ class Tpm:
                 failure.merge(mb_policy_failure)
 
             elif mb_evaluate == "once" and count == 0:
-                mb_policy_failure = mba.bootlog_evaluate(
+                mb_policy_failure = bootlog_cache.evaluate(
+                    mb_measurement_list,
+                    hash_alg,
                     mb_policy,
                     mb_measurement_data,
                     pcrs_in_quote,
@@ -434,9 +482,9 @@ class Tpm:
         data: str,
         quote: str,
         aikTpmFromRegistrar: str,
-        tpm_policy: Optional[Union[str, Dict[str, Any]]] = None,
+        tpm_policy: Optional[Union[str, Dict[str, Any], CompiledTpmPolicy]] = None,
         ima_measurement_list: Optional[str] = None,
-        runtime_policy: Optional[RuntimePolicyType] = None,
+        runtime_policy: Optional[RuntimePolicyInputType] = None,
         hash_alg: Hash = Hash.SHA256,
         ima_keyrings: Optional[ImaKeyrings] = None,
         mb_measurement_list: Optional[str] = None,
@@ -455,8 +503,11 @@ class Tpm:
 
         failure = Failure(Component.QUOTE_VALIDATION)
 
+        # The quote is decoded once for all the checks
+        decoded = DecodedQuote(quote, compressed)
+
         # First and foremost, the quote needs to be validated
-        pcrs_dict, err = Tpm._tpm2_checkquote(aikTpmFromRegistrar, quote, nonce, str(hash_alg), compressed)
+        pcrs_dict, err = Tpm._tpm2_checkquote(aikTpmFromRegistrar, decoded, nonce, str(hash_alg), compressed)
         if err:
             # If the quote validation fails we will skip all other steps therefore this failure is irrecoverable.
             failure.add_event("quote_validation", {"message": "Quote data validation", "error": err}, False)
@@ -466,7 +517,7 @@ class Tpm:
         if not skip_clock_check and agentAttestState is not None:
             # Only after validating the quote, the TPM clock information can be extracted from it.
             clock_failure, current_clock_info = Tpm.check_quote_timing(
-                agentAttestState.get_tpm_clockinfo(), quote, compressed
+                agentAttestState.get_tpm_clockinfo(), decoded, compressed
             )
             if clock_failure:
                 failure.add_event(
@@ -511,7 +562,7 @@ class Tpm:
 
     @staticmethod
     def check_quote_timing(
-        previous_clockinfo: TPMClockInfo, quote: str, compressed: bool
+        previous_clockinfo: TPMClockInfo, quote: Union[str, DecodedQuote], compressed: bool
     ) -> Tuple[Optional[str], Optional[TPMClockInfo]]:
         # Sanity check quote clock information
 
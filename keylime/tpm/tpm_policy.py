@@ -0,0 +1,55 @@
+"""Pre-processed form of the TPM policy of an agent
+
+The TPM policy is stored as a JSON string mapping PCR numbers to the list of
+accepted values, plus the PCR mask to request in quotes. Instead of decoding
+it on every quote request and quote check, it is compiled once into an
+immutable CompiledTpmPolicy. Compiled policies are cached by their string
+form, so a changed policy is compiled again when it is first used.
+"""
+
+import functools
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+from keylime import json
+
+# Maximum number of distinct compiled TPM policies kept
+TPM_POLICY_CACHE_SIZE = 1024
+
+
+class CompiledTpmPolicy:
+    """Read-only view of a TPM policy with integer PCR numbers and sets of accepted values"""
+
+    __slots__ = ("mask", "pcrs", "expected", "allowed")
+
+    mask: Optional[str]
+    pcrs: FrozenSet[int]
+    expected: Mapping[int, Tuple[str, ...]]
+    allowed: Mapping[int, FrozenSet[str]]
+
+    def __init__(self, tpm_policy: Dict[str, Any]):
+        policy = dict(tpm_policy)
+        self.mask = policy.pop("mask", None)
+
+        expected: Dict[int, Tuple[str, ...]] = {}
+        for pcr, values in policy.items():
+            if isinstance(values, str):
+                values = [values]
+            expected[int(pcr)] = tuple(values)
+        self.expected = MappingProxyType(expected)
+        self.allowed = MappingProxyType({pcr: frozenset(values) for pcr, values in expected.items()})
+        self.pcrs = frozenset(expected)
+
+    def is_allowed(self, pcr: int, value: str) -> bool:
+        """Check whether the value is accepted for a PCR that is in the policy"""
+        return value in self.allowed[pcr]
+
+    def expected_values(self, pcr: int) -> List[str]:
+        """Return the accepted values for a PCR, as given in the policy"""
+        return list(self.expected[pcr])
+
+
+@functools.lru_cache(maxsize=TPM_POLICY_CACHE_SIZE)
+def compile_tpm_policy(tpm_policy: str) -> CompiledTpmPolicy:
+    """Return the compiled form of a TPM policy given as JSON string"""
+    return CompiledTpmPolicy(json.loads(tpm_policy))
@@ -0,0 +1,49 @@
+import unittest
+
+from keylime import json
+from keylime.common.algorithms import Hash
+from keylime.mba import mba
+from keylime.tpm.tpm_main import Tpm
+from keylime.tpm.tpm_policy import CompiledTpmPolicy, compile_tpm_policy
+from keylime.tpm.tpm_util import readPolicy
+
+PCR15 = "aa" * 32
+
+
+class TestTpmPolicy(unittest.TestCase):
+    def test_compile(self) -> None:
+        tpm_policy = json.dumps(readPolicy('{"15": ["' + PCR15.upper() + '"], "14": "' + "00" * 32 + '"}'))
+
+        compiled = compile_tpm_policy(tpm_policy)
+        self.assertIs(compile_tpm_policy(tpm_policy), compiled)
+        self.assertEqual(compiled.mask, hex((1 << 14) | (1 << 15)))
+        self.assertEqual(compiled.pcrs, frozenset([14, 15]))
+        self.assertTrue(compiled.is_allowed(15, PCR15))
+        self.assertFalse(compiled.is_allowed(14, PCR15))
+        self.assertEqual(compiled.expected_values(14), ["00" * 32])
+
+        compiled = CompiledTpmPolicy({"mask": "0x8000", "15": PCR15})
+        self.assertEqual(compiled.expected_values(15), [PCR15])
+
+    def test_check_pcrs(self) -> None:
+        mba.load_imports(skip_custom_policies=True)
+        tpm_policy = json.dumps({"mask": "0xc000", "14": ["00" * 32], "15": [PCR15]})
+
+        for policy in [tpm_policy, json.loads(tpm_policy), compile_tpm_policy(tpm_policy)]:
+            failure = Tpm().check_pcrs(
+                None, policy, {15: "bb" * 32}, "", None, None, None, None, None, Hash.SHA256, 0, True
+            )
+            self.assertEqual(
+                [(event.event_id, event.context) for event in failure.events],
+                [
+                    (
+                        "pcr_validation.invalid_pcr_15",
+                        json.dumps({"context": "PCR value is not in allowlist", "got": "bb" * 32, "expected": [PCR15]}),
+                    ),
+                    ("pcr_validation.missing_pcrs", json.dumps({"context": "PCRs are missing in quote", "data": [14]})),
+                ],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -54,6 +54,7 @@ from cryptography.hazmat.primitives.kdf.kbkdf import KBKDFHMAC, CounterLocation,
 
 from keylime import config, crypto, json, keylime_logging
 from keylime.tpm import tpm2_objects
+from keylime.tpm.types import TpmsAttestType
 
 logger = keylime_logging.init_logging("tpm_util")
 
@@ -210,22 +211,32 @@ def __get_and_hash_pcrs(pcrblob: bytes, hash_alg: int) -> Tuple[bytes, Dict[int,
 
 
 def checkquote(
-    aikblob: bytes, nonce: str, sigblob: bytes, quoteblob: bytes, pcrblob: bytes, exp_hash_alg: str
+    aikblob: Union[bytes, SupportedKeyTypes],
+    nonce: str,
+    sigblob: bytes,
+    quoteblob: bytes,
+    pcrblob: bytes,
+    exp_hash_alg: str,
+    attest: Optional[TpmsAttestType] = None,
 ) -> Dict[int, str]:
     """Check the given quote by checking the signature, then the nonce and then the used hash
 
     Parameters
     ----------
-    aikblob: PEM-formatted public RSA or EC key
+    aikblob: PEM-formatted public RSA or EC key, or the already loaded public key object
     nonce: The nonce that was used during the quote
     sigblob: Signature blob containing signature algorithm, hash used for signing, and plain signature
     quoteblob: Marshalled TPMS_ATTEST
     pcrblob: The state of the PCRs that were quoted; Intel tpm2-tools specific format
     exp_hash_alg: The hash that was expected to have been used for quoting
+    attest: The quoteblob unmarshalled with tpm2_objects.unmarshal_tpms_attest, if already done
     """
     sig_alg, hash_alg = struct.unpack_from(">HH", sigblob, 0)
 
-    pubkey = serialization.load_pem_public_key(aikblob, backend=backends.default_backend())
+    if isinstance(aikblob, bytes):
+        pubkey = serialization.load_pem_public_key(aikblob, backend=backends.default_backend())
+    else:
+        pubkey = aikblob
     if not isinstance(pubkey, (RSAPublicKey, EllipticCurvePublicKey)):
         raise ValueError(f"Unsupported key type {type(pubkey).__name__}")
 
@@ -255,7 +266,7 @@ def checkquote(
     verify(pubkey, signature, quote_digest, hashfunc)
 
     # Check that reported nonce is expected one
-    retDict = tpm2_objects.unmarshal_tpms_attest(quoteblob)
+    retDict = attest if attest is not None else tpm2_objects.unmarshal_tpms_attest(quoteblob)
     extradata = retDict["extraData"]
     if extradata.decode("utf-8") != nonce:
         raise Exception("The nonce from the attestation differs from the expected nonce")
@@ -3,6 +3,7 @@ import unittest
 from unittest import mock
 
 from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric.ec import (
     SECP256R1,
     EllipticCurve,
@@ -10,7 +11,9 @@ from cryptography.hazmat.primitives.asymmetric.ec import (
     EllipticCurvePrivateNumbers,
     EllipticCurvePublicNumbers,
 )
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
 
+from keylime.tpm import tpm2_objects
 from keylime.tpm.tpm_util import checkquote, makecredential
 
 
@@ -61,6 +64,15 @@ class TestTpmUtil(unittest.TestCase):
         except Exception as e:
             self.fail(f"checkquote failed with {e}")
 
+        # an already loaded key and unmarshalled quote can be passed in
+        pubkey = serialization.load_pem_public_key(aikblob)
+        assert isinstance(pubkey, RSAPublicKey)
+        attest = tpm2_objects.unmarshal_tpms_attest(quoteblob)
+        try:
+            checkquote(pubkey, nonce, sigblob, quoteblob, pcrblob, "sha256", attest=attest)
+        except Exception as e:
+            self.fail(f"checkquote failed with {e}")
+
         # test bad input
         bad_quoteblob = bytearray(quoteblob)
         bad_quoteblob[5] ^= 0x1
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+
+from keylime.agent_scheduler import AgentScheduler
+
+
+class TestAgentScheduler(unittest.TestCase):
+    def test_order(self):
+        started = []
+
+        async def call(name):
+            started.append(name)
+
+        async def run_test():
+            scheduler = AgentScheduler(jitter=0)
+            scheduler.schedule(0.03, call, "c")
+            scheduler.schedule(0.01, call, "a")
+            cancelled = scheduler.schedule(0.02, call, "cancelled")
+            scheduler.schedule(0.02, call, "b", retry=True)
+            scheduler.cancel(cancelled)
+            await asyncio.sleep(0.1)
+            self.assertEqual(scheduler.stats()["scheduled"], 0)
+
+        asyncio.run(run_test())
+        self.assertEqual(started, ["a", "b", "c"])
+
+    def test_max_outstanding(self):
+        running = []
+        max_running = []
+
+        async def call():
+            running.append(1)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        async def run_test():
+            scheduler = AgentScheduler(max_outstanding=2)
+            for _ in range(6):
+                scheduler.schedule(0, call)
+            await asyncio.sleep(0.01)
+            self.assertEqual(scheduler.outstanding, 2)
+            self.assertGreater(scheduler.queue_depth(), 0)
+            await asyncio.sleep(0.1)
+            self.assertEqual(scheduler.outstanding, 0)
+            self.assertEqual(scheduler.queue_depth(), 0)
+            self.assertGreater(scheduler.stats()["lag"], 0)
+
+        asyncio.run(run_test())
+        self.assertEqual(len(max_running), 6)
+        self.assertEqual(max(max_running), 2)
+
+    def test_fair_queuing(self):
+        started = []
+
+        async def call(name):
+            started.append(name)
+            await asyncio.sleep(0.001)
+
+        async def run_test():
+            scheduler = AgentScheduler(max_outstanding=1, jitter=0)
+            for i in range(3):
+                scheduler.schedule(0, call, f"periodic{i}")
+            for i in range(2):
+                scheduler.schedule(0, call, f"retry{i}", retry=True)
+            await asyncio.sleep(0.1)
+
+        asyncio.run(run_test())
+        self.assertEqual(started, ["periodic0", "retry0", "periodic1", "retry1", "periodic2"])
+
+    def test_failing_call(self):
+        async def fail():
+            raise Exception("failed")
+
+        async def run_test():
+            scheduler = AgentScheduler(max_outstanding=1)
+            scheduler.schedule(0, fail)
+            await asyncio.sleep(0.01)
+            self.assertEqual(scheduler.outstanding, 0)
+
+        with self.assertLogs("keylime.verifier", "ERROR"):
+            asyncio.run(run_test())
+
+    def test_jitter(self):
+        scheduler = AgentScheduler(jitter=0.2)
+        for _ in range(100):
+            self.assertTrue(8 <= scheduler.jittered(10) <= 12)
+        self.assertEqual(scheduler.jittered(0), 0)
+        self.assertEqual(AgentScheduler(jitter=0).jittered(10), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
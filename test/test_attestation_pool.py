@@ -0,0 +1,132 @@
+import asyncio
+import os
+import pickle
+import sys
+import unittest
+from types import MappingProxyType
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from keylime.agentstates import AgentAttestState
+from keylime.attestation_pool import AttestationPool
+from keylime.failure import Failure
+from keylime.ima import ima
+from keylime.ima.compiled_policy import CompiledRuntimePolicy
+
+
+def make_agent():
+    return {
+        "agent_id": "agent1",
+        "nonce": "nonce",
+        "public_key": "",
+        "accept_tpm_hash_algs": ["sha256"],
+        "accept_tpm_encryption_algs": ["rsa"],
+        "accept_tpm_signing_algs": ["rsassa"],
+        "ima_sign_verification_keys": "",
+        "tpm_clockinfo": None,
+        "ak_tpm": "",
+        "tpm_policy": "{}",
+        "supported_version": "2.1",
+        "attestation_count": 0,
+        "ssl_context": object(),
+    }
+
+
+def make_response(**kwargs):
+    response = {"quote": "r", "pubkey": "pubkey", "hash_alg": "sha256", "enc_alg": "rsa", "sign_alg": "rsassa"}
+    response.update(kwargs)
+    return response
+
+
+def make_state():
+    state = AgentAttestState("agent1")
+    state.set_boottime(1000)
+    state.set_next_ima_ml_entry(5)
+    state.get_ima_keyrings().add_pubkey_to_keyring(ec.generate_private_key(ec.SECP256R1()).public_key(), "ima")
+    return state
+
+
+class TestPickling(unittest.TestCase):
+    def test_agent_attest_state(self):
+        state = make_state()
+        state.update_ima_attestation(10, b"\x01" * 32, 1)
+
+        restored = pickle.loads(pickle.dumps(state))
+        self.assertEqual(restored.get_boottime(), 1000)
+        self.assertEqual(restored.get_next_ima_ml_entry(), 6)
+        self.assertEqual(restored.ima_pcrs, {10})
+        self.assertEqual(restored.tpm_state.get_pcr(10), b"\x01" * 32)
+        self.assertEqual(restored.get_ima_keyrings().to_json(), state.get_ima_keyrings().to_json())
+
+    def test_compiled_policy(self):
+        policy = ima.empty_policy()
+        policy["digests"] = {"/usr/bin/dd": ["aa" * 32]}
+        policy["excludes"] = ["/tmp/.*"]
+        compiled = CompiledRuntimePolicy(policy, "checksum", 100)
+
+        restored = pickle.loads(pickle.dumps(compiled))
+        self.assertEqual(restored.checksum, "checksum")
+        self.assertEqual(restored.get_digests("digests", "/usr/bin/dd"), frozenset([b"\xaa" * 32]))
+        assert restored.exclude_matcher is not None
+        self.assertTrue(restored.exclude_matcher.match("/tmp/file"))
+        self.assertIsInstance(restored.digests, MappingProxyType)
+
+
+class TestAttestationPool(unittest.TestCase):
+    def run_pool(self, pool, *requests):
+        async def run():
+            return await asyncio.gather(
+                *[pool.process_quote_response(*request) for request in requests], return_exceptions=True
+            )
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    def check_reboot(self, pool):
+        agent = make_agent()
+        state = make_state()
+        compiled = CompiledRuntimePolicy(ima.empty_policy(), "checksum", 100)
+        # A list not starting at entry 0 with a new boottime resets the attestation state
+        response = make_response(ima_measurement_list_entry=5, boottime=2000)
+
+        (failure,) = self.run_pool(pool, (agent, None, compiled, response, state))
+        self.assertFalse(failure)
+        self.assertEqual(agent["hash_alg"], "sha256")
+        self.assertEqual(state.get_boottime(), 0)
+        self.assertEqual(state.get_next_ima_ml_entry(), 0)
+        return agent
+
+    def test_inline(self):
+        self.check_reboot(AttestationPool(0))
+
+    def test_pool(self):
+        # Some tests put the keylime package directory on the path, where keylime/json.py
+        # would shadow the json module in the pool processes
+        path = [p for p in sys.path if not os.path.isfile(os.path.join(p, "cloud_verifier_common.py"))]
+        pool = AttestationPool(2)
+        with patch.object(sys, "path", path):
+            try:
+                agent = self.check_reboot(pool)
+                self.assertIn("ssl_context", agent)
+
+                # Unaccepted algorithms, and exceptions raised in the pool processes
+                results = self.run_pool(
+                    pool,
+                    (make_agent(), None, ima.empty_policy(), make_response(hash_alg="md5"), make_state()),
+                    (make_agent(), None, ima.empty_policy(), make_response(), AgentAttestState("agent1")),
+                )
+                failure = results[0]
+                assert isinstance(failure, Failure)
+                self.assertEqual([event.event_id for event in failure.events], ["qoute_validation.invalid_hash_alg"])
+                self.assertIsInstance(results[1], Exception)
+                self.assertEqual(pool.queues, {})
+            finally:
+                pool.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import create_engine
+
+from keylime.common import states
+from keylime.db.keylime_db import SessionManager
+from keylime.db.verifier_db import VerfierMain
+from keylime.db.write_behind import AgentStateWriter
+
+
+class TestAgentStateWriter(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        VerfierMain.metadata.create_all(self.engine, checkfirst=True)
+        with SessionManager().session_context(self.engine) as session:
+            for i in range(3):
+                session.add(VerfierMain(agent_id=f"agent{i}", operational_state=states.GET_QUOTE, attestation_count=0))
+
+    def get_agents(self) -> Dict[str, Tuple[Any, ...]]:
+        agents: Dict[str, Tuple[Any, ...]] = {}
+        with SessionManager().session_context(self.engine) as session:
+            for agent in session.query(VerfierMain).all():
+                agents[str(agent.agent_id)] = (agent.operational_state, agent.attestation_count, agent.ima_pcrs)
+        return agents
+
+    def test_write_behind(self):
+        writer = AgentStateWriter(self.engine, protected_states=(states.TERMINATED,))
+        writer.update("agent0", {"attestation_count": 1, "ip": None, "nonce": "not a column"})
+        writer.update("agent0", {"attestation_count": 2})
+        writer.update("agent1", {"attestation_count": 1, "ima_pcrs": [10]})
+        writer.update("agent2", {"attestation_count": 1})
+        self.assertEqual(len(writer), 3)
+        self.assertEqual(self.get_agents()["agent0"], (states.GET_QUOTE, 0, None))
+
+        writer.flush()
+        self.assertEqual(len(writer), 0)
+        agents = self.get_agents()
+        self.assertEqual(agents["agent0"], (states.GET_QUOTE, 2, None))
+        self.assertEqual(agents["agent1"], (states.GET_QUOTE, 1, [10]))
+        self.assertEqual(agents["agent2"], (states.GET_QUOTE, 1, None))
+
+    def test_durable(self):
+        writer = AgentStateWriter(self.engine)
+        writer.update("agent0", {"attestation_count": 1})
+        writer.update("agent1", {"operational_state": states.FAILED}, durable=True)
+        self.assertEqual(len(writer), 0)
+        agents = self.get_agents()
+        self.assertEqual(agents["agent0"], (states.GET_QUOTE, 1, None))
+        self.assertEqual(agents["agent1"], (states.FAILED, 0, None))
+
+    def test_batch_size(self):
+        writer = AgentStateWriter(self.engine, batch_size=2)
+        writer.update("agent0", {"attestation_count": 1})
+        self.assertEqual(len(writer), 1)
+        writer.update("agent1", {"attestation_count": 1})
+        self.assertEqual(len(writer), 0)
+
+        writer = AgentStateWriter(self.engine, enabled=False)
+        writer.update("agent2", {"attestation_count": 5})
+        self.assertEqual(self.get_agents()["agent2"], (states.GET_QUOTE, 5, None))
+
+    def test_protected_states(self):
+        writer = AgentStateWriter(self.engine, protected_states=(states.TERMINATED,))
+        writer.update("agent0", {"operational_state": states.GET_QUOTE, "attestation_count": 1})
+        writer.update("agent1", {"attestation_count": 1})
+        writer.discard("agent1")
+
+        # The agent is terminated by the tenant before the changes are written
+        with SessionManager().session_context(self.engine) as session:
+            session.query(VerfierMain).filter_by(agent_id="agent0").update({"operational_state": states.TERMINATED})
+
+        writer.flush()
+        agents = self.get_agents()
+        self.assertEqual(agents["agent0"], (states.TERMINATED, 0, None))
+        self.assertEqual(agents["agent1"], (states.GET_QUOTE, 0, None))
+
+    def test_delete_and_add_again(self):
+        writer = AgentStateWriter(self.engine)
+        writer.update("agent0", {"operational_state": states.GET_QUOTE, "attestation_count": 5, "ima_pcrs": [10]})
+
+        # The agent is deleted and added again before the changes are written
+        writer.discard("agent0")
+        with SessionManager().session_context(self.engine) as session:
+            session.query(VerfierMain).filter_by(agent_id="agent0").delete()
+            session.add(VerfierMain(agent_id="agent0", operational_state=states.START, attestation_count=0))
+
+        writer.flush()
+        self.assertEqual(self.get_agents()["agent0"], (states.START, 0, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import copy
+import unittest
+from unittest.mock import patch
+
+from keylime.agentstates import AgentAttestState
+from keylime.common.algorithms import Hash
+from keylime.ima import ast, ima
+from keylime.ima.compiled_policy import CompiledRuntimePolicy
+from keylime.ima.entry_cache import ImaEntryCache
+
+MEASUREMENTS = [
+    "10 0c8a706a75a5689c1e168f0a573a3cbec33061b5 ima-sig sha256:e4cb9f5709c88376b5fc3743cd88e76b9aae8f3d992d845678de5215edb31216 boot_aggregate ",
+    "10 5426cf3031a43f5bfca183d79950698a95a728f6 ima-sig sha256:f1125b940480d20ad841d26d5ea253edc0704b5ec1548c891edf212cb1a9365e /lib/modules/5.4.48-openpower1/kernel/drivers/usb/common/usb-common.ko ",
+    "10 f8a7b32dba2cb3a5437786d7f9d5caee8db3115b ima-sig sha256:cd026b58efdf66658685430ff526490d54a430a3f0066a35ac26a8acab66c55d /lib/modules/5.4.48-openpower1/kernel/drivers/gpu/drm/drm_panel_orientation_quirks.ko ",
+]
+
+SIGNED = "10 5d4d5141ccd5066d50dc3f21d79ba02fedc24256 ima-sig sha256:b8ae0b8dd04a5935cd8165aa2260cd11b658bd71629bdb52256a675a1f73907b /usr/bin/zmore 030204531f402500483046022100fe24678d21083ead47660e1a2d553a592d777c478d1b0466de6ed484b54956b3022100cad3adb37f277bbb03544d6107751b4cd4f2289d8353fa36257400a99334d5c3"
+
+RUNTIME_POLICY = ima.empty_policy()
+RUNTIME_POLICY["digests"] = {
+    "boot_aggregate": ["e4cb9f5709c88376b5fc3743cd88e76b9aae8f3d992d845678de5215edb31216"],
+    "/lib/modules/5.4.48-openpower1/kernel/drivers/usb/common/usb-common.ko": [
+        "f1125b940480d20ad841d26d5ea253edc0704b5ec1548c891edf212cb1a9365e"
+    ],
+    "/lib/modules/5.4.48-openpower1/kernel/drivers/gpu/drm/drm_panel_orientation_quirks.ko": [
+        "00000000000000000000000000000000000000000000000000000000000000ff"
+    ],
+}
+
+
+class TestImaEntryCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ImaEntryCache(100)
+        patcher = patch.object(ImaEntryCache, "instance", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lru(self):
+        cache = ImaEntryCache(2)
+        for i in range(3):
+            cache.add(("checksum", Hash.SHA1, str(i)), (ast.ImaNg, b"", None))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(("checksum", Hash.SHA1, "0")))
+        self.assertIsNotNone(cache.get(("checksum", Hash.SHA1, "2")))
+
+        cache = ImaEntryCache(0)
+        self.assertFalse(cache.enabled)
+        cache.add(("checksum", Hash.SHA1, "0"), (ast.ImaNg, b"", None))
+        self.assertEqual(len(cache), 0)
+
+    def test_shared_results(self):
+        policy = CompiledRuntimePolicy(RUNTIME_POLICY, "checksum")
+        running_hash, failure = ima.process_measurement_list(AgentAttestState("1"), MEASUREMENTS, policy)
+        # The boot_aggregate entry depends on the agent and is not cached
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(failure.get_event_ids(), ["ima.validation.ima-ng.runtime_policy_hash"])
+
+        # Another agent gets the same results from the cache
+        with patch.object(
+            ast.Entry, "invalid_measurement", autospec=True, side_effect=ast.Entry.invalid_measurement
+        ) as invalid_measurement:
+            cached_hash, cached_failure = ima.process_measurement_list(AgentAttestState("2"), MEASUREMENTS, policy)
+            self.assertEqual(invalid_measurement.call_count, 1)
+        self.assertEqual(cached_hash, running_hash)
+        self.assertEqual(cached_failure.get_event_ids(), failure.get_event_ids())
+
+        # The PCR is still checked for every entry
+        lines = copy.copy(MEASUREMENTS)
+        lines[1] = "11" + lines[1][2:]
+        _, failure = ima.process_measurement_list(None, lines, policy)
+        self.assertEqual(
+            failure.get_event_ids(),
+            ["ima.validation.ima_pcr", "ima.validation.ima-ng.runtime_policy_hash"],
+        )
+
+        # Policies without checksum are not cached
+        self.cache.clear()
+        ima.process_measurement_list(None, MEASUREMENTS, RUNTIME_POLICY)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_signed_entries(self):
+        # Accepted by signature only, which depends on the keyrings of the agent
+        policy = CompiledRuntimePolicy(ima.empty_policy(), "empty")
+        _, failure = ima.process_measurement_list(None, [SIGNED], policy)
+        self.assertTrue(failure)
+        self.assertEqual(len(self.cache), 0)
+
+        # Accepted by the policy
+        runtime_policy = ima.empty_policy()
+        runtime_policy["digests"] = {
+            "/usr/bin/zmore": ["b8ae0b8dd04a5935cd8165aa2260cd11b658bd71629bdb52256a675a1f73907b"]
+        }
+        policy = CompiledRuntimePolicy(runtime_policy, "zmore")
+        _, failure = ima.process_measurement_list(None, [SIGNED], policy)
+        self.assertFalse(failure)
+        self.assertEqual(len(self.cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import pickle
+import sys
+import unittest
+from unittest.mock import patch
+
+from keylime.ima import ima
+from keylime.ima.policy_artifact import MappedDigestMap, PolicyArtifact, PolicyArtifactError, serialize_policy
+from keylime.ima.policy_cache import RuntimePolicyCache
+
+
+def make_policy():
+    policy = ima.empty_policy()
+    policy["digests"] = {"/usr/bin/dd": ["aa" * 32, "bb" * 32], "/usr/bin/cat": ["cc" * 20]}
+    policy["ima-buf"] = {"dm_table_load": ["dd" * 32]}
+    policy["excludes"] = ["/tmp/.*"]
+    policy["ima"]["log_hash_alg"] = "sha256"
+    return json.dumps(policy)
+
+
+class TestPolicyArtifact(unittest.TestCase):
+    def test_db_contents(self):
+        runtime_policy = make_policy()
+        db_format = ima.runtime_policy_db_contents("policy", runtime_policy)
+
+        compiled = PolicyArtifact(db_format["ima_policy_compiled"]).compile(db_format["checksum"])
+        self.assertIsInstance(compiled.digests, MappedDigestMap)
+        self.assertEqual(compiled.get_digests("digests", "/usr/bin/dd"), frozenset([b"\xaa" * 32, b"\xbb" * 32]))
+        self.assertEqual(compiled.get_digests("ima-buf", "dm_table_load"), frozenset([b"\xdd" * 32]))
+        self.assertIsNone(compiled.get_digests("keyrings", "/usr/bin/dd"))
+        self.assertEqual(compiled.log_hash_alg.value, "sha256")
+        assert compiled.exclude_matcher is not None
+        self.assertTrue(compiled.exclude_matcher.match("/tmp/file"))
+
+    def test_pickle(self):
+        compiled = PolicyArtifact(serialize_policy(json.loads(make_policy()))).compile("checksum")
+        restored = pickle.loads(pickle.dumps(compiled))
+        self.assertIs(restored.digests.artifact, restored.ima_buf.artifact)
+        self.assertEqual(dict(restored.digests), dict(compiled.digests))
+
+    def test_invalid(self):
+        artifact = serialize_policy(json.loads(make_policy()))
+        for invalid in [b"", b"invalid", artifact[:-10], artifact.replace(sys.byteorder.encode(), b"middle")]:
+            with self.assertRaises(PolicyArtifactError):
+                PolicyArtifact(invalid)
+
+    def test_policy_cache(self):
+        runtime_policy = make_policy()
+        artifact = serialize_policy(json.loads(runtime_policy))
+
+        # The policy is not deserialized when the artifact is given
+        with patch.object(ima, "deserialize_runtime_policy") as deserialize:
+            compiled = RuntimePolicyCache().get(runtime_policy, "checksum", artifact)
+            deserialize.assert_not_called()
+        self.assertIsInstance(compiled.digests, MappedDigestMap)
+        self.assertEqual(compiled.size, len(artifact))
+
+        # Invalid artifacts are ignored
+        compiled = RuntimePolicyCache().get(runtime_policy, "checksum", b"invalid")
+        self.assertNotIsInstance(compiled.digests, MappedDigestMap)
+        self.assertEqual(compiled.get_digests("digests", "/usr/bin/cat"), frozenset([b"\xcc" * 20]))
+
+
+if __name__ == "__main__":
+    unittest.main()
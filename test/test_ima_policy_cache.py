@@ -0,0 +1,170 @@
+import copy
+import json
+import unittest
+
+from keylime.common import validators
+from keylime.common.algorithms import Hash
+from keylime.ima import ima
+from keylime.ima.compiled_policy import CompiledRuntimePolicy, ExcludeMatcher, compile_runtime_policy
+from keylime.ima.policy_cache import RuntimePolicyCache
+
+
+def make_policy(digests):
+    policy = ima.empty_policy()
+    policy["digests"] = digests
+    return json.dumps(policy)
+
+
+class TestCompiledRuntimePolicy(unittest.TestCase):
+    def test_compile(self):
+        policy = ima.empty_policy()
+        policy["digests"] = {"/usr/bin/dd": ["aa" * 32, "bb" * 32]}
+        policy["excludes"] = ["/tmp/.*", "/var/log/.*"]
+        policy["ima"]["log_hash_alg"] = "sha256"
+        policy["ima"]["ignored_keyrings"] = [".ima"]
+
+        compiled = compile_runtime_policy(policy)
+
+        self.assertEqual(compiled.get_digests("digests", "/usr/bin/dd"), frozenset([b"\xaa" * 32, b"\xbb" * 32]))
+        self.assertIsNone(compiled.get_digests("digests", "/usr/bin/cat"))
+        self.assertIsNone(compiled.get_digests("keyrings", "/usr/bin/dd"))
+        assert compiled.exclude_matcher is not None
+        self.assertTrue(compiled.exclude_matcher.match("/var/log/messages"))
+        self.assertFalse(compiled.exclude_matcher.match("/usr/bin/dd"))
+        self.assertEqual(compiled.log_hash_alg, Hash.SHA256)
+        self.assertEqual(compiled.ignored_keyrings, frozenset([".ima"]))
+
+        # Compiling an already compiled policy is a no-op
+        self.assertIs(compile_runtime_policy(compiled), compiled)
+
+        # The compiled policy does not follow changes to the source
+        policy["digests"]["/usr/bin/dd"].append("cc" * 32)
+        digests = compiled.get_digests("digests", "/usr/bin/dd")
+        assert digests is not None
+        self.assertNotIn(b"\xcc" * 32, digests)
+
+    def test_exclude_matcher(self):
+        excludes = ["/tmp/", "^/var/log/.*", r"/opt/app\.d/", r"/usr/lib/.*\.so", r"\d+", ".*/__pycache__/"]
+        matcher, err_msg = ExcludeMatcher.compile(excludes)
+        assert matcher is not None
+        self.assertIsNone(err_msg)
+        # Literal prefixes go to the trie, real patterns to the regex
+        assert matcher.regex is not None
+        self.assertEqual(matcher.regex.pattern, r"(/usr/lib/.*\.so)|(\d+)|(.*/__pycache__/)")
+
+        regex, _ = validators.valid_exclude_list(excludes)
+        assert regex is not None
+        for path in [
+            "/tmp/file",
+            "/tmp",
+            "/var/log/messages",
+            "/opt/app.d/run",
+            "/opt/appxd/run",
+            "/usr/lib/libc.so.6",
+            "/usr/lib/libc.a",
+            "1234",
+            "/usr/lib/python3/__pycache__/os.pyc",
+            "/usr/bin/dd",
+        ]:
+            self.assertEqual(matcher.match(path), regex.match(path) is not None, path)
+
+        matcher, _ = ExcludeMatcher.compile(["^.*"])
+        assert matcher is not None
+        self.assertIsNone(matcher.regex)
+        self.assertTrue(matcher.match("/usr/bin/dd"))
+
+        self.assertEqual(ExcludeMatcher.compile([]), (None, None))
+        matcher, err_msg = ExcludeMatcher.compile(["/tmp/", "(invalid"])
+        self.assertIsNone(matcher)
+        self.assertIsNotNone(err_msg)
+
+    def test_invalid_log_hash_alg(self):
+        policy = ima.empty_policy()
+        policy["ima"]["log_hash_alg"] = "md5"  # type: ignore[typeddict-item]
+        self.assertEqual(compile_runtime_policy(policy).log_hash_alg, Hash.SHA1)
+
+    def test_boot_aggregates(self):
+        policy = ima.empty_policy()
+        policy["digests"] = {"boot_aggregate": ["aa" * 32]}
+        compiled = compile_runtime_policy(policy)
+
+        overlay = compiled.with_boot_aggregates({"sha256": ["bb" * 32]})
+        self.assertEqual(overlay.get_digests("digests", "boot_aggregate"), frozenset([b"\xaa" * 32, b"\xbb" * 32]))
+        # The shared policy is not modified
+        self.assertEqual(compiled.get_digests("digests", "boot_aggregate"), frozenset([b"\xaa" * 32]))
+        self.assertIs(overlay.digests, compiled.digests)
+        self.assertIs(compiled.with_boot_aggregates(None), compiled)
+
+    def test_empty_runtime_policy_not_modified(self):
+        before = copy.deepcopy(ima.EMPTY_RUNTIME_POLICY)
+        ima.process_measurement_list(None, [], ima.EMPTY_RUNTIME_POLICY, boot_aggregates={"sha1": ["aa" * 20]})
+        self.assertEqual(ima.EMPTY_RUNTIME_POLICY, before)
+
+
+class TestRuntimePolicyCache(unittest.TestCase):
+    def test_shared_by_checksum(self):
+        cache = RuntimePolicyCache()
+        policy = make_policy({"/usr/bin/dd": ["aa" * 32]})
+
+        first = cache.get(policy, "checksum1")
+        second = cache.get(policy, "checksum1")
+        self.assertIsInstance(first, CompiledRuntimePolicy)
+        self.assertIs(first, second)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(first.source)
+
+    def test_missing_checksum(self):
+        cache = RuntimePolicyCache(keep_source=True)
+        policy = make_policy({})
+
+        first = cache.get(policy, "None")
+        self.assertIs(cache.get(policy), first)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(first.source, policy)
+
+    def test_lru_eviction(self):
+        policies = [make_policy({f"/usr/bin/{i}": ["aa" * 32]}) for i in range(3)]
+        cache = RuntimePolicyCache(max_size=len(policies[0]) * 2)
+
+        cache.get(policies[0], "0")
+        cache.get(policies[1], "1")
+        # Use "0" so that "1" becomes the least recently used policy
+        cache.get(policies[0], "0")
+        cache.get(policies[2], "2")
+
+        self.assertIn("0", cache)
+        self.assertNotIn("1", cache)
+        self.assertIn("2", cache)
+        self.assertLessEqual(cache.size, cache.max_size)
+
+    def test_too_large(self):
+        policy = make_policy({"/usr/bin/dd": ["aa" * 32]})
+        cache = RuntimePolicyCache(max_size=10)
+
+        compiled = cache.get(policy, "large")
+        self.assertIsInstance(compiled, CompiledRuntimePolicy)
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate(self):
+        cache = RuntimePolicyCache()
+        cache.get(make_policy({}), "checksum")
+        cache.invalidate("checksum")
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_lookup(self):
+        cache = RuntimePolicyCache()
+        self.assertIsNone(cache.lookup("checksum"))
+        compiled = cache.get(make_policy({}), "checksum")
+        self.assertIs(cache.lookup("checksum"), compiled)
+        self.assertIsNone(cache.lookup("None"))
+        self.assertIsNone(cache.lookup(None))
+
+    def test_invalid_policy(self):
+        cache = RuntimePolicyCache()
+        self.assertRaises(Exception, cache.get, "", "checksum")
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import json
+import pickle
+import unittest
+
+from keylime.ima import ima, policy_delta
+from keylime.ima.compiled_policy import CompiledRuntimePolicy
+from keylime.ima.policy_artifact import PolicyArtifact
+from keylime.ima.policy_cache import RuntimePolicyCache
+
+DELTA = {
+    "digests": {
+        "add": {"/usr/bin/dd": ["cc" * 32], "/usr/bin/cat": ["dd" * 32]},
+        "remove": {"/usr/bin/dd": ["aa" * 32], "/usr/bin/ls": ["ee" * 32]},
+    },
+    "keyrings": {"remove": {".ima": ["ff" * 32]}},
+    "excludes": {"add": ["/var/log/"], "remove": ["/tmp/.*"]},
+}
+
+
+def make_policy():
+    policy = ima.empty_policy()
+    policy["digests"] = {"/usr/bin/dd": ["aa" * 32, "bb" * 32], "/usr/bin/ls": ["ee" * 32]}
+    policy["keyrings"] = {".ima": ["ff" * 32]}
+    policy["excludes"] = ["/tmp/.*"]
+    return json.dumps(policy)
+
+
+def digests_of(compiled, section):
+    return {
+        path: frozenset(compiled.get_digests(section, path)) for path in getattr(compiled, section.replace("-", "_"))
+    }
+
+
+class TestRuntimePolicyDelta(unittest.TestCase):
+    def test_validate(self):
+        policy_delta.validate_delta(DELTA)
+        for invalid in [
+            {"digests": {"add": {"/usr/bin/dd": ["not hex"]}}},
+            {"digests": {"replace": {}}},
+            {"excludes": {"add": ["(invalid"]}},
+            {"unknown": {}},
+        ]:
+            with self.assertRaises(ima.ImaValidationError):
+                policy_delta.validate_delta(invalid)
+
+    def test_apply(self):
+        policy = json.loads(make_policy())
+        updated = policy_delta.apply_delta(policy, DELTA)
+
+        self.assertEqual(updated["digests"], {"/usr/bin/dd": ["bb" * 32, "cc" * 32], "/usr/bin/cat": ["dd" * 32]})
+        self.assertEqual(updated["keyrings"], {})
+        self.assertEqual(updated["excludes"], ["/var/log/"])
+        self.assertEqual(updated.get("release"), 1)
+        ima.validate_runtime_policy(updated)
+
+        # The given policy is not modified
+        self.assertEqual(policy, json.loads(make_policy()))
+
+    def test_db_contents(self):
+        runtime_policy = make_policy()
+        checksum = ima.runtime_policy_db_contents("policy", runtime_policy)["checksum"]
+
+        db_format = policy_delta.runtime_policy_delta_db_contents("policy", runtime_policy, checksum, DELTA)
+        self.assertNotEqual(db_format["checksum"], checksum)
+        self.assertEqual(
+            json.loads(db_format["ima_policy"]), policy_delta.apply_delta(json.loads(runtime_policy), DELTA)
+        )
+        self.assertEqual(json.loads(db_format["ima_policy_delta"])["base_checksum"], checksum)
+        self.assertIsNotNone(db_format["ima_policy_compiled"])
+        self.assertIsNone(ima.runtime_policy_db_contents("policy", runtime_policy)["ima_policy_delta"])
+
+        with self.assertRaises(ima.ImaValidationError) as cm:
+            policy_delta.runtime_policy_delta_db_contents(
+                "policy", runtime_policy, checksum, {**DELTA, "base_checksum": "other"}
+            )
+        self.assertEqual(cm.exception.code, 409)
+
+        signed = json.dumps({"payload": "e30=", "payloadType": "application/vnd.keylime+json", "signatures": []})
+        with self.assertRaises(ima.ImaValidationError):
+            policy_delta.runtime_policy_delta_db_contents("policy", signed, checksum, DELTA)
+
+    def test_apply_compiled(self):
+        runtime_policy = make_policy()
+        expected = CompiledRuntimePolicy(policy_delta.apply_delta(json.loads(runtime_policy), DELTA))
+
+        artifact = ima.runtime_policy_db_contents("policy", runtime_policy)["ima_policy_compiled"]
+        for compiled in [CompiledRuntimePolicy(json.loads(runtime_policy)), PolicyArtifact(artifact).compile("")]:
+            updated = policy_delta.apply_delta_compiled(compiled, DELTA, "updated")
+            self.assertEqual(updated.checksum, "updated")
+            for section in ("digests", "keyrings", "ima-buf"):
+                self.assertEqual(digests_of(updated, section), digests_of(expected, section))
+            self.assertIsNone(updated.get_digests("digests", "/usr/bin/ls"))
+            self.assertEqual(updated.excludes, ("/var/log/",))
+            assert updated.exclude_matcher is not None
+            self.assertTrue(updated.exclude_matcher.match("/var/log/messages"))
+            self.assertFalse(updated.exclude_matcher.match("/tmp/file"))
+
+            # Deltas to updated policies do not stack views
+            again = policy_delta.apply_delta_compiled(updated, {"digests": {"add": {"/usr/bin/ls": ["ee" * 32]}}}, "")
+            assert isinstance(again.digests, policy_delta.OverlayDigestMap)
+            assert isinstance(updated.digests, policy_delta.OverlayDigestMap)
+            self.assertIs(again.digests.base, updated.digests.base)
+            self.assertEqual(again.get_digests("digests", "/usr/bin/ls"), frozenset([b"\xee" * 32]))
+
+            restored = pickle.loads(pickle.dumps(again))
+            self.assertEqual(digests_of(restored, "digests"), digests_of(again, "digests"))
+
+    def test_policy_cache(self):
+        cache = RuntimePolicyCache()
+        delta = json.dumps({**DELTA, "base_checksum": "base"})
+        self.assertIsNone(cache.apply_delta("updated", delta))
+
+        base = cache.get(make_policy(), "base")
+        updated = cache.apply_delta("updated", delta)
+        assert updated is not None
+        self.assertIs(cache.lookup("updated"), updated)
+        self.assertEqual(updated.size, base.size + len(delta))
+        self.assertEqual(updated.get_digests("digests", "/usr/bin/cat"), frozenset([b"\xdd" * 32]))
+
+        self.assertIsNone(RuntimePolicyCache(keep_source=True).apply_delta("updated", delta))
+
+
+if __name__ == "__main__":
+    unittest.main()
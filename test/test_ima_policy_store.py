@@ -0,0 +1,113 @@
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from keylime.ima import ima
+from keylime.ima.entry_cache import ImaEntryCache
+from keylime.ima.policy_artifact import MappedDigestMap
+from keylime.ima.policy_cache import RuntimePolicyCache
+from keylime.ima.policy_store import RuntimePolicyStore
+
+ZMORE = "/usr/bin/zmore"
+ZMORE_DIGEST = "b8ae0b8dd04a5935cd8165aa2260cd11b658bd71629bdb52256a675a1f73907b"
+SIGNED = f"10 5d4d5141ccd5066d50dc3f21d79ba02fedc24256 ima-sig sha256:{ZMORE_DIGEST} {ZMORE} 030204531f402500483046022100fe24678d21083ead47660e1a2d553a592d777c478d1b0466de6ed484b54956b3022100cad3adb37f277bbb03544d6107751b4cd4f2289d8353fa36257400a99334d5c3"
+
+
+def make_policy():
+    policy = ima.empty_policy()
+    policy["digests"] = {f"/usr/bin/{i}": [f"{i:02x}" * 32, "ff" * 32] for i in range(100)}
+    policy["digests"][ZMORE] = [ZMORE_DIGEST]
+    policy["digests"]["/usr/lib/café"] = ["aa" * 20]
+    policy["keyrings"] = {".ima": ["bb" * 32]}
+    policy["excludes"] = ["/tmp/"]
+    policy["ima"]["ignored_keyrings"] = [".ima"]
+    return json.dumps(policy)
+
+
+class TestRuntimePolicyStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.tmpdir.cleanup)
+        self.store = RuntimePolicyStore(os.path.join(self.tmpdir.name, "store"), min_size=0)
+        patcher = patch.object(ImaEntryCache, "instance", ImaEntryCache(100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mapped_policy(self):
+        compiled = self.store.get(make_policy(), "checksum")
+        assert compiled is not None
+        self.assertIsInstance(compiled.digests, MappedDigestMap)
+        self.assertEqual(compiled.checksum, "checksum")
+        self.assertEqual(compiled.ignored_keyrings, frozenset([".ima"]))
+        assert compiled.exclude_matcher is not None
+        self.assertTrue(compiled.exclude_matcher.match("/tmp/file"))
+
+        self.assertEqual(len(compiled.digests), 102)
+        self.assertEqual(compiled.get_digests("digests", "/usr/bin/7"), frozenset([b"\x07" * 32, b"\xff" * 32]))
+        digests = compiled.get_digests("digests", "/usr/lib/café")
+        assert digests is not None
+        self.assertIn(b"\xaa" * 20, digests)
+        digests = compiled.get_digests("digests", "/usr/bin/7")
+        assert digests is not None
+        self.assertNotIn(b"\xab" * 32, digests)
+        self.assertIsNone(compiled.get_digests("digests", "/usr/bin/dd"))
+        self.assertEqual(compiled.get_digests("keyrings", ".ima"), frozenset([b"\xbb" * 32]))
+        self.assertIsNone(compiled.get_digests("ima-buf", ".ima"))
+
+        overlay = compiled.with_boot_aggregates({"sha256": ["cc" * 32]})
+        self.assertEqual(overlay.get_digests("digests", "boot_aggregate"), frozenset([b"\xcc" * 32]))
+
+        _, failure = ima.process_measurement_list(None, [SIGNED], compiled)
+        self.assertFalse(failure)
+
+        # The file is written once and mapped again by other processes
+        self.assertEqual(len(os.listdir(self.store.directory)), 1)
+        loaded = self.store.load("checksum")
+        assert loaded is not None
+        self.assertEqual(dict(loaded.digests), dict(compiled.digests))
+        self.assertIsNone(self.store.load("other"))
+
+    def test_pickle(self):
+        compiled = self.store.get(make_policy(), "checksum")
+        restored = pickle.loads(pickle.dumps(compiled))
+        self.assertIsInstance(restored.digests, MappedDigestMap)
+        self.assertEqual(restored.get_digests("digests", ZMORE), frozenset([bytes.fromhex(ZMORE_DIGEST)]))
+
+    def test_disabled(self):
+        self.assertIsNone(RuntimePolicyStore("").get(make_policy(), "checksum"))
+        self.assertIsNone(RuntimePolicyStore("").load("checksum"))
+
+        store = RuntimePolicyStore(self.store.directory, min_size=1024 * 1024)
+        self.assertIsNone(store.get(make_policy(), "checksum"))
+
+    def test_invalid_file(self):
+        os.makedirs(self.store.directory)
+        with open(self.store._filename("checksum"), "wb") as f:  # pylint: disable=protected-access
+            f.write(b"invalid")
+        self.assertIsNone(self.store.load("checksum"))
+
+        # The file is replaced by a valid one
+        self.assertIsNotNone(self.store.get(make_policy(), "checksum"))
+
+    def test_policy_cache(self):
+        cache = RuntimePolicyCache(store=self.store)
+        self.assertIsNone(cache.lookup("checksum"))
+
+        compiled = cache.get(make_policy(), "checksum")
+        self.assertIsInstance(compiled.digests, MappedDigestMap)
+
+        # Another process finds the policy in the store without the serialized policy
+        cache = RuntimePolicyCache(store=self.store)
+        compiled = cache.lookup("checksum")
+        assert compiled is not None
+        self.assertIn("checksum", cache)
+
+        cache = RuntimePolicyCache(keep_source=True, store=self.store)
+        self.assertIsNone(cache.lookup("checksum"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,10 +4,15 @@ import hashlib
 import os
 import unittest
 from typing import List, cast
+from unittest.mock import patch
+
+import jsonschema
+from cryptography.hazmat.primitives.asymmetric import ec
 
 from keylime import json
 from keylime.agentstates import AgentAttestState
 from keylime.ima import file_signatures, ima
+from keylime.ima.signature_cache import VerifiedSignatureCache
 from keylime.ima.types import RuntimePolicyType
 
 # BEGIN TEST DATA
@@ -84,9 +89,13 @@ SIGNATURES: str = (
 COMBINED: str = MEASUREMENTS + SIGNATURES
 
 # Malformatted signature with bad size indicator
-BAD_SIGNATURES: str = "10 5d4d5141ccd5066d50dc3f21d79ba02fedc24256 ima-sig sha256:b8ae0b8dd04a5935cd8165aa2260cd11b658bd71629bdb52256a675a1f73907b /usr/bin/zmore 030204531f402548003046022100fe24678d21083ead47660e1a2d553a592d777c478d1b0466de6ed484b54956b3022100cad3adb37f277bbb03544d6107751b4cd4f2289d8353fa36257400a99334d5c3\n"
+BAD_SIGNATURES: str = (
+    "10 5d4d5141ccd5066d50dc3f21d79ba02fedc24256 ima-sig sha256:b8ae0b8dd04a5935cd8165aa2260cd11b658bd71629bdb52256a675a1f73907b /usr/bin/zmore 030204531f402548003046022100fe24678d21083ead47660e1a2d553a592d777c478d1b0466de6ed484b54956b3022100cad3adb37f277bbb03544d6107751b4cd4f2289d8353fa36257400a99334d5c3\n"
+)
 
-KEYRINGS: str = "10 978351440c6c8a17568f0c366b9ede28efd14f8c ima-buf sha256:a7d52aaa18c23d2d9bb2abb4308c0eeee67387a42259f4a6b1a42257065f3d5a .ima 308201d130820178a003020102020101300906072a8648ce3d0401301b3119301706035504030c1054657374696e672d45434453412d4341301e170d3231303631313133353831365a170d3232303631313133353831365a3021311f301d06035504030c1665636473612d63612d7369676e65642d65632d6b65793059301306072a8648ce3d020106082a8648ce3d030107034200044ce55be36765b59de2767f6d6721be8bea8e3db4ccc25ab76c30f5d1c11752ae1699cc39d31b378f69fecbe65ce1eb09e075f840fe4c052bafb9039742b76202a381a73081a430090603551d1304023000301d0603551d0e04160414b6fb3c083d19695be441c5f59afb95742cb6058c30560603551d23044f304d80140a51da379e45bd7ac623c3f765b53e1e2dde5195a11fa41d301b3119301706035504030c1054657374696e672d45434453412d434182142bb351b0d645e4d8594316ac3c96fc6d9c83791530130603551d25040c300a06082b06010505070302300b0603551d0f040403020780300906072a8648ce3d04010348003045022033d47b623c9feefab7d6e68b001ac6463433f99b61ce7b951a32da065a5d17af022100f3d73e38070053aec63a941ed36ae0dcfa25ed9cd538c459732a7e782132a4ca"
+KEYRINGS: str = (
+    "10 978351440c6c8a17568f0c366b9ede28efd14f8c ima-buf sha256:a7d52aaa18c23d2d9bb2abb4308c0eeee67387a42259f4a6b1a42257065f3d5a .ima 308201d130820178a003020102020101300906072a8648ce3d0401301b3119301706035504030c1054657374696e672d45434453412d4341301e170d3231303631313133353831365a170d3232303631313133353831365a3021311f301d06035504030c1665636473612d63612d7369676e65642d65632d6b65793059301306072a8648ce3d020106082a8648ce3d030107034200044ce55be36765b59de2767f6d6721be8bea8e3db4ccc25ab76c30f5d1c11752ae1699cc39d31b378f69fecbe65ce1eb09e075f840fe4c052bafb9039742b76202a381a73081a430090603551d1304023000301d0603551d0e04160414b6fb3c083d19695be441c5f59afb95742cb6058c30560603551d23044f304d80140a51da379e45bd7ac623c3f765b53e1e2dde5195a11fa41d301b3119301706035504030c1054657374696e672d45434453412d434182142bb351b0d645e4d8594316ac3c96fc6d9c83791530130603551d25040c300a06082b06010505070302300b0603551d0f040403020780300906072a8648ce3d04010348003045022033d47b623c9feefab7d6e68b001ac6463433f99b61ce7b951a32da065a5d17af022100f3d73e38070053aec63a941ed36ae0dcfa25ed9cd538c459732a7e782132a4ca"
+)
 
 RUNTIME_POLICY_WITH_VERIFICATION_KEYS: RuntimePolicyType = {
     "meta": {"version": 1, "generator": 3, "timestamp": "2024-08-28 15:13:11.952478"},
@@ -99,9 +108,13 @@ RUNTIME_POLICY_WITH_VERIFICATION_KEYS: RuntimePolicyType = {
     "verification-keys": '{"pubkeys": ["MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA1cD7bW5tX5qIVgWskS5tzY+XpqWzcW6HFq5npj8dHFIWsAJJCUdoSU631hkyY8HP/RfXDPq/J4IeKvx35EVXj49t1Z1FTJBgUlEbkKvqm0rY6jo7PnJ6BsDRrauXtiEXVKNXcWXDk8ES+9v9Cz26BJYAr+5Xgm2aEyAbj8GhicxUZfsjDm8eJ7ZnQKuhF7jejG5dYAYxnBVu99bQJHI5Fsu3dAjGbys9v7ToNbonS+1bJXdHyEE0swhxBOPvvV6vx5CzRNw1Sou3rT19T4j8wpsFOyYXVcbbRVBAmBE2Qy2UHvojFqaJN/A9lztllyER1S5heGG6CxK3GoR6pkOXAQIDAQAB", "MFYwEAYHKoZIzj0CAQYFK4EEAAoDQgAEnNH3Y/xOTwRRd8D6hpodRLnVx71qDTLvJHouno7nU7JSzcXWN1PxK+HQEh1V7sMdwBER4KFKE635JTv6C+BRBg=="], "keyids": [4081397027, 1394556965]}',
 }
 
-IMA_KEYRING_STRING: str = '{"pubkeys": ["MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA1cD7bW5tX5qIVgWskS5tzY+XpqWzcW6HFq5npj8dHFIWsAJJCUdoSU631hkyY8HP/RfXDPq/J4IeKvx35EVXj49t1Z1FTJBgUlEbkKvqm0rY6jo7PnJ6BsDRrauXtiEXVKNXcWXDk8ES+9v9Cz26BJYAr+5Xgm2aEyAbj8GhicxUZfsjDm8eJ7ZnQKuhF7jejG5dYAYxnBVu99bQJHI5Fsu3dAjGbys9v7ToNbonS+1bJXdHyEE0swhxBOPvvV6vx5CzRNw1Sou3rT19T4j8wpsFOyYXVcbbRVBAmBE2Qy2UHvojFqaJN/A9lztllyER1S5heGG6CxK3GoR6pkOXAQIDAQAB", "MFYwEAYHKoZIzj0CAQYFK4EEAAoDQgAEnNH3Y/xOTwRRd8D6hpodRLnVx71qDTLvJHouno7nU7JSzcXWN1PxK+HQEh1V7sMdwBER4KFKE635JTv6C+BRBg=="], "keyids": [4081397027, 1394556965]}'
+IMA_KEYRING_STRING: str = (
+    '{"pubkeys": ["MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA1cD7bW5tX5qIVgWskS5tzY+XpqWzcW6HFq5npj8dHFIWsAJJCUdoSU631hkyY8HP/RfXDPq/J4IeKvx35EVXj49t1Z1FTJBgUlEbkKvqm0rY6jo7PnJ6BsDRrauXtiEXVKNXcWXDk8ES+9v9Cz26BJYAr+5Xgm2aEyAbj8GhicxUZfsjDm8eJ7ZnQKuhF7jejG5dYAYxnBVu99bQJHI5Fsu3dAjGbys9v7ToNbonS+1bJXdHyEE0swhxBOPvvV6vx5CzRNw1Sou3rT19T4j8wpsFOyYXVcbbRVBAmBE2Qy2UHvojFqaJN/A9lztllyER1S5heGG6CxK3GoR6pkOXAQIDAQAB", "MFYwEAYHKoZIzj0CAQYFK4EEAAoDQgAEnNH3Y/xOTwRRd8D6hpodRLnVx71qDTLvJHouno7nU7JSzcXWN1PxK+HQEh1V7sMdwBER4KFKE635JTv6C+BRBg=="], "keyids": [4081397027, 1394556965]}'
+)
 
-IMA_BAD_KEYRING_STRING: str = '{"pubkeys": ["MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA1cD7bW5tX5qIVgWskS5tzY+XpqWzcW6HFq5npj8dHFIWsAJJCUdoSU631hkyY8HP/RfXDPq/J4IeKvx35EVXj49t1Z1FTJBgUlEbkKvqm0rY6jo7PnJ6BsDRrauXtiEXVKNXcWXDk8ES+9v9Cz26BJYAr+5Xgm2aEyAbj8GhicxUZfsjDm8eJ7ZnQKuhF7jejG5dYAYxnBVu99bQJHI5Fsu3dAjGbys9v7ToNbonS+1bJXdHyEE0swhxBOPvvV6vx5CzRNw1Sou3rT19T4j8wpsFOyYXVcbbRVBAmBE2Qy2UHvojFqaJN/A9lztllyER1S5heGG6CxK3GoR6pkOXAQIDAQAB", "MFYwEAYHKoZIzj0CAQYFK4EEAAoDQgAEnNH3Y/xOTwRRd8D6hpodRLnVx71qDTLvJHouno7nU7JSzcXWN1PxK+HQEh1V7sMdwBER4KFKE635JTv6C+BRBg=="]}'
+IMA_BAD_KEYRING_STRING: str = (
+    '{"pubkeys": ["MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA1cD7bW5tX5qIVgWskS5tzY+XpqWzcW6HFq5npj8dHFIWsAJJCUdoSU631hkyY8HP/RfXDPq/J4IeKvx35EVXj49t1Z1FTJBgUlEbkKvqm0rY6jo7PnJ6BsDRrauXtiEXVKNXcWXDk8ES+9v9Cz26BJYAr+5Xgm2aEyAbj8GhicxUZfsjDm8eJ7ZnQKuhF7jejG5dYAYxnBVu99bQJHI5Fsu3dAjGbys9v7ToNbonS+1bJXdHyEE0swhxBOPvvV6vx5CzRNw1Sou3rT19T4j8wpsFOyYXVcbbRVBAmBE2Qy2UHvojFqaJN/A9lztllyER1S5heGG6CxK3GoR6pkOXAQIDAQAB", "MFYwEAYHKoZIzj0CAQYFK4EEAAoDQgAEnNH3Y/xOTwRRd8D6hpodRLnVx71qDTLvJHouno7nU7JSzcXWN1PxK+HQEh1V7sMdwBER4KFKE635JTv6C+BRBg=="]}'
+)
 
 # END TEST DATA
 
@@ -109,6 +122,12 @@ IMA_BAD_KEYRING_STRING: str = '{"pubkeys": ["MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMII
 class TestIMAVerification(unittest.TestCase):
     """Test the IMA measurement list verification"""
 
+    def setUp(self):
+        self.signature_cache = VerifiedSignatureCache()
+        patcher = patch.object(VerifiedSignatureCache, "instance", self.signature_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_measurment_verification(self):
         """Test IMA measurement list verification"""
         _measurements = MEASUREMENTS.splitlines()
@@ -181,6 +200,39 @@ class TestIMAVerification(unittest.TestCase):
         _, failure = ima.process_measurement_list(None, signatures[0:2], ima_keyrings=keyrings)
         self.assertTrue(not failure)
 
+    def test_signature_cache(self):
+        """Test that verified signatures are remembered per key"""
+        curdir = os.path.dirname(os.path.abspath(__file__))
+        keydir = os.path.join(curdir, "data", "ima_keys")
+        signatures = cast(List[str], SIGNATURES.splitlines())
+
+        keyrings = file_signatures.ImaKeyrings()
+        tenant_keyring = file_signatures.ImaKeyring()
+        keyrings.set_tenant_keyring(tenant_keyring)
+        for keyfile in ["rsa2048pub.pem", "secp256k1.pem"]:
+            pubkey, keyidv2 = file_signatures.get_pubkey_from_file(os.path.join(keydir, keyfile))
+            assert pubkey is not None
+            tenant_keyring.add_pubkey(pubkey, keyidv2)
+
+        _, failure = ima.process_measurement_list(None, signatures, ima_keyrings=keyrings)
+        self.assertTrue(not failure)
+        self.assertEqual(len(self.signature_cache), 2)
+
+        with patch.object(file_signatures.ImaKeyrings, "_verify") as verify:
+            _, failure = ima.process_measurement_list(None, signatures, ima_keyrings=keyrings)
+            self.assertTrue(not failure)
+            verify.assert_not_called()
+
+        # The signatures are not valid with another key, even with the same keyid
+        other_keyrings = file_signatures.ImaKeyrings()
+        other_keyring = file_signatures.ImaKeyring()
+        pubkey, _ = file_signatures.get_pubkey_from_file(os.path.join(keydir, "secp256k1.pem"))
+        assert pubkey is not None
+        other_keyring.add_pubkey(pubkey, next(iter(tenant_keyring.ringv2)))
+        other_keyrings.set_tenant_keyring(other_keyring)
+        _, failure = ima.process_measurement_list(None, signatures[0:1], ima_keyrings=other_keyrings)
+        self.assertTrue(failure)
+
     def test_ima_buf_verification(self):
         """The verification of ima-buf entries supporting keys loaded onto keyrings"""
         ima_keyrings = file_signatures.ImaKeyrings()
@@ -192,6 +244,16 @@ class TestIMAVerification(unittest.TestCase):
             is not None
         )
 
+    def test_iterate_measurement_list(self):
+        """Test that the lines of a measurement list are iterated like they are split"""
+        for text in ["", "\n", COMBINED, COMBINED.rstrip("\n"), "\n\n" + MEASUREMENTS + "\n"]:
+            self.assertEqual(list(ima.iterate_measurement_list(text)), text.split("\n"))
+
+        _, failure = ima.process_measurement_list(
+            AgentAttestState("1"), ima.iterate_measurement_list(MEASUREMENTS), RUNTIME_POLICY_TEST
+        )
+        self.assertTrue(not failure)
+
     def test_iterative_attestation(self):
         """Test that the resulting pcr value is as expected by subsequently feeding a measurement list.
         The AgentAtestState() will maintain the state of PCR 10.
@@ -494,6 +556,38 @@ class TestIMAVerification(unittest.TestCase):
             "Runtime policy sample hash is correct",
         )
 
+    def test_validate_runtime_policy(self) -> None:
+        """Test that runtime policies are validated with the same error messages as the full schema"""
+        valid_policy = ima.empty_policy()
+        valid_policy["digests"] = copy.deepcopy(RUNTIME_POLICY_TEST["digests"])
+        ima.validate_runtime_policy(valid_policy)
+
+        invalid_digests = [
+            "not a dict",
+            {"/usr/bin/dd": []},
+            {"/usr/bin/dd": "aa" * 32},
+            {"/usr/bin/dd": ["aa" * 32, "AA" * 32]},
+            {"/usr/bin/dd": ["aa" * 19]},
+            {"/usr/bin/dd": ["aa" * 65]},
+            {"/usr/bin/dd": [1]},
+            {"/usr/bin/cat": ["aa" * 32], "/usr/bin/dd": ["aa" * 32, None], "/usr/bin/ls": []},
+        ]
+        for section in ("digests", "keyrings", "ima-buf"):
+            for digests in invalid_digests:
+                runtime_policy = copy.deepcopy(valid_policy)
+                runtime_policy[section] = digests  # type: ignore[literal-required]
+                with self.assertRaises(jsonschema.ValidationError) as expected:
+                    jsonschema.validate(instance=runtime_policy, schema=ima.RUNTIME_POLICY_SCHEMA)
+                with self.assertRaises(ima.ImaValidationError) as context:
+                    ima.validate_runtime_policy(runtime_policy)
+                self.assertEqual(context.exception.message, str(expected.exception).split("\n", 1)[0])
+
+        runtime_policy = copy.deepcopy(valid_policy)
+        del runtime_policy["ima"]["log_hash_alg"]  # type: ignore[misc]
+        with self.assertRaises(ima.ImaValidationError) as context:
+            ima.validate_runtime_policy(runtime_policy)
+        self.assertEqual(context.exception.message, "'log_hash_alg' is a required property")
+
     def test_from_string_validates_json_schema(self) -> None:
         """Test if from_string validates JSON schema"""
 
@@ -508,3 +602,19 @@ class TestIMAVerification(unittest.TestCase):
 
         self.assertTrue("JSON from string is not a valid IMA Keyring" in str(context.output))
         self.assertIsNone(should_be_none)
+
+    def test_shared_keyring(self) -> None:
+        """Test that the shared tenant keyring is loaded once and not modified by an agent"""
+
+        keyring = file_signatures.get_shared_keyring(IMA_KEYRING_STRING)
+        assert keyring is not None
+        self.assertIs(file_signatures.get_shared_keyring(IMA_KEYRING_STRING), keyring)
+
+        ima_keyrings = file_signatures.ImaKeyrings()
+        ima_keyrings.set_tenant_keyring(keyring)
+        ima_keyrings.add_pubkey_to_keyring(ec.generate_private_key(ec.SECP256R1()).public_key(), "tenant_keyring")
+
+        self.assertEqual(keyring.to_string(), IMA_KEYRING_STRING)
+        tenant_keyring = ima_keyrings.get_tenant_keyring()
+        assert tenant_keyring is not None
+        self.assertEqual(len(tenant_keyring.ringv2), len(keyring.ringv2) + 1)
@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import patch
+
+from keylime.common.algorithms import Hash
+from keylime.failure import Component, Failure
+from keylime.mba.bootlog_cache import PARSED_SIZE_FACTOR, BootlogCache
+
+PARSED = ({"0": 1}, {"sha256": ["aa" * 32]}, {"events": []}, Failure(Component.MEASURED_BOOT))
+
+
+def failed_evaluation():
+    failure = Failure(Component.MEASURED_BOOT)
+    failure.add_event("policy_example", "Boot attestation failed", True)
+    return failure
+
+
+@patch("keylime.mba.mba.bootlog_evaluate", side_effect=lambda *_: failed_evaluation())
+@patch("keylime.mba.mba.bootlog_parse", return_value=PARSED)
+class TestBootlogCache(unittest.TestCase):
+    def test_parse(self, bootlog_parse, _):
+        cache = BootlogCache()
+
+        self.assertIs(cache.parse("bG9nMQ==", Hash.SHA256), PARSED)
+        self.assertIs(cache.parse("bG9nMQ==", Hash.SHA256), PARSED)
+        self.assertEqual(bootlog_parse.call_count, 1)
+
+        cache.parse("bG9nMQ==", Hash.SHA1)
+        cache.parse("bG9nMg==", Hash.SHA256)
+        self.assertEqual(bootlog_parse.call_count, 3)
+        self.assertEqual(len(cache), 3)
+
+        # Missing logs are never cached
+        cache.parse(None, Hash.SHA256)
+        self.assertEqual(len(cache), 3)
+
+    def test_eviction(self, bootlog_parse, _):
+        # Room for two of the logs
+        cache = BootlogCache(max_size=2 * len("bG9nMQ==") * PARSED_SIZE_FACTOR)
+        cache.parse("bG9nMQ==", Hash.SHA256)
+        cache.parse("bG9nMg==", Hash.SHA256)
+        cache.parse("bG9nMQ==", Hash.SHA256)
+        cache.parse("bG9nMw==", Hash.SHA256)
+        self.assertEqual(len(cache), 2)
+
+        # "bG9nMg==" was the least recently used log
+        cache.parse("bG9nMQ==", Hash.SHA256)
+        cache.parse("bG9nMg==", Hash.SHA256)
+        self.assertEqual(bootlog_parse.call_count, 4)
+
+        # Logs larger than the whole budget are not cached
+        cache.parse("bG9nMTIzNDU2Nzg5MA==", Hash.SHA256)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.size, cache.max_size)
+
+    def test_disabled(self, bootlog_parse, _):
+        cache = BootlogCache(max_size=0)
+        cache.parse("bG9nMQ==", Hash.SHA256)
+        cache.parse("bG9nMQ==", Hash.SHA256)
+        self.assertEqual(bootlog_parse.call_count, 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_get_instance(self, *_):
+        with patch.object(BootlogCache, "instance", None), patch("keylime.config.getint", return_value=0) as getint:
+            # An empty cache is still the singleton
+            self.assertIs(BootlogCache.get_instance(), BootlogCache.get_instance())
+            self.assertEqual(getint.call_count, 1)
+
+    def test_evaluate(self, _, bootlog_evaluate):
+        cache = BootlogCache()
+        _, _, data, _ = cache.parse("bG9nMQ==", Hash.SHA256)
+
+        first = cache.evaluate("bG9nMQ==", Hash.SHA256, '{"a": 1}', data, {0, 1, 7}, "agent1")
+        second = cache.evaluate("bG9nMQ==", Hash.SHA256, '{"a": 1}', data, {0, 1, 7}, "agent2")
+        self.assertTrue(first)
+        self.assertIs(first, second)
+        self.assertEqual(bootlog_evaluate.call_count, 1)
+
+        # A different reference state or set of PCRs in the quote is evaluated again
+        cache.evaluate("bG9nMQ==", Hash.SHA256, '{"a": 2}', data, {0, 1, 7}, "agent1")
+        cache.evaluate("bG9nMQ==", Hash.SHA256, '{"a": 1}', data, {0, 1}, "agent1")
+        self.assertEqual(bootlog_evaluate.call_count, 3)
+
+        # Logs that were not parsed through the cache are not cached
+        cache.evaluate("bG9nMg==", Hash.SHA256, '{"a": 1}', data, {0, 1, 7}, "agent1")
+        cache.evaluate("bG9nMg==", Hash.SHA256, '{"a": 1}', data, {0, 1, 7}, "agent1")
+        self.assertEqual(bootlog_evaluate.call_count, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
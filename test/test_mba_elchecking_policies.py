@@ -0,0 +1,71 @@
+import argparse
+import io
+import json
+import os
+import unittest
+
+from keylime.mba.elchecking import example  # pylint: disable=unused-import # noqa: F401
+from keylime.mba.elchecking import policies, tests
+from keylime.mba.elparsing import tcg_elparser
+from keylime.policy import create_mb_policy
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "data", "create-mb-policy"))
+
+
+class TestCompiledPolicies(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(DATA_DIR, "binary_bios_measurements-secureboot"), "rb") as f:
+            args = argparse.Namespace(eventlog_file=f, without_secureboot=False, output=io.StringIO())
+            refstate = create_mb_policy.create_mb_refstate(args)
+        with open(os.path.join(DATA_DIR, "binary_bios_measurements-secureboot"), "rb") as f:
+            _, cls.eventlog = tcg_elparser.parse_binary_bootlog(f.read())
+        cls.refstate_str = json.dumps(refstate)
+
+    def test_compile_once(self):
+        compiled = policies.compile_refstate("example", self.refstate_str)
+        self.assertIs(policies.compile_refstate("example", self.refstate_str), compiled)
+        self.assertIsNot(policies.compile_refstate("accept-all", self.refstate_str), compiled)
+
+        # The compiled test can be evaluated repeatedly, OnceTest state is not kept between evaluations
+        self.assertEqual(compiled.evaluate(self.eventlog), "")
+        self.assertEqual(compiled.evaluate(self.eventlog), "")
+        self.assertEqual(policies.evaluate("example", json.loads(self.refstate_str), self.eventlog), "")
+
+    def test_reject(self):
+        refstate = json.loads(self.refstate_str)
+        refstate["pk"] = []
+        compiled = policies.compile_refstate("example", json.dumps(refstate))
+        self.assertNotEqual(compiled.evaluate(self.eventlog), "")
+
+    def test_invalid_refstate(self):
+        compiled = policies.compile_refstate("example", json.dumps({"pk": "not a list"}))
+        self.assertTrue(compiled.evaluate(self.eventlog).startswith("policy evaluation failed:"))
+
+        compiled = policies.compile_refstate("example", "{}")
+        self.assertIsNone(compiled.refstate)
+        self.assertEqual(compiled.evaluate(self.eventlog), "")
+
+        self.assertRaises(Exception, policies.compile_refstate, "example", "not json")
+        self.assertRaises(Exception, policies.compile_refstate, "no-such-policy", self.refstate_str)
+
+    def test_register(self):
+        class Custom(policies.Policy):
+            def get_relevant_pcrs(self):
+                return frozenset()
+
+            def refstate_to_test(self, refstate):
+                return tests.RejectAll("custom")
+
+        policies.register("test-custom", policies.AcceptAll())
+        compiled = policies.compile_refstate("test-custom", self.refstate_str)
+        self.assertEqual(compiled.evaluate(self.eventlog), "")
+
+        # Registering a policy again drops its compiled tests
+        policies.register("test-custom", Custom())
+        self.assertIsNot(policies.compile_refstate("test-custom", self.refstate_str), compiled)
+        self.assertEqual(policies.compile_refstate("test-custom", self.refstate_str).evaluate(self.eventlog), "custom")
+
+
+if __name__ == "__main__":
+    unittest.main()
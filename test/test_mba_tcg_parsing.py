@@ -0,0 +1,175 @@
+import hashlib
+import os
+import struct
+import unittest
+import uuid
+from typing import Any, Dict, List, cast
+
+from keylime.mba.elparsing import tcg_elparser
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
+EFI_GLOBAL_VARIABLE = "8be4df61-93ca-11d2-aa0d-00e098032b8c"
+
+
+def spec_id_event(algs):
+    body = tcg_elparser.SPEC_ID_EVENT03_SIGNATURE
+    body += struct.pack("<IBBBBI", 0, 0, 2, 0, 2, len(algs))
+    for alg_id, size in algs:
+        body += struct.pack("<HH", alg_id, size)
+    body += b"\0"
+    return struct.pack("<II", 0, 0x3) + bytes(20) + struct.pack("<I", len(body)) + body
+
+
+def event(pcr, event_type, data, algs=((0x000B, "sha256"),)):
+    out = struct.pack("<III", pcr, event_type, len(algs))
+    for alg_id, name in algs:
+        out += struct.pack("<H", alg_id) + hashlib.new(name, data).digest()
+    return out + struct.pack("<I", len(data)) + data
+
+
+def efi_variable(guid, name, data):
+    name_bin = name.encode("utf-16-le")
+    return uuid.UUID(guid).bytes_le + struct.pack("<QQ", len(name), len(data)) + name_bin + data
+
+
+class TestTCGEventLogParser(unittest.TestCase):
+    def test_replay(self):
+        log_bin = spec_id_event([(0x000B, 32)])
+        log_bin += event(0, 0x8, "1.0".encode("utf-16-le"))
+        log_bin += event(7, 0x80000001, efi_variable(EFI_GLOBAL_VARIABLE, "SecureBoot", b"\x01"))
+        log_bin += event(4, 0x80000007, b"Calling EFI Application from Boot Option")
+        log_bin += event(8, 0xD, b"grub_cmd: linux /vmlinuz\0")
+        # Trailing zeroes after the last event are ignored
+        log_bin += bytes(64)
+
+        failure, log = tcg_elparser.parse_binary_bootlog(log_bin)
+        self.assertFalse(failure)
+        assert log is not None
+
+        events = log["events"]
+        self.assertEqual(len(events), 5)
+        self.assertEqual(events[1]["EventType"], "EV_S_CRTM_VERSION")
+        self.assertEqual(events[1]["Event"], {"String": "1.0"})
+        self.assertEqual(events[2]["Event"]["UnicodeName"], "SecureBoot")
+        self.assertEqual(events[2]["Event"]["VariableData"], {"Enabled": "Yes"})
+        self.assertEqual(events[3]["Event"], "Calling EFI Application from Boot Option")
+        self.assertEqual(events[4]["Event"], {"String": "grub_cmd: linux /vmlinuz"})
+
+        digest = events[4]["Digests"][0]["Digest"]
+        pcr8 = hashlib.sha256(bytes(32) + bytes.fromhex(digest)).digest()
+        self.assertEqual(log["pcrs"]["sha256"]["8"], int.from_bytes(pcr8, "big"))
+        self.assertEqual(sorted(log["pcrs"]["sha256"].keys()), ["0", "4", "7", "8"])
+        # Not all of the PCRs 0-7 were extended, so there are no boot aggregates
+        self.assertEqual(log["boot_aggregates"], {"sha256": []})
+
+    def test_large_log(self):
+        log_bin = spec_id_event([(0x000B, 32)])
+        # EV_PREBOOT_CERT events start with the same PCR index and event type as the padding
+        log_bin += event(0, 0x0, b"certificate")
+        log_bin += b"".join(event(8, 0xD, f"grub_cmd: echo {i}\0".encode()) for i in range(20000))
+        log_bin += bytes(4096)
+
+        failure, log = tcg_elparser.parse_binary_bootlog(log_bin)
+        self.assertFalse(failure)
+        assert log is not None
+        events = log["events"]
+        self.assertEqual(len(events), 20002)
+        self.assertEqual(events[1]["EventType"], "EV_PREBOOT_CERT")
+        self.assertEqual(events[-1]["Event"], {"String": "grub_cmd: echo 19999"})
+
+    def test_startup_locality(self):
+        log_bin = spec_id_event([(0x000B, 32)])
+        log_bin += event(0, 0x3, tcg_elparser.STARTUP_LOCALITY_SIGNATURE + b"\x03")
+        log_bin += event(0, 0x80000008, struct.pack("<QQ", 0x820000, 0xE0000))
+
+        _, log = tcg_elparser.parse_binary_bootlog(log_bin)
+        assert log is not None
+        self.assertEqual(log["events"][1]["Event"], {"StartupLocality": 3})
+        self.assertEqual(log["events"][2]["Event"], {"BlobBase": 0x820000, "BlobLength": 0xE0000})
+
+        digest = hashlib.sha256(struct.pack("<QQ", 0x820000, 0xE0000)).digest()
+        pcr0 = hashlib.sha256(bytes(31) + b"\x03" + digest).digest()
+        self.assertEqual(log["pcrs"]["sha256"]["0"], int.from_bytes(pcr0, "big"))
+
+    def test_signature_list(self):
+        owner = "77fa9abd-0359-4d32-bd60-28f4e78f784b"
+        cert = b"\x30\x82" + bytes(30)
+        signature_list = uuid.UUID("a5c059a1-94e4-4aa7-87b5-ab155c2bf072").bytes_le
+        signature_list += struct.pack("<III", 28 + 16 + len(cert), 0, 16 + len(cert))
+        signature_list += uuid.UUID(owner).bytes_le + cert
+
+        log_bin = spec_id_event([(0x000B, 32)])
+        log_bin += event(7, 0x80000001, efi_variable("d719b2cb-3d3a-4596-a3bc-dad00e67656f", "db", signature_list))
+
+        _, log = tcg_elparser.parse_binary_bootlog(log_bin)
+        assert log is not None
+        variable_data = log["events"][1]["Event"]["VariableData"]
+        self.assertEqual(len(variable_data), 1)
+        self.assertEqual(variable_data[0]["SignatureType"], "a5c059a1-94e4-4aa7-87b5-ab155c2bf072")
+        self.assertEqual(variable_data[0]["Keys"], [{"SignatureOwner": owner, "SignatureData": cert.hex()}])
+
+    def test_device_path(self):
+        fv = uuid.UUID("8fc151ae-c96f-4bc9-8c33-107992c7735b")
+        ffs = uuid.UUID("821aca26-29ea-4993-839f-597fc021708d")
+        device_path = struct.pack("<BBH", 4, 7, 20) + fv.bytes_le
+        device_path += struct.pack("<BBH", 4, 6, 20) + ffs.bytes_le
+        device_path += struct.pack("<BBH", 0x7F, 0xFF, 4)
+        self.assertEqual(tcg_elparser.device_path_to_str(device_path), f"FvVol({fv})/FvFile({ffs})")
+
+        device_path = struct.pack("<BBHII", 2, 1, 12, 0x0A0341D0, 0)
+        device_path += struct.pack("<BBHBB", 1, 1, 6, 0, 2)
+        device_path += struct.pack("<BBH", 4, 4, 4 + 6) + "\\a\0".encode("utf-16-le")
+        device_path += struct.pack("<BBHB", 5, 1, 5, 0xAB)
+        self.assertEqual(tcg_elparser.device_path_to_str(device_path), "PciRoot(0x0)/Pci(0x2,0x0)/\\a/Path(5,1,ab)")
+
+    def test_invalid_logs(self):
+        failure, log = tcg_elparser.parse_binary_bootlog(b"")
+        self.assertTrue(failure)
+        self.assertIsNone(log)
+
+        # TCG 1.2 logs are not supported
+        failure, log = tcg_elparser.parse_binary_bootlog(struct.pack("<II", 0, 0x8) + bytes(24))
+        self.assertTrue(failure)
+
+        # Truncated event
+        log_bin = spec_id_event([(0x000B, 32)]) + event(8, 0xD, b"grub_cmd: linux /vmlinuz\0")
+        failure, log = tcg_elparser.parse_binary_bootlog(log_bin[:-4])
+        self.assertTrue(failure)
+        self.assertIsNone(log)
+
+        # Algorithm not announced in the Spec ID event
+        log_bin = spec_id_event([(0x000B, 32)]) + event(8, 0xD, b"a", algs=((0x0004, "sha1"),))
+        failure, log = tcg_elparser.parse_binary_bootlog(log_bin)
+        self.assertTrue(failure)
+
+    def test_bootlog_parse(self):
+        with open(os.path.join(DATA_DIR, "mb_log.b64"), encoding="utf-8") as f:
+            b64 = "".join(f.read().splitlines())
+
+        pcr_hashes, boot_aggregates, log, failure = tcg_elparser.bootlog_parse(b64, "sha256")
+        self.assertFalse(failure)
+        assert boot_aggregates is not None
+        self.assertEqual(len(boot_aggregates["sha256"]), 2)
+        self.assertIn("14", pcr_hashes)
+        events = cast(List[Dict[str, Any]], log["events"])
+        self.assertEqual(events[0]["SpecID"][0]["Signature"], "Spec ID Event03")
+
+        _, _, _, failure = tcg_elparser.bootlog_parse("not base64!", "sha256")
+        self.assertTrue(failure)
+
+    def test_binary_bios_measurements(self):
+        with open(os.path.join(DATA_DIR, "create-mb-policy", "binary_bios_measurements"), "rb") as f:
+            failure, log = tcg_elparser.parse_binary_bootlog(f.read())
+        self.assertFalse(failure)
+        assert log is not None
+        self.assertEqual(sorted(log["pcrs"].keys()), ["sha1", "sha256"])
+        self.assertEqual(len(log["boot_aggregates"]["sha1"]), 2)
+
+        with open(os.path.join(DATA_DIR, "create-mb-policy", "binary_bios_measurements-bogus"), "rb") as f:
+            failure, log = tcg_elparser.parse_binary_bootlog(f.read())
+        self.assertTrue(failure)
+        self.assertIsNone(log)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -170,7 +170,9 @@ class TestWebhookNotificationTimeout(unittest.TestCase):
             return fallback
 
         mock_getfloat.side_effect = getfloat_side_effect
-        mock_get.return_value = "http://test.webhook.com"
+        mock_get.side_effect = lambda _section, option, **kwargs: (
+            "http://test.webhook.com" if option == "webhook_url" else kwargs.get("fallback")
+        )
         mock_getint.return_value = 3
         mock_getboolean.return_value = True
         mock_tls_options.return_value = (("cert", "key", "ca", None), True)
@@ -206,7 +208,9 @@ class TestWebhookNotificationTimeout(unittest.TestCase):
 
         # Mock configuration
         mock_getfloat.side_effect = lambda section, option, fallback=None: 35.0 if option == "request_timeout" else 1.0
-        mock_get.return_value = "http://test.webhook.com"
+        mock_get.side_effect = lambda _section, option, **kwargs: (
+            "http://test.webhook.com" if option == "webhook_url" else kwargs.get("fallback")
+        )
         mock_getint.return_value = 3
         mock_getboolean.return_value = True
         mock_tls_options.return_value = (("cert", "key", "ca", None), True)
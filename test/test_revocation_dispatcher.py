@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from keylime import web_util
+from keylime.revocation_dispatcher import RevocationDispatcher
+
+
+class TestRevocationDispatcher(unittest.TestCase):
+    def test_dispatch(self):
+        running = []
+        max_running = []
+
+        async def send(recipient, client):
+            self.assertIs(client, dispatcher.client)
+            running.append(1)
+            max_running.append(len(running))
+            await asyncio.sleep(1 if recipient["agent_id"] == "slow" else 0.01)
+            running.pop()
+            if recipient["agent_id"] == "error":
+                raise ConnectionError("unreachable")
+            return recipient["agent_id"] != "failed"
+
+        recipients = [{"agent_id": str(i)} for i in range(7)]
+        recipients += [{"agent_id": "slow"}, {"agent_id": "failed"}, {"agent_id": "error"}]
+
+        dispatcher = RevocationDispatcher(concurrency=3)
+        stats = asyncio.run(dispatcher.dispatch(recipients, send, timeout=0.1))
+
+        self.assertEqual(stats["recipients"], 10)
+        self.assertEqual(stats["succeeded"], 7)
+        self.assertEqual(stats["failed"], 2)
+        self.assertEqual(stats["timed_out"], 1)
+        self.assertLess(stats["elapsed"], 1)
+        self.assertEqual(max(max_running), 3)
+
+        self.assertEqual(asyncio.run(dispatcher.dispatch([], send, timeout=0.1))["recipients"], 0)
+
+    def test_tls_context(self):
+        dispatcher = RevocationDispatcher(tls_cache_size=2)
+        with patch.object(
+            web_util, "generate_agent_tls_context", side_effect=lambda _, cert, **__: f"ctx-{cert}"
+        ) as gen:
+            self.assertIsNone(dispatcher.tls_context(None))
+            self.assertIsNone(dispatcher.tls_context("disabled"))
+            for cert in ["a", "b", "a", "c", "a", "b"]:
+                self.assertEqual(dispatcher.tls_context(cert), f"ctx-{cert}")
+
+        # "b" was evicted by "c"
+        self.assertEqual([call[0][1] for call in gen.call_args_list], ["a", "b", "c", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+import zmq
+
+from keylime import revocation_notifier
+
+
+class FakeClient:
+    """RequestsClient answering with the given status codes, or raising the given exceptions"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = []
+        self.instances = 0
+        self.done = threading.Event()
+
+    def __call__(self, *args, **kwargs):
+        self.instances += 1
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def post(self, _url, json=None, **_kwargs):  # pylint: disable=redefined-outer-name
+        self.posts.append(json)
+        response = self.responses.pop(0) if self.responses else 200
+        if not self.responses:
+            self.done.set()
+        if isinstance(response, Exception):
+            raise response
+        return MagicMock(status_code=response)
+
+
+def make_manager(batch_size=1, queue_size=100, outbox_dir="", worker_id=0, num_workers=1):
+    options = {
+        "webhook_url": "http://webhook.example.com",
+        "request_timeout": 1.0,
+        "retry_interval": 0.05,
+        "exponential_backoff": False,
+        "max_retries": 3,
+        "webhook_batch_size": batch_size,
+        "webhook_queue_size": queue_size,
+        "webhook_outbox_dir": outbox_dir,
+    }
+    with patch("keylime.config.get", side_effect=lambda _s, option, **_: options[option]), patch(
+        "keylime.config.getfloat", side_effect=lambda _s, option, **_: options[option]
+    ), patch("keylime.config.getint", side_effect=lambda _s, option, **_: options[option]), patch(
+        "keylime.config.getboolean", side_effect=lambda _s, option, **_: options[option]
+    ), patch(
+        "keylime.web_util.get_tls_options", return_value=((None, None, None, None), False)
+    ), patch(
+        "keylime.web_util.generate_tls_context", return_value=None
+    ):
+        return revocation_notifier.WebhookNotificationManager(worker_id, num_workers)
+
+
+class TestWebhookNotificationManager(unittest.TestCase):
+    def test_retry(self):
+        client = FakeClient([500, requests.exceptions.ConnectionError("refused"), 200, 202])
+        manager = make_manager()
+        with patch.object(revocation_notifier, "RequestsClient", client), patch("threading.Thread.start"):
+            manager.notify_webhook({"event": 1})
+            manager.notify_webhook({"event": 2})
+
+        # Run the worker in this thread until the queue is empty
+        # pylint: disable=protected-access
+        manager._shutdown_event.set()
+        assert manager._worker is not None
+        with patch.object(revocation_notifier, "RequestsClient", client):
+            manager._worker.run()
+
+        # The second event is sent while the first one waits for its retry
+        self.assertEqual(client.posts, [{"event": 1}, {"event": 2}, {"event": 1}, {"event": 2}])
+        self.assertEqual(client.instances, 1)
+
+    def test_give_up(self):
+        client = FakeClient([500, 500, 500])
+        manager = make_manager()
+        with patch.object(revocation_notifier, "RequestsClient", client):
+            with self.assertLogs("keylime.revocation_notifier", level="ERROR"):
+                manager.notify_webhook({"event": 1})
+                self.assertTrue(client.done.wait(5))
+                manager.shutdown_workers()
+        self.assertEqual(client.posts, [{"event": 1}] * 3)
+
+    def test_batch(self):
+        client = FakeClient([200])
+        manager = make_manager(batch_size=10, queue_size=3)
+        with patch.object(revocation_notifier, "RequestsClient", client), patch("threading.Thread.start"):
+            for event in range(4):
+                manager.notify_webhook({"event": event})
+        # pylint: disable=protected-access
+        self.assertEqual(len(manager._queue), 3)
+
+        # Run the worker in this thread until the queue is empty
+        manager._shutdown_event.set()
+        assert manager._worker is not None
+        with patch.object(revocation_notifier, "RequestsClient", client):
+            manager._worker.run()
+        self.assertEqual(client.posts, [[{"event": 0}, {"event": 1}, {"event": 2}]])
+        self.assertIsNone(manager._worker)
+
+
+class TestZmqPublisher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.address = f"ipc://{os.path.join(self.tmpdir.name, 'broker.ipc')}"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_send(self):
+        # Notifications sent before the broker is up are queued until it connects
+        publisher = revocation_notifier.ZmqPublisher(self.address)
+        self.assertTrue(publisher.send({"event": 1}))
+
+        context = zmq.Context()
+        broker = context.socket(zmq.PULL)
+        broker.setsockopt(zmq.RCVTIMEO, 5000)
+        broker.bind(self.address)
+        self.assertTrue(publisher.send({"event": 2}))
+        self.assertEqual(broker.recv_string(), '{"event": 1}')
+        self.assertEqual(broker.recv_string(), '{"event": 2}')
+
+        publisher.close()
+        self.assertFalse(publisher.send({"event": 3}))
+        broker.close()
+        context.term()
+
+    def test_queue_full(self):
+        publisher = revocation_notifier.ZmqPublisher(self.address, queue_size=2)
+        with self.assertLogs("keylime.revocation_notifier", level="ERROR"):
+            sent = [publisher.send({"event": i}) for i in range(5)]
+        self.assertEqual(sent, [True, True, False, False, False])
+        publisher.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
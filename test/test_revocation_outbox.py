@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from test.test_revocation_notifier import FakeClient, make_manager
+from unittest.mock import patch
+
+from keylime import revocation_notifier
+from keylime.revocation_outbox import RevocationOutbox
+
+
+class TestRevocationOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.directory = os.path.join(self.tmpdir.name, "outbox")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def segments(self):
+        return [name for name in os.listdir(self.directory) if name.endswith(".log")]
+
+    def test_replay(self):
+        outbox = RevocationOutbox(self.directory)
+        ids = [outbox.append({"event": i}) for i in range(3)]
+        outbox.ack(ids[1])
+        outbox.close()
+
+        outbox = RevocationOutbox(self.directory)
+        self.assertEqual(outbox.unacknowledged(), [(ids[0], {"event": 0}), (ids[2], {"event": 2})])
+        # Ids are not reused after a restart
+        self.assertGreater(outbox.append({"event": 3}), ids[2])
+        outbox.close()
+        self.assertEqual(len(self.segments()), 1)
+
+    def test_partial_record(self):
+        outbox = RevocationOutbox(self.directory)
+        outbox.append({"event": 0})
+        outbox.sync()
+        assert outbox.file is not None
+        outbox.file.write('{"id": 2, "msg": {"ev')
+        outbox.close()
+
+        outbox = RevocationOutbox(self.directory)
+        self.assertEqual([msg for _, msg in outbox.unacknowledged()], [{"event": 0}])
+        outbox.close()
+
+    def test_compaction(self):
+        outbox = RevocationOutbox(self.directory, segment_size=1024)
+        for i in range(100):
+            outbox.ack(outbox.append({"event": i, "padding": "x" * 50}))
+        last = outbox.append({"event": 100})
+        outbox.sync()
+
+        self.assertEqual(len(self.segments()), 1)
+        with open(os.path.join(self.directory, self.segments()[0]), encoding="utf-8") as f:
+            self.assertLess(len(f.read()), 1024)
+        outbox.close()
+
+        outbox = RevocationOutbox(self.directory)
+        self.assertEqual(outbox.unacknowledged(), [(last, {"event": 100})])
+        outbox.close()
+
+    def test_webhook_redelivery(self):
+        # The webhook is down: the notification stays in the outbox
+        client = FakeClient([500, 500, 500])
+        manager = make_manager(outbox_dir=self.tmpdir.name)
+        with patch.object(revocation_notifier, "RequestsClient", client):
+            with self.assertLogs("keylime.revocation_notifier", level="ERROR"):
+                manager.notify_webhook({"event": 1})
+                self.assertTrue(client.done.wait(5))
+                manager.shutdown_workers()
+
+        # It is sent again by the next verifier, and acknowledged
+        client = FakeClient([200])
+        with patch.object(revocation_notifier, "RequestsClient", client):
+            manager = make_manager(outbox_dir=self.tmpdir.name)
+            self.assertTrue(client.done.wait(5))
+            manager.shutdown_workers()
+        self.assertEqual(client.posts, [{"event": 1}])
+        self.assertEqual(RevocationOutbox(os.path.join(self.tmpdir.name, "0")).unacknowledged(), [])
+
+    def test_adopt_outboxes(self):
+        for worker_id in range(3):
+            outbox = RevocationOutbox(os.path.join(self.tmpdir.name, str(worker_id)))
+            outbox.append({"worker": worker_id})
+            outbox.close()
+
+        # With two workers left, worker 0 takes over the notifications of worker 2
+        with patch("threading.Thread.start"):
+            manager = make_manager(outbox_dir=self.tmpdir.name, num_workers=2)
+        # pylint: disable=protected-access
+        self.assertEqual([msg for _, msg in manager._queue], [{"worker": 0}, {"worker": 2}])
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["0", "1"])
+        assert manager._outbox is not None
+        manager._outbox.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import base64
+import unittest
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from keylime import cloud_verifier_common, crypto
+from keylime.revocation_signer import RevocationSigner
+
+
+def pem_key():
+    key = crypto.rsa_generate(2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode("utf-8")
+
+
+class TestRevocationSigner(unittest.TestCase):
+    def test_cache(self):
+        signer = RevocationSigner(max_entries=2)
+        keys = [pem_key() for _ in range(3)]
+        with patch.object(crypto, "rsa_import_privkey", wraps=crypto.rsa_import_privkey) as import_privkey:
+            for i in [0, 1, 0, 2, 0, 1]:
+                signer.get_key(keys[i])
+            # keys[1] was evicted by keys[2]
+            self.assertEqual(
+                [call[0][0] for call in import_privkey.call_args_list], [keys[0], keys[1], keys[2], keys[1]]
+            )
+
+            signer.forget(keys[1])
+            signer.forget("")
+            self.assertEqual(len(signer), 1)
+            signer.get_key(keys[1])
+            self.assertEqual(import_privkey.call_count, 5)
+
+    def test_prepare_error(self):
+        key = pem_key()
+        agent = {
+            "ip": "127.0.0.1",
+            "agent_id": "agent",
+            "port": 9002,
+            "tpm_policy": "{}",
+            "meta_data": "{}",
+            "revocation_key": key,
+        }
+        with patch.object(RevocationSigner, "instance", RevocationSigner()):
+            for _ in range(2):
+                tosend = cloud_verifier_common.prepare_error(agent)
+                crypto.rsa_import_privkey(key).public_key().verify(
+                    base64.b64decode(tosend["signature"]),
+                    tosend["msg"],
+                    padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+                    hashes.SHA256(),
+                )
+            signer = RevocationSigner.instance
+            assert signer is not None
+            self.assertEqual(len(signer), 1)
+
+        agent["revocation_key"] = ""
+        self.assertEqual(cloud_verifier_common.prepare_error(agent)["signature"], b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,14 @@
 import unittest
+from unittest.mock import patch
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import joinedload
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import joinedload, load_only
 
 from keylime import json
+from keylime.db import shared_policies
 from keylime.db.keylime_db import SessionManager
 from keylime.db.verifier_db import VerfierMain, VerifierAllowlist, VerifierMbpolicy
+from keylime.mba import mba
 
 # BEGIN TEST DATA
 
@@ -271,3 +274,89 @@ class TestVerfierDB(unittest.TestCase):
             # Use setattr to avoid linter issues
             setattr(updated_agent, "port", original_port)
             session.add(updated_agent)
+
+    def test_13_mbpolicy_checksum_only(self):
+        mbpolicy = VerifierMbpolicy(**mba.mb_policy_db_contents("test-mbpolicy2", test_mbpolicy_data["mb_policy"]))
+        self.session.add(mbpolicy)
+        self.session.commit()
+        mbpolicy_id = mbpolicy.id
+        self.session.expunge_all()
+
+        stored = (
+            self.session.query(VerifierMbpolicy)
+            .options(load_only(VerifierMbpolicy.id, VerifierMbpolicy.checksum))
+            .filter_by(id=mbpolicy_id)
+            .one()
+        )
+        self.assertRegex(str(stored.checksum), "^[0-9a-f]{64}$")
+        # The policy body is only loaded when accessed
+        self.assertIn("mb_policy", inspect(stored).unloaded)
+        self.assertEqual(stored.mb_policy, test_mbpolicy_data["mb_policy"])
+
+        self.assertIsNone(mba.mb_policy_db_contents("empty", None)["checksum"])
+
+    def test_14_shared_policies(self):
+        contents = []
+
+        def db_contents(name):
+            contents.append(name)
+            return mba.mb_policy_db_contents(name, test_mbpolicy_data["mb_policy"])
+
+        checksum = mba.mb_policy_db_contents("", test_mbpolicy_data["mb_policy"])["checksum"]
+        shared = shared_policies.SharedPolicy(VerifierMbpolicy, checksum, db_contents)
+        ima_policy = self.session.query(VerifierAllowlist).one()
+        agent_ids = [f"{agent_id[:-1]}{i}" for i in range(1, 4)]
+        for shared_agent_id in agent_ids:
+            shared_policies.add_agent(self.session, {**test_data, "agent_id": shared_agent_id}, ima_policy, shared)
+
+        # The policy is stored once and referenced by all agents
+        name = shared_policies.shared_policy_name(checksum)
+        self.assertEqual(contents, [name])
+        mbpolicy = self.session.query(VerifierMbpolicy).filter_by(name=name).one()
+        mbpolicy_id = self.session.query(VerifierMbpolicy.id).filter_by(name=name).scalar()
+        self.assertEqual(len(mbpolicy.agents), 3)
+
+        # It is deleted after the last agent using it
+        for shared_agent_id in agent_ids:
+            self.session.query(VerfierMain).filter_by(agent_id=shared_agent_id).delete()
+            self.session.commit()
+            shared_policies.release_shared_policies(self.session, None, mbpolicy_id)
+            stored = self.session.query(VerifierMbpolicy).filter_by(name=name).one_or_none()
+            self.assertEqual(stored is None, shared_agent_id == agent_ids[-1])
+
+        # Named policies are kept
+        policy_ids = (
+            self.session.query(VerfierMain.ima_policy_id, VerfierMain.mb_policy_id).filter_by(agent_id=agent_id).one()
+        )
+        self.session.query(VerfierMain).filter_by(agent_id=agent_id).delete()
+        self.session.commit()
+        shared_policies.release_shared_policies(self.session, *policy_ids)
+        self.assertEqual(self.session.query(VerifierAllowlist).count(), 1)
+        self.assertEqual(self.session.query(VerifierMbpolicy).count(), 1)
+
+    def test_15_shared_policy_deleted_concurrently(self):
+        checksum = mba.mb_policy_db_contents("", test_mbpolicy_data["mb_policy"])["checksum"]
+        shared = shared_policies.SharedPolicy(
+            VerifierMbpolicy, checksum, lambda name: mba.mb_policy_db_contents(name, test_mbpolicy_data["mb_policy"])
+        )
+        ima_policy = self.session.query(VerifierAllowlist).one()
+        get_shared_policy = shared_policies.get_shared_policy
+        lookups = []
+
+        def get_and_release(session, *args):
+            policy = get_shared_policy(session, *args)
+            lookups.append(int(policy.id))
+            if len(lookups) == 1:
+                # The last agent using the policy is deleted before the agent is added
+                shared_policies.release_shared_policies(session, None, lookups[0])
+            return policy
+
+        new_agent_id = f"{agent_id[:-1]}9"
+        with patch.object(shared_policies, "get_shared_policy", side_effect=get_and_release):
+            shared_policies.add_agent(self.session, {**test_data, "agent_id": new_agent_id}, ima_policy, shared)
+
+        # The policy was stored again for the agent
+        self.assertEqual(len(lookups), 2)
+        agent = self.session.query(VerfierMain).filter_by(agent_id=new_agent_id).one()
+        self.assertEqual(agent.mb_policy_id, lookups[1])
+        self.assertEqual(agent.mb_policy.name, shared_policies.shared_policy_name(checksum))